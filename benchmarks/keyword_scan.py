@@ -0,0 +1,101 @@
+"""
+Microbenchmark of the keyword checks in the feature extractor: the previous
+per-pattern regex / str.count code against KeywordScanner, on the cached
+html in domain_feature_extractor/data. Also checks both give the same results.
+
+    python benchmarks/keyword_scan.py [--data_dir DIR] [--repeat N]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'domain_feature_extractor', 'src')
+sys.path.insert(0, SRC)
+
+from keyword_scanner import fold_case  # noqa: E402
+from beyondphish_features import (LOGIN_KEYWORDS, PAYMENT_KEYWORDS, SUSPICIOUS_EVENTS,  # noqa: E402
+                                  LOGIN_SCANNER, PAYMENT_SCANNER, EVENT_SCANNER, REDIRECT_SCANNER)
+from app import PARKED_PATTERNS, PARKED_SCANNER, SOCIAL_MEDIA_SCANNER  # noqa: E402
+
+PARKED_REGEX = '|'.join(PARKED_PATTERNS)
+SOCIAL_REGEX = [r'instagram\.com\/[a-zA-Z0-9_\-]+', r'facebook\.com\/[a-zA-Z0-9_\-]+', r'twitter\.com\/[a-zA-Z0-9_\-]+']
+
+
+# the code before KeywordScanner
+def old_parked(html):
+    return any(re.findall(PARKED_REGEX, html, re.IGNORECASE))
+
+
+def old_social(html):
+    out = []
+    for r in SOCIAL_REGEX:
+        found = re.findall(r, html)
+        out.append(found[0] if found else None)
+    return out
+
+
+def old_counts(lower_html, text):
+    redirect_count = len(re.findall(r"location\.href\s*=", lower_html)) + \
+                     len(re.findall(r"window\.location", lower_html)) + \
+                     len(re.findall(r"http-equiv=['\"]refresh['\"]", lower_html))
+    suspicious_events = sum(lower_html.count(evt + "=") for evt in SUSPICIOUS_EVENTS)
+    login_count = sum(text.count(kw) for kw in LOGIN_KEYWORDS)
+    payment_count = sum(text.count(kw) for kw in PAYMENT_KEYWORDS)
+    return [redirect_count, suspicious_events, login_count, payment_count]
+
+
+def new_parked(html, lower_html):
+    return PARKED_SCANNER.any(fold_case(html, lower_html))
+
+
+def new_social(html):
+    return SOCIAL_MEDIA_SCANNER.first(html)
+
+
+def new_counts(lower_html, text):
+    return [REDIRECT_SCANNER.total(lower_html), EVENT_SCANNER.total(lower_html),
+            LOGIN_SCANNER.total(text), PAYMENT_SCANNER.total(text)]
+
+
+def timed(fn, pages, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [fn(*p) for p in pages]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+
+def main(args):
+    pages = []
+    for name in sorted(os.listdir(args.data_dir)):
+        with open(os.path.join(args.data_dir, name), 'r', encoding='utf-8', errors='ignore') as fin:
+            html = fin.read()
+        # stands in for page.text, the counts only need some lowered text
+        pages.append((html, html.lower(), re.sub(r'<[^>]+>', ' ', html).lower()))
+    print(f"{len(pages)} pages , {sum(len(p[0]) for p in pages) / 1e6:.1f} MB of html")
+
+    checks = [
+        ('parked', lambda h, l, t: old_parked(h), lambda h, l, t: new_parked(h, l)),
+        ('social', lambda h, l, t: old_social(h), lambda h, l, t: new_social(h)),
+        ('counts', lambda h, l, t: old_counts(l, t), lambda h, l, t: new_counts(l, t)),
+    ]
+    ok = True
+    for name, old_fn, new_fn in checks:
+        old_time, old_results = timed(old_fn, pages, args.repeat)
+        new_time, new_results = timed(new_fn, pages, args.repeat)
+        same = old_results == new_results
+        ok = ok and same
+        print(f"{name:<8} old {old_time * 1000:8.1f} ms , new {new_time * 1000:8.1f} ms , "
+              f"x{old_time / max(new_time, 1e-9):.1f} , same results : {same}")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_dir', type=str, default=os.path.join(SRC, '..', 'data'))
+    parser.add_argument('--repeat', type=int, default=3)
+    sys.exit(main(parser.parse_args()))
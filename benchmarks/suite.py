@@ -0,0 +1,239 @@
+"""
+Benchmark suite of the hot per-page functions, run offline over the cached
+pages in domain_feature_extractor/data (a page store or <url>.html files).
+
+Each stage runs once per page per repeat. Per page latency is the median of
+the repeats; p50 / p95 are taken over pages, throughput is pages per second
+of the fastest full pass and peak memory is the python heap peak of one
+extra pass under tracemalloc. DNS and WHOIS are stubbed (a fixed record and
+an address derived from the domain), IP geolocation uses the bundled
+IP2Location database. Stages whose imports are missing here (torch,
+sentence_transformers, ...) are reported as skipped.
+
+    python benchmarks/suite.py [--output results.json] [--baseline old.json] [--stages a,b] [--repeat N]
+
+With --baseline the run is compared stage by stage and the exit code is 1
+when a stage got slower (p50, p95 or throughput) or used more memory by more
+than --tolerance.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SRC = os.path.join(ROOT, 'domain_feature_extractor', 'src')
+SHOP_SRC = os.path.join(ROOT, 'shop_classifier', 'src')
+sys.path.insert(0, SRC)
+sys.path.append(SHOP_SRC)
+
+from page_store import PageStore  # noqa: E402
+
+WHOIS_STUB = {'domain_name': 'stub', 'country': 'US', 'registrar': 'NameCheap, Inc.',
+              'creation_date': '2020-01-01 00:00:00', 'expiration_date': '2030-01-01'}
+
+
+def stub_ip(domain):
+    # stable public-looking address per domain, stands in for the dns lookup
+    h = int(hashlib.md5(domain.encode()).hexdigest(), 16)
+    return '%d.%d.%d.%d' % (8 + h % 200, (h >> 8) % 256, (h >> 16) % 256, 1 + (h >> 24) % 250)
+
+
+# every stage builder returns fn(url, html), an ImportError skips the stage
+
+def body_text_stage():
+    from app import extract_body_text
+    return lambda url, html: extract_body_text(html)
+
+
+def parked_stage():
+    from app import is_content_parked
+    return lambda url, html: is_content_parked(html)
+
+
+def convert_stage():
+    from app import convert_to_feature
+    from geo import get_geo_service
+    geo = get_geo_service()
+    return lambda url, html: convert_to_feature({url: WHOIS_STUB}, geo, html, url, stub_ip(url))
+
+
+def beyondphish_stage():
+    from beyondphish_features import extract_beyondphish_features
+    return lambda url, html: extract_beyondphish_features(html)
+
+
+def dataset_stage(method):
+    def build():
+        from bs4 import BeautifulSoup
+        from dataloader import ContentDataset
+        # the methods only need the tag list, skip loading the tokenizer in __init__
+        dataset = ContentDataset.__new__(ContentDataset)
+        dataset.tags = []
+        if method == 'walker':
+            return lambda url, html: dataset.walker(BeautifulSoup(html, 'html.parser'))
+        return lambda url, html: dataset.extract_txt(html)
+    return build
+
+
+def visible_text_stage():
+    # shop_classifier/src/app.py would shadow the extractor's app module, load it under another name
+    import importlib.util
+    spec = importlib.util.spec_from_file_location('shop_app', os.path.join(SHOP_SRC, 'app.py'))
+    shop_app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(shop_app)
+    return lambda url, html: shop_app.extract_visible_text(html)
+
+
+STAGES = {
+    'extract_body_text': body_text_stage,
+    'is_content_parked': parked_stage,
+    'convert_to_feature': convert_stage,
+    'extract_beyondphish_features': beyondphish_stage,
+    'dataset_walker': dataset_stage('walker'),
+    'dataset_extract_txt': dataset_stage('extract_txt'),
+    'extract_visible_text': visible_text_stage,
+}
+
+
+def load_pages(data_dir, limit=None):
+    store = PageStore(data_dir)
+    pages = []
+    for key in store.keys()[:limit]:
+        html = store.get(key)
+        if html:
+            pages.append((key, html))
+    store.close()
+    return pages
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def measure(fn, pages, repeat):
+    fn(*pages[0])  # warm up imports and lazy tables
+    latencies = [[] for _ in pages]
+    passes = []
+    for _ in range(repeat):
+        start_pass = time.perf_counter()
+        for i, (url, html) in enumerate(pages):
+            start = time.perf_counter()
+            fn(url, html)
+            latencies[i].append(time.perf_counter() - start)
+        passes.append(time.perf_counter() - start_pass)
+    per_page = [statistics.median(lat) for lat in latencies]
+
+    tracemalloc.start()
+    for url, html in pages:
+        fn(url, html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'pages': len(pages),
+        'pages_per_s': round(len(pages) / min(passes), 2),
+        'p50_ms': round(percentile(per_page, 0.5) * 1000, 3),
+        'p95_ms': round(percentile(per_page, 0.95) * 1000, 3),
+        'max_ms': round(max(per_page) * 1000, 3),
+        'peak_mb': round(peak / 1e6, 2),
+    }
+
+
+def run(args):
+    pages = load_pages(args.data_dir, args.limit)
+    if not pages:
+        sys.exit(f"no pages found in {args.data_dir}")
+    total_bytes = sum(len(html) for _, html in pages)
+    print(f"{len(pages)} pages , {total_bytes / 1e6:.1f} MB of html , repeat {args.repeat}")
+
+    from config import html_parser, bp_engine
+    results = {
+        'meta': {
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'pages': len(pages),
+            'html_bytes': total_bytes,
+            'repeat': args.repeat,
+            'html_parser': html_parser,
+            'bp_engine': bp_engine,
+        },
+        'stages': {},
+    }
+    names = args.stages.split(',') if args.stages else list(STAGES)
+    for name in names:
+        try:
+            fn = STAGES[name]()
+        except ImportError as e:
+            results['stages'][name] = {'skipped': str(e)}
+            print(f"{name:<30} skipped ({e})")
+            continue
+        r = measure(fn, pages, args.repeat)
+        results['stages'][name] = r
+        print(f"{name:<30} {r['pages_per_s']:9.1f} pages/s , p50 {r['p50_ms']:8.2f} ms , "
+              f"p95 {r['p95_ms']:8.2f} ms , peak {r['peak_mb']:7.1f} MB")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    '''prints the change of every stage against baseline, returns the regressed stages'''
+    regressed = []
+    print(f"\nagainst baseline of {baseline['meta'].get('created')} (tolerance {tolerance:.0%})")
+    for name, r in results['stages'].items():
+        base = baseline['stages'].get(name)
+        if 'skipped' in r or not base or 'skipped' in base:
+            continue
+        # higher is worse for latency and memory, lower is worse for throughput
+        changes = {
+            'p50': r['p50_ms'] / max(base['p50_ms'], 1e-9) - 1,
+            'p95': r['p95_ms'] / max(base['p95_ms'], 1e-9) - 1,
+            'throughput': base['pages_per_s'] / max(r['pages_per_s'], 1e-9) - 1,
+            'memory': r['peak_mb'] / max(base['peak_mb'], 1e-9) - 1,
+        }
+        worse = [k for k, v in changes.items() if v > tolerance]
+        if worse:
+            regressed.append(name)
+        print(f"{name:<30} p50 {changes['p50']:+7.1%} , p95 {changes['p95']:+7.1%} , "
+              f"time per page {changes['throughput']:+7.1%} , memory {changes['memory']:+7.1%}"
+              f"{'  REGRESSION : ' + ', '.join(worse) if worse else ''}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark the per-page hot paths over the cached pages')
+    parser.add_argument('--data_dir', type=str, default=os.path.join(ROOT, 'domain_feature_extractor', 'data'))
+    parser.add_argument('--output', type=str, help='save the results as json')
+    parser.add_argument('--baseline', type=str, help='results json of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown before a stage counts as regressed')
+    parser.add_argument('--stages', type=str, help=f"comma separated subset of {','.join(STAGES)}")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--limit', type=int, help='only the first N pages')
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fout:
+            json.dump(results, fout, indent=2)
+        print(f"results saved to {args.output}")
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as fin:
+            regressed = compare(results, json.load(fin), args.tolerance)
+        if regressed:
+            print(f"regressed : {', '.join(regressed)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
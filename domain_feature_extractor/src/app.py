@@ -9,62 +9,80 @@ python crawler_mp.py --num_procs 5 --input_file /home/ubuntu/new_drive/backupp/S
 
 
 import json
-import pickle
-import whois
-import re
 import pandas as pd
-import langid
 import argparse
 import urllib3
-import undetected_chromedriver as uc
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 from multiprocessing import Pool
+from multiprocessing.util import Finalize
 import os
+import signal
 from urllib.parse import urlsplit
-import IP2Location
-from bs4 import BeautifulSoup
-import socket
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 import time
-from selenium import webdriver
-from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
-#import undetected_chromedriver as uc
-from selenium import webdriver
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from beyondphish_features import extract_beyondphish_features
+from beyondphish_features import extract_beyondphish_features, page_structure
+from parsed_page import ParsedPage
+from geo import get_geo_service, init_worker
+from browser_pool import DriverPool
+from page_wait import PageWaiter
+from fetcher import NOT_FETCHED, StaticFetcher, TieredFetcher, tier_report
+from whois_cache import WhoisCache, whois_report
+from resolver import Resolver, get_resolver, dns_report
+from scheduler import Scheduler, straggler_report
+from checkpoint import ResultWriter
+from page_store import PageStore
+from keyword_scanner import KeywordScanner, fold_case
+from language import LanguageGate, get_identifier, language_report
+from feature_cache import FeatureCache, feature_cache_report
+import metrics
+from metrics import Metrics, MetricsWriter, metrics_report
+from template_index import TemplateIndex, template_report
+from seen_index import SeenIndex, seen_report
+from work_queue import open_work_queue, lease_batches, queue_report, worker_id
 
 
 from config import *
 
-def is_content_parked(content):
-    return any(re.findall(r'buy this domain|parked free|godaddy|is for sale'
-                          r'|domain parking|renew now|this domain|namecheap|buy now for'
-                          r'|hugedomains|is owned and listed by|sav.com|searchvity.com'
-                          r'|domain for sale|register4less|aplus.net|related searches'
-                          r'|be the first to know when we launch|get notified when we open our online store'
-                          r'|related links|search ads|domain expert|united domains'
-                          r'|domian name has been registered|this domain may be for sale'
-                          r'|domain name is available for sale|premium domain'
-                          r'|registrar placeholder|under construction|coming soon'
-                          r'|this domain name|this domain has expired|domainpage.io'
-                          r'|sedoparking.com|parking-lander'
-                          r'|create your website'
-                          r'|something really good is coming very soon'
-                          r'|this domain is available on auction'
-                          r'|opening soon'
-                          r'|this page isn\'t working'
-                          r'|sorry, you have been blocked'
-                          r'|you are unable to access'
-                          r'|this content isn\'t available right now'
-                          r'|redirected you too many times', content, re.IGNORECASE))
-
-def filter_lang(text, selected_langs):
-    language, _ = langid.classify(text)
-    if language in selected_langs:
-        return True
-    return False
+PARKED_PATTERNS = [
+    'buy this domain', 'parked free', 'godaddy', 'is for sale',
+    'domain parking', 'renew now', 'this domain', 'namecheap', 'buy now for',
+    'hugedomains', 'is owned and listed by', 'sav.com', 'searchvity.com',
+    'domain for sale', 'register4less', 'aplus.net', 'related searches',
+    'be the first to know when we launch', 'get notified when we open our online store',
+    'related links', 'search ads', 'domain expert', 'united domains',
+    'domian name has been registered', 'this domain may be for sale',
+    'domain name is available for sale', 'premium domain',
+    'registrar placeholder', 'under construction', 'coming soon',
+    'this domain name', 'this domain has expired', 'domainpage.io',
+    'sedoparking.com', 'parking-lander',
+    'create your website',
+    'something really good is coming very soon',
+    'this domain is available on auction',
+    'opening soon',
+    "this page isn't working",
+    'sorry, you have been blocked',
+    'you are unable to access',
+    "this content isn't available right now",
+    'redirected you too many times',
+]
+# case-insensitive match, the patterns run on case folded html ('.' is a regex wildcard)
+PARKED_SCANNER = KeywordScanner(PARKED_PATTERNS)
+
+SOCIAL_MEDIA_SCANNER = KeywordScanner([
+    r'instagram\.com\/[a-zA-Z0-9_\-]+',
+    r'facebook\.com\/[a-zA-Z0-9_\-]+',
+    r'twitter\.com\/[a-zA-Z0-9_\-]+',
+])
+
+
+def is_content_parked(page):
+    if isinstance(page, ParsedPage):
+        content = fold_case(page.html, page.lower_html)
+    else:
+        content = fold_case(page)
+    return PARKED_SCANNER.any(content)
 
 def normalize_url(url):
     prefixes = ['https://www.', 'http://www.', 'www.']
@@ -91,16 +109,15 @@ def check_url(url):
         return u.path
 
 def extract_body_text(page_source):
-    # Parse the page source using BeautifulSoup
-    soup = BeautifulSoup(page_source, 'html.parser')  # You can also use 'html.parser' instead of 'lxml'
-    
     # Extract the body text. If the body tag is not found, return an empty string
-    body_text = soup.body.get_text(separator=' ', strip=True) if soup.body else ''
-    
-    return body_text
+    return ParsedPage.wrap(page_source).body_text
   
-def convert_to_feature(icann_data, countries, html_string, url, data_file="IP2LOCATION-LITE-DB1.BIN"):
-    ip_location = IP2Location.IP2Location(data_file)
+def convert_to_feature(icann_data, geo, page, url, host_ip=None, bp_vector=None):
+    # host_ip is the already resolved address of url ('' if it failed), None resolves it here
+    # bp_vector is an already computed BeyondPhish vector of page (feature cache), None computes it
+    started = time.perf_counter()
+    page = ParsedPage.wrap(page)
+    html_string = page.html
     _url = check_url(url)
     u = normalize_url(_url)
     X = []
@@ -115,11 +132,9 @@ def convert_to_feature(icann_data, countries, html_string, url, data_file="IP2LO
 
     # set country
     country_feature = [0 for i in range(255)]
-    if 'country' in icann_data[url] and icann_data[url]['country'] in countries:
-        country = countries.index(icann_data[url]['country'])
+    country = geo.index_of(icann_data[url]['country']) if 'country' in icann_data[url] else -1
+    if country != -1:
         country_feature[country] = 1
-    else:
-        country = -1
 
     # whois guard
     names = icann_data[url]['registrar'] if 'registrar' in icann_data[url] else None
@@ -136,42 +151,36 @@ def convert_to_feature(icann_data, countries, html_string, url, data_file="IP2LO
             guard = -1
 
     # DOM parsing
-    parsed_tree = BeautifulSoup(html_string, 'html.parser')
-    script_tags = parsed_tree.find_all('script', src=True)
-    
-    link_tags = parsed_tree.find_all('a', href=True)
+    script_tags = page.scripts
+
     num_external_links = 0
-    if link_tags:
-        for link_tag in link_tags:
-            link = link_tag['href']
-            if link.startswith("http") and u not in link:
-                num_external_links += 1
+    for link in page.links:
+        if link.startswith("http") and u not in link:
+            num_external_links += 1
 
     # social media
     total_social_medias = [-1, -1, -1]
-    social_media_regex = [
-        r'instagram\.com\/[a-zA-Z0-9_\-]+',
-        r'facebook\.com\/[a-zA-Z0-9_\-]+',
-        r'twitter\.com\/[a-zA-Z0-9_\-]+',
-    ]
-    
-    for i, r in enumerate(social_media_regex):
-        found = re.findall(r, html_string)
+    for i, found in enumerate(SOCIAL_MEDIA_SCANNER.first(html_string)):
         if found:
-            total_social_medias[i] = 1 if found[0].split('/')[-1] in url else 0
+            total_social_medias[i] = 1 if found.split('/')[-1] in url else 0
 
-    # Host country
+    # Host country, left out (-1) unless GEO_HOST_COUNTRY=yes: the models were
+    # trained on the old always -1 / all 0 columns, retrain before turning it on
     host_country_feature = [0 for i in range(255)]
-    try:
-        host_ip = socket.gethostbyname(u)
-        response = ip_location.get_all(host_ip)
-        host_country = response.country_short.decode()
-        host_domain_same = 1 if countries.index(host_country) == country else 0
-        host_country = countries.index(host_country)
+    host_country = -1
+    if geo_host_country:
+        try:
+            if host_ip is None:
+                host_ip = get_resolver().resolve(u)
+            host_country = geo.index_of(geo.lookup(host_ip))
+        except:
+            host_country = -1
+
+    if host_country != -1:
+        host_domain_same = 1 if host_country == country else 0
         host_country_feature[host_country] = 1
-    except:
+    else:
         host_domain_same = -1
-        host_country = -1
 
     # cheap domains
     has_digit = any(i.isdigit() for i in url)
@@ -191,8 +200,9 @@ def convert_to_feature(icann_data, countries, html_string, url, data_file="IP2LO
     uses_cheap_domain = 1 if any(t in url for t in top_cheap_domains) else 0
             
     # domain in body text
-    if parsed_tree.find('body') is not None:
-        domain_in_text = parsed_tree.find('body').text.count(u)
+    body_string = page.body_string
+    if body_string is not None:
+        domain_in_text = body_string.count(u)
     else:
         domain_in_text = -1
         
@@ -221,32 +231,31 @@ def convert_to_feature(icann_data, countries, html_string, url, data_file="IP2LO
     X[-1].extend(country_feature)
     X[-1].extend(host_country_feature)
 
+    metrics.current().add('features', time.perf_counter() - started)
+
     # ⭐⭐⭐ ADD BEYONDPHISH FEATURES HERE ⭐⭐⭐
-    bp_vector = extract_beyondphish_features(html_string)
+    if bp_vector is None:
+        bp_vector = extract_beyondphish_features(page)
     X[-1].extend(bp_vector)
 
     return X
 
 
-def get_source(driver, url, output_file):
+def get_source(driver, url, waiter=None):
 
     try:
         if not url.startswith('http'):
             url = 'https://' + url
         print(url)
-        driver.get(url)
-        time.sleep(5)
-        # Get page source or content
-        content = driver.page_source
-
-        # # save the content
-        # fout = open(output_file, 'w')
-        # fout.write(content)
-        # fout.close()
-        # return content
-        # Save using UTF-8 encoding (fixes \uf10d etc.)
-        with open(output_file, 'w', encoding='utf-8', errors='ignore') as fout:
-            fout.write(content)
+        with metrics.stage('page_load'):
+            driver.get(url)
+        # wait for the DOM and network to go quiet instead of a fixed sleep
+        with metrics.stage('settle'):
+            settle, reason = (waiter or PageWaiter()).wait(driver, url)
+        print(f"settled in {settle:.2f}s ({reason})")
+        # Get page source or content, the crawler stores it
+        with metrics.stage('page_source'):
+            content = driver.page_source
         return content
         
     except Exception as e:
@@ -255,26 +264,97 @@ def get_source(driver, url, output_file):
 
 
 class Crawler:
-    def __init__(self, pid, cache_mode, source_path, lang_list):
+    def __init__(self, pid, cache_mode, source_path, lang_list, refresh=False):
         self.pid = pid
         self.cache_mode = cache_mode
         self.source_path = source_path
+        # refetch pages even when the page store has them (recrawl of changed domains)
+        self.refresh = refresh
         self.lang_list = lang_list
-
-        # load whois data
-        self.whois_data = {}
-
-        # load contries
-        #self.countries = list(json.load(open('./assets/country.json', 'r', encoding='utf-8')).keys())
-        assets_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'assets', 'country.json')
-        self.countries = list(json.load(open(assets_path, 'r', encoding='utf-8')).keys())
+        # per domain stage timings (METRICS), drained with the results
+        self.metrics = Metrics(pid, enabled=collect_metrics)
+        # memoized feature vectors and language checks (CACHE_MODE), shared across workers and runs
+        self.features = FeatureCache(enabled=cache_mode)
+        # template clusters of collected pages (TEMPLATE_CLUSTERS), shared across workers and runs
+        self.templates = TemplateIndex(enabled=template_clusters)
+        # sampled language detection, the langid model is loaded once per process
+        self.language = LanguageGate(lang_list, cache=self.features if cache_mode else None)
+
+        # whois results, cached on disk across workers and runs
+        self.whois = WhoisCache()
+
+        # countries index and ip2location, shared by the whole process
+        self.geo = get_geo_service()
+        # dns with timeouts, cached on disk across workers
+        self.resolver = get_resolver()
+
+        # one warm browser session for every page this worker fetches
+        self.drivers = DriverPool()
+        self.waiter = PageWaiter()
+
+        # static http first, the browser only for pages that need it
+        self.fetcher = TieredFetcher(StaticFetcher() if static_fetch else None, self.browser_fetch, is_content_parked)
+        self.prefetched = {}
+        # compressed, deduplicated page cache (old <url>.html files are still read)
+        self.pages = PageStore(os.path.abspath(self.source_path))
+
+        # per domain i/o (whois, dns, page) runs on these threads
+        self.executor = ThreadPoolExecutor(max_workers=3)
 
         self.X, self.Y, self.collected_urls = [], [], []
+        self.clusters = []
         self.ip_failed_urls = []
 
     def close_all(self):
-        # self.info_getter.close_driver()
-        pass
+        self.drivers.close()
+        self.fetcher.close()
+        self.whois.close()
+        self.pages.close()
+        self.features.close()
+        self.templates.close()
+        self.executor.shutdown(wait=False)
+
+    def counters(self):
+        return [self.fetcher.stats, self.whois.stats, self.resolver.stats, self.language.stats, self.features.stats,
+                self.templates.stats]
+
+    def stats(self):
+        return sum(self.counters(), Counter())
+
+    def drain(self):
+        # hand over everything collected since the last drain
+        result = [self.collected_urls, self.X, self.ip_failed_urls, self.waiter.records, self.stats(),
+                  self.metrics.records, self.clusters]
+        self.collected_urls, self.X, self.ip_failed_urls, self.clusters = [], [], [], []
+        self.waiter.records = []
+        self.metrics.records = []
+        for counter in self.counters():
+            counter.clear()
+        return result
+
+    def browser_fetch(self, url):
+        return self.drivers.fetch(get_source, url, self.waiter)
+
+    def prefetch(self, urls):
+        # run the static tier for a batch of uncached urls concurrently
+        todo = [url for url in urls if self.refresh or not self.pages.has(url)]
+        self.prefetched = self.fetcher.prefetch(todo)
+
+    def load_page(self, url):
+        # get page source (from cache or DL)
+        print(f"start ...")
+        record = metrics.current()
+        page_content = None if self.refresh else self.pages.get(url)
+        if page_content is None:
+            print(f"[INFO] Fetching: {url}")
+            record.note('page_from', 'fetch')
+            page_content = self.fetcher.fetch(url, self.prefetched.pop(url, NOT_FETCHED))
+            if page_content is not None:
+                record.count('bytes_fetched', len(page_content.encode('utf-8', errors='ignore')))
+                self.pages.put(url, page_content)
+        else:
+            record.note('page_from', 'store')
+        return page_content
 
     def crawl(self, data):
         print(f"crawl {data}")
@@ -282,125 +362,146 @@ class Crawler:
         if '"' in url:
             url = url.replace('"', '')
 
-        unified_url_whois = {check_url(url): value for url, value in self.whois_data.items()}
+        failed = len(self.ip_failed_urls)
+        with self.metrics.start(url) as record:
+            self._crawl(url, record)
+        self.metrics.finish(record, self.ip_failed_urls[-1][1] if len(self.ip_failed_urls) > failed else 'collected')
+
+    def _crawl(self, url, record):
+        # whois, dns and the page fetch are independent, run them side by side
+        # and assemble the features once all three are back (or the deadline hits)
+        whois_job = self.executor.submit(record.run, 'whois', self.whois.lookup, url)
+        dns_job = self.executor.submit(record.run, 'dns', self.resolver.resolve, normalize_url(check_url(url)))
+        page_job = self.executor.submit(record.run, 'page', self.load_page, url)
+        jobs = {'whois': whois_job, 'dns': dns_job, 'page': page_job}
+        with record.stage('wait'):
+            wait(jobs.values(), timeout=domain_deadline)
+
+        late = [name for name, job in jobs.items() if not job.done()]
+        if late:
+            # the late jobs hold their threads until they return, the next domains get fresh ones
+            record.note('abandoned', late)
+            self.executor.shutdown(wait=False)
+            self.executor = ThreadPoolExecutor(max_workers=3)
+        for name, job in jobs.items():
+            if job.done() and job.exception() is not None:
+                print(f"[WARN] {url} {name} failed : {job.exception()}")
+
+        # whois data ({} when the lookup fails or is late)
+        icann_data = job_result(whois_job, {})
+        host_ip = job_result(dns_job, '')
+
+        if not page_job.done():
+            print(f"[WARN] {url} missed the {domain_deadline}s deadline")
+            self.ip_failed_urls.append((url, 'deadline'))
+            return
+        if page_job.exception() is not None:
+            self.ip_failed_urls.append((url, f'error: {page_job.exception()}'))
+            return
+        page_content = page_job.result()
+        if not page_content:
+            self.ip_failed_urls.append((url, 'content'))
+            return
+
+        # parse once, every feature function below shares this tree
+        page = ParsedPage(page_content)
+        record.count('page_bytes', len(page_content))
+        with record.stage('parked'):
+            parked = is_content_parked(page)
+        # create features
+        print(f"parked : {parked}")
+        if len(page_content) > 3000 and not parked:
+            if lang_filter:
+                with record.stage('language'):
+                    accepted = self.language.accept(page)
+                if not accepted:
+                    self.ip_failed_urls.append((url, 'language'))
+                    return
+            with record.stage('template'):
+                cluster, structure = self.templates.assign(url, page_content)
+            with record.stage('extract'):
+                sample_features = self.extract(url, page, icann_data, host_ip, cluster, structure)
+
+            self.X.append(sample_features)
+            self.collected_urls.append(url)
+            self.clusters.append(cluster)
+        else:
+            self.ip_failed_urls.append((url, 'too little content'))
 
-        # get whois data
-        icann_data = {}
-        try:
-            if url in unified_url_whois :
-                icann_data = unified_url_whois[url]
-            else:
-                icann_data = whois.whois(url)
-                self.whois_data[url] = icann_data
-
-            # if icann_data == {} or 'creation_date' not in icann_data or icann_data['creation_date'] == None:
-            #     self.ip_failed_urls.append((url, 'whois'))
-            #     return
-        except Exception as e:
-            print(f"get whois error : {e}")
-  
+    def extract(self, url, page, icann_data, host_ip, cluster=-1, structure=None):
+        # the feature row depends on the page, the whois record, the host ip and the url,
+        # the BeyondPhish part only on the page, so it survives a whois or dns change.
+        # structure is the DOM counts of a template clone, reused instead of walking this page
+        def beyondphish():
+            own = structure if structure is not None else page_structure(page)
+            self.templates.set_structure(cluster, own)
+            return extract_beyondphish_features(page, own)
 
-        # get page source (from cache or DL)
-        page_content = None
-        fpath = os.path.join(os.path.abspath(self.source_path), url.replace('/', '').replace('?', '').replace('!', '').replace('@', '').replace(':', '') + '.html')
-        os.makedirs(os.path.dirname(fpath), exist_ok=True)
-        print(f"start ...")
-        if not os.path.exists(fpath):
-            try:
-                options = Options()
-                options.add_argument("--headless")  # run silently, no GUI
-                options.add_argument("--incognito")
-                options.add_argument("--enable-javascript")
-                options.add_argument("--ignore-certificate-errors")
-                options.add_argument("--no-sandbox")
-                options.add_argument("--disable-dev-shm-usage")
-                options.add_argument("--disable-blink-features=AutomationControlled")
-
-                prefs = {
-                "translate_whitelists": {"fr": "en", "es": "en"},
-                "translate": {"enabled": "true"}
-                }
-                options.add_experimental_option("prefs", prefs)
-
-                # Create a local Chrome driver instance instead of remote
-                driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-                driver.set_page_load_timeout(30)
+        def compute():
+            with metrics.stage('beyondphish'):
+                bp_vector = self.features.memoize('bp', [page.content_hash, structure], beyondphish)
+            return convert_to_feature({url: icann_data}, self.geo, page, url, host_ip, bp_vector)
+        return self.features.memoize('row', [page.content_hash, url, icann_data, host_ip, structure], compute)
 
-            except Exception as e:
-                print(f"[ERROR] Could not load page {url}: {e}")
-                self.ip_failed_urls.append((url, 'content'))
 
-            print(f"[INFO] Fetching: {url}")
-            page_content = get_source(driver, url, fpath)
-            driver.quit()
-        
-            try:
-                 d = DesiredCapabilities.CHROME
-                 d['goog:loggingPrefs'] = { 'performance':'ALL', 'browser':'ALL' }
-                 options = uc.ChromeOptions()
-                 options.add_argument("--incognito")
-                 options.add_argument("--enable-javascript")
-                 options.add_argument("--ignore-certificate-errors")
-                 prefs = {
-                     "translate_whitelists": {"fr":"en", "es":"en"},
-                     "translate":{"enabled":"true"}
-                 }
-                 options.add_experimental_option("prefs", prefs)
-                 print(f"sel add : {selenium_address}")
-                 driver = webdriver.Remote(selenium_address, d, options=options)
-                 driver.set_page_load_timeout(10)
-                 print(f'************************************ {fpath} ***********')
-                 page_content = get_source(driver, url, fpath)
-                 # Close the browser
-                 driver.quit()
+def job_result(job, default):
+    # result of an executor job, default while it is still running or when it raised
+    if not job.done() or job.exception() is not None:
+        return default
+    return job.result()
 
 
-            except Exception as e:
-                print(f"error in get page source {e}")
-                self.ip_failed_urls.append((url, 'content'))
-                pass
-        else:
-            page_content = open(fpath, 'r', errors='ignore').read()
-
-        if page_content:
-            page_text = extract_body_text(page_content)
-            # create features
-            print(f"parked : {is_content_parked(page_content)}")
-            print(f"lang : {filter_lang(page_text, self.lang_list)}")
-            #if len(page_content) > 3000 and not is_content_parked(page_content) and filter_lang(page_text, self.lang_list):
-            if len(page_content) > 3000 and not is_content_parked(page_content) :
-                db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'assets', 'IP2LOCATION-LITE-DB1.BIN')
-                sample_features = convert_to_feature({url: icann_data}, self.countries, page_content, url, db_path)
-                #sample_features = convert_to_feature({url: icann_data}, self.countries, page_content, url, './assets/IP2LOCATION-LITE-DB1.BIN')
-
-                self.X.append(sample_features)
-                self.collected_urls.append(url)
-            else:
-                self.ip_failed_urls.append((url, 'too little content'))
-
-
-def crawl_list(urls):
-    # urls[0] has:: u, ind, args.cache_mode, args.source_path
-    print("start thread ...")
-    cache_mode = urls[0][2]
-    source_path = urls[0][3]
-    lang_list = urls[0][4]
-    crawler = Crawler(os.getpid(), cache_mode, source_path, lang_list)
-
-    # get process num
-    if urls[0][1] == 0:
-        iterator = urls # tqdm(urls, total=len(urls))
-    else:
-        iterator = urls
+def seen_outcome(url, collected, reasons):
+    # fetch failures, errors and deadlines are tried again next run, language / content rejections are final
+    if url in collected:
+        return 'collected'
+    reason = reasons.get(url, '')
+    return 'failed' if reason in ('content', 'deadline') or reason.startswith('error') else 'skipped'
+
+
+_crawler = None
+
+
+def init_crawler(cache_mode, source_path, lang_list, refresh=False):
+    # pool initializer, every worker keeps one Crawler (and its browser) for the whole run
+    global _crawler
+    init_worker()
+    _crawler = Crawler(os.getpid(), cache_mode, source_path, lang_list, refresh)
+    Finalize(_crawler, _crawler.close_all, exitpriority=10)
+    signal.signal(signal.SIGTERM, close_on_terminate)
+
+
+def close_on_terminate(signum, frame):
+    # Pool.terminate() ends the workers without running Finalize, a remote browser
+    # session would stay open on the grid. The lock may be held by a hung fetch, quit without it
+    try:
+        _crawler.drivers.recycle()
+    finally:
+        os._exit(0)
+
 
-    for url in iterator:
-        crawler.crawl(url[0])
+def crawl_batch(urls):
+    crawler = _crawler
+    timings = []
 
-    collected_urls = crawler.collected_urls
-    X = crawler.X
-    failed = crawler.ip_failed_urls
-    crawler.close_all()
-    return [collected_urls, X, failed]
+    try:
+        # static fetches for the batch run concurrently, then each url is crawled
+        crawler.prefetch(urls)
+        for url in urls:
+            start = time.time()
+            try:
+                crawler.crawl(url)
+            except Exception as e:
+                # one broken domain does not take the rest of its batch down
+                print(f"[WARN] {url} failed : {e}")
+                crawler.ip_failed_urls.append((url, f'error: {e}'))
+            timings.append((url, round(time.time() - start, 3)))
+    except Exception:
+        # the batch is reported failed as a whole, its partial results must not come back with the next one
+        crawler.drain()
+        raise
+
+    return crawler.drain() + [timings]
 
 def main(args):
     # create processes to crawl
@@ -429,75 +530,121 @@ def main(args):
     lang_list = selected_langs_str.split(',')
     visited_domains = set()
 
-    for ind, u in enumerate(list(set(all_urls))):
-        domain = u
-        if domain not in visited_domains:
-            visited_domains.add(domain)
-        else:
-            continue
-
-        all_urls_added.append([
-            u, ind, cache_mode, args.source_path, lang_list
-        ])
+    for u in all_urls:
+        if u not in visited_domains:
+            visited_domains.add(u)
+            all_urls_added.append(u)
+
+    # results go to disk as they arrive, --resume skips what earlier runs finished
+    writer = ResultWriter(args.output_file, resume=args.resume)
+    if args.resume:
+        done = writer.done_urls()
+        all_urls_added = [u for u in all_urls_added if u not in done]
+        print(f"resuming , {len(done)} domains already done")
+
+    # drop domains earlier runs already analyzed within SEEN_TTL_HOURS, before any dns / whois / fetch.
+    # --refresh (the recrawl list) asks for those domains again, they are only recorded
+    seen = SeenIndex(enabled=seen_index)
+    if not args.refresh:
+        all_urls_added, recent = seen.filter(all_urls_added)
+        if recent:
+            print(f"seen index : {len(recent)} domains processed in the last {seen_ttl_hours:g}h skipped")
 
     print('Total number of domains = %d' %len(all_urls_added))
 
-    # create batches according to num_procs
-    if len(all_urls_added) // number_proc == 0 :
-        n = 1
+    # --queue : every instance enqueues the same list (queued domains are ignored) and leases batches from it
+    work = open_work_queue(args.queue) if args.queue else None
+    owner = worker_id()
+    if work:
+        print(f"work queue {args.queue} : {work.enqueue(all_urls_added)} domains added , leasing as {owner}")
+
+    if args.pre_resolve:
+        # warm the shared dns cache for the whole list before any crawling
+        hosts = [normalize_url(u) for u in all_urls_added]
+        resolver = Resolver()
+        resolved = resolver.resolve_many(hosts)
+        print(f"pre-resolved {len(resolved)} hosts , {sum(1 for ip in resolved.values() if ip)} with an address")
+        resolver.close()
+
+    # small batches handed out as workers free up, instead of one fixed chunk per process
+    if work:
+        batches = lease_batches(work, owner, task_batch)
     else:
-        n = len(all_urls_added) // number_proc
-    
-    urls = [all_urls_added[i * n:(i + 1) * n] for i in range((len(all_urls_added) + n - 1) // n )] 
-    print(f"urls : {len(urls)} , num_procs : {number_proc} , n :{n}")
-    pool = Pool(number_proc)
-    results = pool.map(crawl_list, urls)
-    #pool.close()
-    #pool.join()
-
-    print('Merging the results ...')
-
-    all_urls = []
-    all_X = []
-    all_failed = []
-    results = [i for i in results]
-    for i in results:
-        for failed in i[2]:
-            all_failed.append(failed)
-        for url, x in zip(i[0], i[1]):
-            print(url, x)
-            all_urls.append(url)
-            all_X.append(x)
-
-    print('Results len = %d' %len(all_X))
-    # pickle.dump((all_X, all_urls), open(args.output_file, 'wb'))
-    # df = pd.DataFrame(all_failed, columns=["Failed URLs", "Reason"])
-
-    # # Write to a CSV file
-    # df.to_csv(args.output_file.replace('.pkl', '-failed.csv'), index=False)
-    # if len(all_X) > 0:
-    #     df_features = pd.DataFrame(all_X)
-    #     df_features["URL"] = all_urls
-    #     df_features.to_csv(args.output_file, index=False)
-    #     print(f"✅ Features saved to {args.output_file}")
-
-    if len(all_X) > 0:
-        with open(args.output_file, "wb") as f:
-            pickle.dump((all_X, all_urls), f)
-        print(f"✅ Pickle features saved to {args.output_file}")
-
-        # (Optional) also save a readable CSV copy
-        df_preview = pd.DataFrame([x[0] for x in all_X])
-        df_preview["URL"] = all_urls
-        df_preview.to_csv(args.output_file.replace(".pkl", "_preview.csv"), index=False)
-        print(f"📄 CSV preview saved to {args.output_file.replace('.pkl', '_preview.csv')}")
-
-    # Save failed URLs (if any)
-    if len(all_failed) > 0:
-        df_failed = pd.DataFrame(all_failed, columns=["Failed URLs", "Reason"])
-        df_failed.to_csv("features_output_failed.csv", index=False)
-        print("⚠️ Some URLs failed, logged in features_output_failed.csv")
-
+        batches = [all_urls_added[i:i + task_batch] for i in range(0, len(all_urls_added), task_batch)]
+        print(f"batches : {len(batches)} , num_procs : {number_proc} , batch size : {task_batch}")
+    # load geolocation and the langid model before forking so workers share them copy-on-write
+    get_geo_service()
+    if lang_filter:
+        get_identifier()
+    pool = Pool(number_proc, initializer=init_crawler, initargs=(cache_mode, args.source_path, lang_list, args.refresh))
+    scheduler = Scheduler(pool, crawl_batch, task_deadline or domain_deadline * task_batch + 60, number_proc)
+
+    all_settle = []
+    all_timings = []
+    all_stats = Counter()
+    # one json line per domain with its stage timings
+    metrics_writer = MetricsWriter(args.output_file.replace(".pkl", "_metrics.jsonl")) if collect_metrics else None
+    for batch, result, error in scheduler.run(batches):
+        if result is None:
+            print(f"[WARN] batch {batch} failed : {error}")
+            for url in batch:
+                writer.add_failed(url, error)
+            seen.record([(url, 'failed') for url in batch])
+            if work:
+                # a batch that ran out of time may hold a domain that hangs every worker, it uses up an
+                # attempt; errors of this instance give the domains back as they were
+                work.release(owner, batch, charge=error == 'deadline')
+            continue
+        for url, reason in result[2]:
+            writer.add_failed(url, reason)
+        collected, reasons = set(result[0]), dict(result[2])
+        outcomes = [(url, seen_outcome(url, collected, reasons)) for url in batch]
+        seen.record(outcomes)
+        if work:
+            work.ack(owner, outcomes)
+        all_settle.extend(result[3])
+        all_stats.update(result[4])
+        all_timings.extend(result[7])
+        if metrics_writer:
+            metrics_writer.add(result[5])
+        for url, x, cluster in zip(result[0], result[1], result[6]):
+            writer.add(url, x, cluster)
+        print(f"collected {writer.written} domains")
+    scheduler.shutdown()
+
+    print('Results len = %d' %writer.written)
+    print(tier_report(all_stats))
+    print(whois_report(all_stats))
+    print(dns_report(all_stats))
+    print(language_report(all_stats))
+    if cache_mode:
+        print(feature_cache_report(all_stats))
+    if template_clusters:
+        print(template_report(all_stats))
+    if seen_index:
+        print(seen_report(seen.stats))
+        seen.close()
+    if work:
+        print(queue_report(work.stats, work.counts()))
+        work.close()
+    print(straggler_report(all_timings))
+    print(f"batches lost to deadline : {scheduler.abandoned} , to errors : {scheduler.errors}")
+    if metrics_writer:
+        metrics_writer.close()
+        summary = metrics_writer.summary()
+        with open(args.output_file.replace(".pkl", "_metrics_summary.json"), 'w', encoding='utf-8') as fout:
+            json.dump(summary, fout, indent=2)
+        print(metrics_report(summary))
+
+    # merge this run and any resumed ones into the (X, urls) pickle and the csv copies
+    total = writer.merge("features_output_failed.csv", feature_format)
+    print(f"Total results = {total}")
+
+    # Save page settle times, used to tune PAGE_SETTLE_BUDGET / PAGE_QUIET_MS
+    if len(all_settle) > 0:
+        df_settle = pd.DataFrame(all_settle, columns=["URL", "Seconds", "Reason"])
+        df_settle.to_csv(args.output_file.replace(".pkl", "_settle.csv"), index=False)
+        print(f"settle p50 {df_settle['Seconds'].median():.2f}s , p95 {df_settle['Seconds'].quantile(0.95):.2f}s")
 
 
 if __name__ == '__main__':
@@ -507,6 +654,10 @@ if __name__ == '__main__':
     parser.add_argument('--source_path', type=str, help='directory , save html file', required=True)
     parser.add_argument('--output_file', type=str, help='output file', required=True)
     parser.add_argument('--selected_languages', type=str, help='list of desired languages, comma seprated, no space', required=True)
+    parser.add_argument('--pre_resolve', action='store_true', help='resolve every domain before crawling')
+    parser.add_argument('--resume', action='store_true', help='keep the results of an interrupted run and skip its domains')
+    parser.add_argument('--refresh', action='store_true', help='fetch every page again instead of using the stored copy')
+    parser.add_argument('--queue', type=str, help='share the input with other instances through this WORK_QUEUE queue')
 
     args = parser.parse_args()
 
@@ -1,6 +1,8 @@
-from bs4 import BeautifulSoup
 import re
 
+from keyword_scanner import KeywordScanner
+from parsed_page import ParsedPage
+
 LOGIN_KEYWORDS = [
     "login", "log in", "sign in", "verify", "verification",
     "authenticate", "password", "reset your password",
@@ -18,6 +20,17 @@ SUSPICIOUS_EVENTS = [
     "onfocus", "onblur", "onunload", "onsubmit"
 ]
 
+REDIRECT_PATTERNS = [
+    r"location\.href\s*=",
+    r"window\.location",
+    r"http-equiv=['\"]refresh['\"]",
+]
+
+LOGIN_SCANNER = KeywordScanner(re.escape(kw) for kw in LOGIN_KEYWORDS)
+PAYMENT_SCANNER = KeywordScanner(re.escape(kw) for kw in PAYMENT_KEYWORDS)
+EVENT_SCANNER = KeywordScanner(re.escape(evt + "=") for evt in SUSPICIOUS_EVENTS)
+REDIRECT_SCANNER = KeywordScanner(REDIRECT_PATTERNS)
+
 
 def _compute_dom_depth(node, depth=0):
     try:
@@ -31,20 +44,10 @@ def _compute_dom_depth(node, depth=0):
     return max(_compute_dom_depth(c, depth + 1) for c in children)
 
 
-def extract_beyondphish_features(html: str):
-    """Return a fixed-length numeric vector of BeyondPhish features."""
-    
-    # If empty HTML → return zeros
-    if not html or not isinstance(html, str):
-        return [0]*11
+def _tree_structure(page):
+    soup = page.soup
 
-    try:
-        soup = BeautifulSoup(html, "html.parser")
-    except:
-        return [0]*11
-
-    # --- DOM STRUCTURE ---
-    all_tags = soup.find_all(True)
+    all_tags = page.all_tags
     total_nodes = len(all_tags)
 
     # DOM depth
@@ -61,16 +64,11 @@ def extract_beyondphish_features(html: str):
         except:
             pass
 
-    branch_factor = total_children / total_nodes if total_nodes > 0 else 0
-
-    # script ratio
-    num_scripts = len(soup.find_all('script'))
-    script_ratio = num_scripts / total_nodes if total_nodes > 0 else 0
+    # script tags and input fields
+    num_scripts = len(page.tags('script'))
+    input_count = len(page.tags('input')) + len(page.tags('form'))
 
-    # input fields
-    input_count = len(soup.find_all('input')) + len(soup.find_all('form'))
-
-    # hidden ratio
+    # hidden tags
     hidden_count = 0
     for t in all_tags:
         try:
@@ -79,24 +77,70 @@ def extract_beyondphish_features(html: str):
                 hidden_count += 1
         except:
             pass
+
+    return total_nodes, dom_depth, total_children, num_scripts, input_count, hidden_count
+
+
+def _stream_structure(page):
+    # same counts from one pass over the parser events, see dom_stream.py
+    dom = page.dom
+    counts = dom.tag_counts
+    return (dom.total_nodes, dom.max_depth, dom.total_children, counts.get('script', 0),
+            counts.get('input', 0) + counts.get('form', 0), dom.hidden_count)
+
+
+def page_structure(page):
+    """(total_nodes, dom_depth, total_children, num_scripts, input_count,
+    hidden_count) of a ParsedPage, None when it cannot be walked."""
+    try:
+        if page.engine == 'stream':
+            return _stream_structure(page)
+        return _tree_structure(page)
+    except:
+        return None
+
+
+def extract_beyondphish_features(page, structure=None):
+    """Return a fixed-length numeric vector of BeyondPhish features.
+
+    `page` is either the raw HTML string or a ParsedPage shared with the
+    other feature extractors, so the document is only parsed once.
+    `structure` is an already known page_structure() (a template clone's,
+    see template_index.py), the DOM walk is skipped when given.
+    """
+
+    html = page.html if isinstance(page, ParsedPage) else page
+
+    # If empty HTML → return zeros
+    if not html or not isinstance(html, str):
+        return [0]*11
+
+    page = ParsedPage.wrap(page)
+    if structure is None:
+        structure = page_structure(page)
+    if structure is None:
+        return [0]*11
+    total_nodes, dom_depth, total_children, num_scripts, input_count, hidden_count = structure
+
+    # --- DOM STRUCTURE ---
+    branch_factor = total_children / total_nodes if total_nodes > 0 else 0
+    script_ratio = num_scripts / total_nodes if total_nodes > 0 else 0
     hidden_ratio = hidden_count / total_nodes if total_nodes > 0 else 0
 
     # --- BEHAVIORAL FEATURES ---
-    lower_html = html.lower()
+    lower_html = page.lower_html
 
-    redirect_count = len(re.findall(r"location\.href\s*=", lower_html)) + \
-                     len(re.findall(r"window\.location", lower_html)) + \
-                     len(re.findall(r"http-equiv=['\"]refresh['\"]", lower_html))
+    redirect_count = REDIRECT_SCANNER.total(lower_html)
 
     eval_usage = 1 if "eval(" in lower_html else 0
 
-    suspicious_events = sum(lower_html.count(evt + "=") for evt in SUSPICIOUS_EVENTS)
+    suspicious_events = EVENT_SCANNER.total(lower_html)
 
     # --- TEXT FEATURES ---
-    text = soup.get_text(separator=" ").lower()
+    text = page.text.lower()
 
-    login_count = sum(text.count(kw) for kw in LOGIN_KEYWORDS)
-    payment_count = sum(text.count(kw) for kw in PAYMENT_KEYWORDS)
+    login_count = LOGIN_SCANNER.total(text)
+    payment_count = PAYMENT_SCANNER.total(text)
 
     return [
         total_nodes,
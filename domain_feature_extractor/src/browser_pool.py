@@ -0,0 +1,128 @@
+import threading
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+
+import metrics
+from config import browser_mode, browser_max_pages, page_load_timeout, selenium_address
+
+_chromedriver_path = None
+
+
+def _local_driver_path():
+    # ChromeDriverManager hits the network, resolve the binary once per process
+    global _chromedriver_path
+    if _chromedriver_path is None:
+        from webdriver_manager.chrome import ChromeDriverManager
+        _chromedriver_path = ChromeDriverManager().install()
+    return _chromedriver_path
+
+
+def _chrome_options(mode):
+    options = Options()
+    options.add_argument("--incognito")
+    options.add_argument("--enable-javascript")
+    options.add_argument("--ignore-certificate-errors")
+    if mode == 'local':
+        options.add_argument("--headless")  # run silently, no GUI
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument("--disable-blink-features=AutomationControlled")
+    else:
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL', 'browser': 'ALL'})
+
+    prefs = {
+        "translate_whitelists": {"fr": "en", "es": "en"},
+        "translate": {"enabled": "true"}
+    }
+    options.add_experimental_option("prefs", prefs)
+    return options
+
+
+class DriverPool:
+    '''
+    Keeps one warm browser session per worker process instead of starting
+    a new browser for every domain.
+
+    mode is 'local' (chromedriver on this machine) or 'remote' (the
+    selenium grid at SELENIUM_ADDRESS). The session is recycled after
+    max_pages page loads, and as soon as it stops answering.
+    '''
+
+    def __init__(self, mode=None, max_pages=None, timeout=None):
+        self.mode = mode or browser_mode
+        self.max_pages = max_pages or browser_max_pages
+        self.timeout = timeout or page_load_timeout
+        self._driver = None
+        self._pages = 0
+        self.sessions_started = 0
+        # a page fetch that outlived its domain deadline may still hold the session
+        self._lock = threading.Lock()
+
+    def _create(self):
+        options = _chrome_options(self.mode)
+        if self.mode == 'local':
+            driver = webdriver.Chrome(service=Service(_local_driver_path()), options=options)
+        elif self.mode == 'remote':
+            driver = webdriver.Remote(selenium_address, options=options)
+        else:
+            raise ValueError(f"unknown browser mode {self.mode}, expected local or remote")
+        driver.set_page_load_timeout(self.timeout)
+        self.sessions_started += 1
+        return driver
+
+    def get(self):
+        '''return a live session, starting or recycling one when needed'''
+        if self._driver is not None and self._pages >= self.max_pages:
+            self.recycle()
+        if self._driver is None:
+            with metrics.stage('browser_start'):
+                self._driver = self._create()
+            self._pages = 0
+        return self._driver
+
+    def alive(self):
+        if self._driver is None:
+            return False
+        try:
+            self._driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def release(self, ok=True):
+        '''count a finished page load, drop the session if it crashed'''
+        self._pages += 1
+        if not ok and not self.alive():
+            self.recycle()
+
+    def recycle(self):
+        if self._driver is not None:
+            try:
+                self._driver.quit()
+            except Exception as e:
+                print(f"[WARN] driver quit failed: {e}")
+        self._driver = None
+        self._pages = 0
+
+    def fetch(self, fetch_fn, *args):
+        '''
+        run fetch_fn(driver, *args) on a pooled session, returns its result
+        or None when no session could be started
+        '''
+        with self._lock:
+            try:
+                driver = self.get()
+            except Exception as e:
+                print(f"[ERROR] could not start {self.mode} browser: {e}")
+                self.recycle()
+                return None
+            result = fetch_fn(driver, *args)
+            self.release(ok=result is not None)
+            return result
+
+    def close(self):
+        with self._lock:
+            self.recycle()
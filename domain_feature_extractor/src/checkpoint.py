@@ -0,0 +1,126 @@
+import csv
+import os
+import pickle
+import shutil
+import time
+
+import pandas as pd
+
+from feature_store import write_feature_store
+
+
+class ResultWriter:
+    '''
+    Streams results to disk as domains finish so a crash only loses the
+    domains still in flight.
+
+    Every run appends (url, x, cluster) records to its own shard file in
+    <output_file>.shards/ and failures to failed.csv in the same directory,
+    flushing after each record. With resume=True the shards of previous
+    runs are kept and done_urls() tells which domains can be skipped;
+    otherwise old shards are cleared. merge() writes the (X, urls) pickle,
+    the columnar feature store (see feature_store.py) or both, and the
+    _preview.csv once the run is over.
+    '''
+
+    def __init__(self, output_file, resume=False):
+        self.output_file = output_file
+        self.shard_dir = output_file + '.shards'
+        if not resume and os.path.exists(self.shard_dir):
+            shutil.rmtree(self.shard_dir)
+        os.makedirs(self.shard_dir, exist_ok=True)
+
+        shard = f"part-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.pkl"
+        self._shard = open(os.path.join(self.shard_dir, shard), 'ab')
+        self.failed_path = os.path.join(self.shard_dir, 'failed.csv')
+        new_failed = not os.path.exists(self.failed_path)
+        self._failed = open(self.failed_path, 'a', newline='', encoding='utf-8')
+        self._failed_csv = csv.writer(self._failed)
+        if new_failed:
+            self._failed_csv.writerow(["Failed URLs", "Reason"])
+        self.written = 0
+
+    def add(self, url, x, cluster=-1):
+        pickle.dump((url, x, cluster), self._shard)
+        self._shard.flush()
+        self.written += 1
+
+    def add_failed(self, url, reason):
+        self._failed_csv.writerow([url, reason])
+        self._failed.flush()
+
+    def records(self):
+        '''{url: x} of every record in the shards, a later record for a url wins'''
+        return {url: x for url, (x, _) in self._read().items()}
+
+    def _read(self):
+        # {url: (x, cluster)}, shards written before clusters existed hold (url, x)
+        results = {}
+        for name in sorted(os.listdir(self.shard_dir)):
+            if not name.endswith('.pkl'):
+                continue
+            with open(os.path.join(self.shard_dir, name), 'rb') as fin:
+                while True:
+                    try:
+                        record = pickle.load(fin)
+                    except EOFError:
+                        break
+                    except Exception:
+                        # record cut short by a crash, the rest of the shard is unusable
+                        print(f"[WARN] truncated shard {name}")
+                        break
+                    results[record[0]] = (record[1], record[2] if len(record) > 2 else -1)
+        return results
+
+    def failures(self):
+        if not os.path.exists(self.failed_path):
+            return {}
+        with open(self.failed_path, 'r', newline='', encoding='utf-8') as fin:
+            return {row[0]: row[1] for row in list(csv.reader(fin))[1:] if len(row) == 2}
+
+    def done_urls(self):
+        '''domains that already have features, failed ones are tried again'''
+        return set(self.records())
+
+    def close(self):
+        self._shard.close()
+        self._failed.close()
+
+    def store_path(self):
+        return os.path.splitext(self.output_file)[0] + '.features'
+
+    def merge(self, failed_file, feature_format='both'):
+        '''
+        write the results of all shards as feature_format ('pickle',
+        'columnar' or 'both') plus the csv copies, returns the number of results
+        '''
+        self.close()
+        results = self._read()
+        failures = {url: reason for url, reason in self.failures().items() if url not in results}
+
+        if len(results) > 0:
+            all_urls = list(results)
+            all_X = [results[url][0] for url in all_urls]
+            all_clusters = [results[url][1] for url in all_urls]
+            if feature_format in ('pickle', 'both'):
+                with open(self.output_file, "wb") as f:
+                    pickle.dump((all_X, all_urls), f)
+                print(f"✅ Pickle features saved to {self.output_file}")
+            if feature_format in ('columnar', 'both'):
+                write_feature_store(self.store_path(), all_X, all_urls, all_clusters)
+                print(f"✅ Columnar features saved to {self.store_path()}")
+
+            # (Optional) also save a readable CSV copy
+            df_preview = pd.DataFrame([x[0] for x in all_X])
+            df_preview["URL"] = all_urls
+            df_preview["template_cluster"] = all_clusters
+            df_preview.to_csv(self.output_file.replace(".pkl", "_preview.csv"), index=False)
+            print(f"📄 CSV preview saved to {self.output_file.replace('.pkl', '_preview.csv')}")
+
+        # Save failed URLs (if any)
+        if len(failures) > 0:
+            df_failed = pd.DataFrame(list(failures.items()), columns=["Failed URLs", "Reason"])
+            df_failed.to_csv(failed_file, index=False)
+            print(f"⚠️ Some URLs failed, logged in {failed_file}")
+
+        return len(results)
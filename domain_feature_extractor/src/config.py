@@ -1,5 +1,53 @@
 import os
 
+cache_dir = os.getenv("CACHE_DIR", "/app/data" if os.path.isdir("/app/data") else
+                      os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")))
+
 selenium_address = os.getenv("SELENIUM_ADDRESS", "http://127.0.0.1:4444/wd/hub")
 number_proc = int(os.getenv("NUMBER_PROC",1))
-cache_mode = bool(os.getenv("CACHE_MODE",False))
\ No newline at end of file
+cache_mode = os.getenv("CACHE_MODE", "no") == "yes"
+html_parser = os.getenv("HTML_PARSER", "html.parser")
+ip2location_mode = os.getenv("IP2LOCATION_MODE", "SHARED_MEMORY")
+geo_host_country = os.getenv("GEO_HOST_COUNTRY", "no") == "yes"
+browser_mode = os.getenv("BROWSER_MODE", "remote" if os.getenv("SELENIUM_ADDRESS") else "local")
+browser_max_pages = int(os.getenv("BROWSER_MAX_PAGES", 50))
+page_load_timeout = int(os.getenv("PAGE_LOAD_TIMEOUT", 30))
+page_settle_budget = float(os.getenv("PAGE_SETTLE_BUDGET", 10))
+page_quiet_ms = int(os.getenv("PAGE_QUIET_MS", 500))
+static_fetch = os.getenv("STATIC_FETCH", "yes") == "yes"
+static_timeout = int(os.getenv("STATIC_TIMEOUT", 10))
+static_concurrency = int(os.getenv("STATIC_CONCURRENCY", 8))
+whois_cache_path = os.getenv("WHOIS_CACHE_PATH", os.path.join(cache_dir, "whois_cache.sqlite"))
+whois_ttl_hours = float(os.getenv("WHOIS_TTL_HOURS", 24 * 7))
+whois_negative_ttl_hours = float(os.getenv("WHOIS_NEGATIVE_TTL_HOURS", 6))
+domain_deadline = float(os.getenv("DOMAIN_DEADLINE", 90))
+dns_cache_path = os.getenv("DNS_CACHE_PATH", os.path.join(cache_dir, "dns_cache.sqlite"))
+dns_ttl_seconds = int(os.getenv("DNS_TTL_SECONDS", 3600))
+dns_negative_ttl_seconds = int(os.getenv("DNS_NEGATIVE_TTL_SECONDS", 300))
+dns_timeout = float(os.getenv("DNS_TIMEOUT", 5))
+dns_concurrency = int(os.getenv("DNS_CONCURRENCY", 32))
+task_batch = int(os.getenv("TASK_BATCH", 4))
+task_deadline = float(os.getenv("TASK_DEADLINE", 0))
+feature_format = os.getenv("FEATURE_FORMAT", "both")
+bp_engine = os.getenv("BP_ENGINE", "tree")
+bp_max_bytes = int(os.getenv("BP_MAX_BYTES", 10 * 1024 * 1024))
+lang_filter = os.getenv("LANG_FILTER", "yes") == "yes"
+lang_sample_chars = int(os.getenv("LANG_SAMPLE_CHARS", 2000))
+lang_head_chars = int(os.getenv("LANG_HEAD_CHARS", 64 * 1024))
+lang_min_confidence = float(os.getenv("LANG_MIN_CONFIDENCE", 0.9))
+feature_cache_path = os.getenv("FEATURE_CACHE_PATH", os.path.join(cache_dir, "feature_cache.sqlite"))
+feature_cache_max_mb = float(os.getenv("FEATURE_CACHE_MAX_MB", 1024))
+collect_metrics = os.getenv("METRICS", "no") == "yes"
+template_clusters = os.getenv("TEMPLATE_CLUSTERS", "no") == "yes"
+template_index_path = os.getenv("TEMPLATE_INDEX_PATH", os.path.join(cache_dir, "template_index.sqlite"))
+template_max_distance = int(os.getenv("TEMPLATE_MAX_DISTANCE", 3))
+template_min_tags = int(os.getenv("TEMPLATE_MIN_TAGS", 50))
+template_reuse = os.getenv("TEMPLATE_REUSE", "no") == "yes"
+seen_index = os.getenv("SEEN_INDEX", "no") == "yes"
+seen_index_path = os.getenv("SEEN_INDEX_PATH", os.path.join(cache_dir, "seen_index.sqlite"))
+seen_ttl_hours = float(os.getenv("SEEN_TTL_HOURS", 24 * 7))
+seen_bloom = os.getenv("SEEN_BLOOM", "yes") == "yes"
+work_queue = os.getenv("WORK_QUEUE", "work_queue.sqlite")
+work_lease_seconds = float(os.getenv("WORK_LEASE_SECONDS", 900))
+work_max_attempts = int(os.getenv("WORK_MAX_ATTEMPTS", 3))
+work_idle_seconds = float(os.getenv("WORK_IDLE_SECONDS", 5))
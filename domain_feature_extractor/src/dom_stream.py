@@ -0,0 +1,208 @@
+from io import StringIO
+
+from bs4 import BeautifulSoup
+from bs4.builder import HTMLTreeBuilder
+from bs4.element import CData
+
+from config import bp_max_bytes, bp_engine
+
+try:
+    # private to bs4, DomSummary stands in for the soup it drives. STREAM_SUPPORTED
+    # below checks the installed bs4 still works this way, ParsedPage falls back to the tree if not
+    from bs4.builder._htmlparser import BeautifulSoupHTMLParser
+except ImportError:
+    BeautifulSoupHTMLParser = None
+
+ROOT = '[document]'
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+EMPTY_ELEMENT_TAGS = HTMLTreeBuilder.empty_element_tags
+PRESERVE_WHITESPACE_TAGS = HTMLTreeBuilder.DEFAULT_PRESERVE_WHITESPACE_TAGS
+# strings directly inside these are not part of get_text()
+STRING_CONTAINERS = set(HTMLTreeBuilder.DEFAULT_STRING_CONTAINERS)
+
+
+class _Opened:
+    # what BeautifulSoupHTMLParser looks at on the tag handle_starttag returns
+    __slots__ = ('is_empty_element',)
+
+    def __init__(self, is_empty_element):
+        self.is_empty_element = is_empty_element
+
+
+class DomSummary:
+    '''
+    The numbers the feature extractors read off a BeautifulSoup tree,
+    collected in one pass over the parser events without building the tree.
+
+    It stands in for the soup that BeautifulSoupHTMLParser normally feeds,
+    mirroring BeautifulSoup's tree building (open tag stack, implicit pops
+    on end tags, whitespace collapsing, string container types) for the
+    html.parser backend, so every count matches the tree: tags, max depth
+    of any node, children of all tags, tags per name, hidden tags, <a href>
+    values, <script src> count, the first <body>'s strings and the
+    document's get_text(separator=' ').
+
+    Memory is the open tag stack plus one buffer per text view, never the
+    tree or a list of its strings. Only the first max_bytes bytes of the
+    page's UTF-8 are parsed (0 for no limit), which also bounds the text.
+    '''
+
+    # BeautifulSoupHTMLParser reads this when decoding character references
+    original_encoding = None
+
+    def __init__(self, html, max_bytes=None):
+        max_bytes = bp_max_bytes if max_bytes is None else max_bytes
+        self.truncated = False
+        # a character is at most 4 bytes, shorter pages cannot go over the limit
+        if max_bytes and len(html) * 4 > max_bytes:
+            data = html.encode('utf-8', errors='ignore')
+            if len(data) > max_bytes:
+                html = data[:max_bytes].decode('utf-8', errors='ignore')
+                self.truncated = True
+
+        self.total_nodes = 0
+        self.max_depth = 0
+        self.total_children = 0
+        self.tag_counts = {}
+        self.hidden_count = 0
+        self.links = []
+        self.script_srcs = []
+        self.has_body = False
+        self._text = StringIO()
+        self._body_string = StringIO()
+        self._body_text = StringIO()
+
+        # open tags as [name, is the first <body>]
+        self._stack = [[ROOT, False]]
+        self._open_counts = {}
+        self._preserve_depth = 0
+        self._containers = []
+        self._in_body = False
+        self._current_data = []
+
+        parser = BeautifulSoupHTMLParser(convert_charrefs=False)
+        parser.soup = self
+        parser.feed(html)
+        parser.close()
+        self.endData()
+        while len(self._stack) > 1:
+            self._pop()
+
+        self.text = self._text.getvalue()
+        self.body_string = self._body_string.getvalue() if self.has_body else None
+        self.body_text = self._body_text.getvalue()
+        self._text = self._body_string = self._body_text = None
+
+    def _append(self):
+        # a new node under the current top of the stack
+        depth = len(self._stack)
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if depth > 1:
+            self.total_children += 1
+
+    def _pop(self):
+        name, is_body = self._stack.pop()
+        self._open_counts[name] -= 1
+        if name in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth -= 1
+        if name in STRING_CONTAINERS:
+            self._containers.pop()
+        if is_body:
+            self._in_body = False
+
+    def handle_starttag(self, name, namespace, nsprefix, attrs, sourceline=None, sourcepos=None,
+                        namespaces=None):
+        self.endData()
+        self._append()
+        self.total_nodes += 1
+        self.tag_counts[name] = self.tag_counts.get(name, 0) + 1
+
+        style = (attrs.get('style') or '').replace(' ', '').lower()
+        if 'display:none' in style or 'visibility:hidden' in style or 'hidden' in attrs:
+            self.hidden_count += 1
+        if name == 'a' and attrs.get('href') is not None:
+            self.links.append(attrs['href'])
+        elif name == 'script' and attrs.get('src') is not None:
+            self.script_srcs.append(attrs['src'])
+
+        is_body = name == 'body' and not self.has_body
+        if is_body:
+            self.has_body = self._in_body = True
+        self._stack.append([name, is_body])
+        self._open_counts[name] = self._open_counts.get(name, 0) + 1
+        if name in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth += 1
+        if name in STRING_CONTAINERS:
+            self._containers.append(name)
+        return _Opened(name in EMPTY_ELEMENT_TAGS)
+
+    def handle_endtag(self, name, nsprefix=None):
+        self.endData()
+        if name == ROOT:
+            return
+        # like BeautifulSoup._popToTag, unmatched end tags are ignored
+        while self._open_counts.get(name) and len(self._stack) > 1:
+            popped = self._stack[-1][0]
+            self._pop()
+            if popped == name:
+                break
+
+    def handle_data(self, data):
+        self._current_data.append(data)
+
+    def endData(self, containerClass=None):
+        if not self._current_data:
+            return
+        data = ''.join(self._current_data)
+        self._current_data = []
+        if not self._preserve_depth and not data.strip(ASCII_SPACES):
+            data = '\n' if '\n' in data else ' '
+        self._append()
+
+        # get_text() keeps NavigableString and CData, not comments, doctypes,
+        # or strings typed by a script/style/template/rt/rp container
+        if containerClass is None:
+            if self._containers:
+                return
+        elif containerClass is not CData:
+            return
+        # get_text(separator=' ') and body.get_text(separator=' ', strip=True), written as they come
+        if self._text.tell():
+            self._text.write(' ')
+        self._text.write(data)
+        if self._in_body:
+            self._body_string.write(data)
+            stripped = data.strip()
+            if stripped:
+                if self._body_text.tell():
+                    self._body_text.write(' ')
+                self._body_text.write(stripped)
+
+
+PROBE = ('<!DOCTYPE html><html><head><title>t</title><script src="a.js">var a = 1;</script></head>'
+         '<body><div style="display: none"><a href="/x">a &amp; b</a><br><p>one<p>two </div>'
+         '<!-- c --><a href="y">&#169;</a></span></body></html>')
+
+
+def _stream_supported():
+    '''whether DomSummary gives the same numbers as a BeautifulSoup tree with this bs4'''
+    if BeautifulSoupHTMLParser is None:
+        return False
+    try:
+        dom = DomSummary(PROBE, max_bytes=0)
+        soup = BeautifulSoup(PROBE, 'html.parser')
+        tags = soup.find_all(True)
+        return (dom.total_nodes == len(tags)
+                and dom.hidden_count == 1
+                and dom.links == [tag['href'] for tag in soup.find_all('a')]
+                and dom.script_srcs == ['a.js']
+                and dom.text == soup.get_text(separator=' ')
+                and dom.body_string == soup.body.text)
+    except Exception:
+        return False
+
+
+STREAM_SUPPORTED = _stream_supported()
+if bp_engine == 'stream' and not STREAM_SUPPORTED:
+    print("[WARN] this bs4 does not support the stream engine, BP_ENGINE=stream falls back to the tree")
@@ -0,0 +1,159 @@
+import argparse
+import hashlib
+import json
+import pickle
+import time
+from collections import Counter
+
+from config import feature_cache_path, feature_cache_max_mb, html_parser, bp_engine, bp_max_bytes, geo_host_country
+from sqlite_store import SqliteStore
+
+# bump whenever convert_to_feature, the BeyondPhish features or the language
+# gate change what they return, every cached entry is then a miss
+EXTRACTOR_VERSION = '2'
+
+KINDS = ['row', 'bp', 'lang']
+
+
+class FeatureCache(SqliteStore):
+    '''
+    Memoized extractor outputs shared by all pool workers and runs, so a
+    rerun over an existing source_path only recomputes what changed.
+
+    Entries are keyed by a hash of the extractor version, the parser
+    settings and the inputs of the cached call (page content hash, whois
+    record, host ip, url), so a new page, a new whois record or a new
+    extractor version is simply a miss. kind separates the cached calls:
+    'row' is a whole convert_to_feature vector, 'bp' the BeyondPhish
+    vector of a page and 'lang' its language classification.
+
+    The least recently used entries are evicted once the stored values
+    go over max_mb. With enabled=False memoize just calls compute.
+
+    stats counts feature_<kind>_hit / feature_<kind>_miss / feature_evicted.
+    '''
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS features ('
+        'key TEXT PRIMARY KEY, kind TEXT, value BLOB, size INTEGER, created_at REAL, used_at REAL)',
+        'CREATE INDEX IF NOT EXISTS features_used ON features (used_at)',
+    ]
+
+    def __init__(self, path=None, max_mb=None, enabled=True, check_every=200):
+        super().__init__(path or feature_cache_path)
+        self.max_bytes = 1024 * 1024 * (max_mb if max_mb is not None else feature_cache_max_mb)
+        self.enabled = enabled
+        self.check_every = check_every
+        self._puts = 0
+        self.stats = Counter()
+
+    @staticmethod
+    def key(kind, parts):
+        blob = json.dumps([EXTRACTOR_VERSION, html_parser, bp_engine, bp_max_bytes, geo_host_country, kind, parts],
+                          sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+    def get(self, kind, parts):
+        '''cached value, None on a miss'''
+        key = self.key(kind, parts)
+        rows = self.execute('SELECT value FROM features WHERE key = ?', (key,))
+        if not rows:
+            self.stats[f'feature_{kind}_miss'] += 1
+            return None
+        self.stats[f'feature_{kind}_hit'] += 1
+        self.write('UPDATE features SET used_at = ? WHERE key = ?', (time.time(), key))
+        return pickle.loads(rows[0][0])
+
+    def put(self, kind, parts, value):
+        data = pickle.dumps(value)
+        now = time.time()
+        self.write('INSERT OR REPLACE INTO features (key, kind, value, size, created_at, used_at) '
+                   'VALUES (?, ?, ?, ?, ?, ?)', (self.key(kind, parts), kind, data, len(data), now, now))
+        self._puts += 1
+        if self._puts % self.check_every == 0:
+            self.evict()
+
+    def memoize(self, kind, parts, compute):
+        '''value of compute() for these inputs, from the cache when it was computed before'''
+        if not self.enabled:
+            return compute()
+        value = self.get(kind, parts)
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.put(kind, parts, value)
+        return value
+
+    def size(self):
+        return self.execute('SELECT COALESCE(SUM(size), 0) FROM features')[0][0]
+
+    def evict(self, max_bytes=None):
+        '''drop least recently used entries until the cache is under 90% of max_bytes'''
+        max_bytes = max_bytes if max_bytes is not None else self.max_bytes
+        excess = self.size() - max_bytes
+        if excess <= 0:
+            return 0
+        excess += max_bytes // 10
+        keys = []
+        for key, size in self.execute('SELECT key, size FROM features ORDER BY used_at'):
+            if excess <= 0:
+                break
+            keys.append((key,))
+            excess -= size
+        self.write('DELETE FROM features WHERE key = ?', keys, many=True)
+        self.stats['feature_evicted'] += len(keys)
+        return len(keys)
+
+    def invalidate(self, kind=None, older_than=None):
+        '''drop every entry, or only one kind and/or entries created more than older_than seconds ago'''
+        sql, params = 'DELETE FROM features WHERE 1 = 1', []
+        if kind is not None:
+            sql += ' AND kind = ?'
+            params.append(kind)
+        if older_than is not None:
+            sql += ' AND created_at < ?'
+            params.append(time.time() - older_than)
+        count = self.execute('SELECT COUNT(*) FROM features' + sql[len('DELETE FROM features'):], params)[0][0]
+        self.write(sql, params)
+        return count
+
+    def summary(self):
+        '''{kind: (entries, bytes)}'''
+        return {kind: (count, size) for kind, count, size in
+                self.execute('SELECT kind, COUNT(*), SUM(size) FROM features GROUP BY kind')}
+
+
+def feature_cache_report(stats):
+    '''one line summary of (merged) FeatureCache.stats'''
+    parts = []
+    hits = total = 0
+    for kind in KINDS:
+        kind_hits = stats[f'feature_{kind}_hit']
+        kind_total = kind_hits + stats[f'feature_{kind}_miss']
+        if kind_total:
+            parts.append(f"{kind} {kind_hits / kind_total:.1%}")
+        hits += kind_hits
+        total += kind_total
+    rate = hits / total if total else 0
+    return f"feature cache : {total} lookups , hit rate {rate:.1%} ({' , '.join(parts) or 'unused'}) , " \
+           f"evicted {stats['feature_evicted']}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='inspect or clear the feature cache')
+    parser.add_argument('--path', type=str, help='cache file, FEATURE_CACHE_PATH by default')
+    parser.add_argument('--invalidate', action='store_true', help='drop entries (all, or narrowed by --kind / --older_than_days)')
+    parser.add_argument('--kind', type=str, choices=KINDS, help='only entries of this kind')
+    parser.add_argument('--older_than_days', type=float, help='only entries created before this many days ago')
+    parser.add_argument('--max_mb', type=float, help='evict least recently used entries down to this size')
+    args = parser.parse_args()
+
+    cache = FeatureCache(args.path)
+    if args.invalidate:
+        older_than = args.older_than_days * 86400 if args.older_than_days is not None else None
+        print(f"dropped {cache.invalidate(args.kind, older_than)} entries")
+    if args.max_mb is not None:
+        print(f"evicted {cache.evict(int(args.max_mb * 1024 * 1024))} entries")
+    for kind, (count, size) in sorted(cache.summary().items()):
+        print(f"{kind} : {count} entries , {size / 1e6:.1f} MB")
+    cache.close()
@@ -0,0 +1,198 @@
+import json
+import os
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+# column names and dtypes, in the order convert_to_feature lays them out
+BASE_FEATURES = [
+    ('whois_guard', 'int8'),
+    ('social_instagram', 'int8'),
+    ('social_facebook', 'int8'),
+    ('social_twitter', 'int8'),
+    ('num_external_links', 'int32'),
+    ('host_domain_same', 'int8'),
+    ('num_scripts', 'int32'),
+    ('has_hyphen', 'int8'),
+    ('subdomain_dots', 'int16'),
+    ('has_digit', 'int8'),
+    ('cheap_registrar', 'int8'),
+    ('cheap_tld', 'int8'),
+    ('domain_in_text', 'int32'),
+    ('uncommon_tld', 'int8'),
+    ('total_age', 'float64'),
+]
+
+# index into the country list, -1 when unknown; expanded to one-hot blocks
+COUNTRY_FEATURES = [
+    ('country', 'int16'),
+    ('host_country', 'int16'),
+]
+
+BP_FEATURES = [
+    ('bp_total_nodes', 'int32'),
+    ('bp_dom_depth', 'int32'),
+    ('bp_branch_factor', 'float64'),
+    ('bp_script_ratio', 'float64'),
+    ('bp_input_count', 'int32'),
+    ('bp_hidden_ratio', 'float64'),
+    ('bp_redirect_count', 'int32'),
+    ('bp_eval_usage', 'int8'),
+    ('bp_suspicious_events', 'int32'),
+    ('bp_login_count', 'int32'),
+    ('bp_payment_count', 'int32'),
+]
+
+COLUMNS = BASE_FEATURES + COUNTRY_FEATURES + BP_FEATURES
+
+# per row columns that are not features (not in to_dense)
+META_COLUMNS = [
+    ('template_cluster', 'int64'),
+]
+
+COUNTRIES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'assets', 'country.json')
+
+
+def _one_hot_index(block):
+    for ind, v in enumerate(block):
+        if v:
+            return ind
+    return -1
+
+
+def split_row(x):
+    '''
+    legacy row (the [[...]] returned by convert_to_feature, or its inner list)
+    to a {column: value} dict, returns it together with the country block width
+    '''
+    if len(x) == 1 and isinstance(x[0], (list, tuple, np.ndarray)):
+        x = x[0]
+    n_base, n_bp = len(BASE_FEATURES), len(BP_FEATURES)
+    n_countries = (len(x) - n_base - n_bp) // 2
+    country_block = x[n_base:n_base + n_countries]
+    host_block = x[n_base + n_countries:n_base + 2 * n_countries]
+
+    values = dict(zip([name for name, _ in BASE_FEATURES], x[:n_base]))
+    values['country'] = _one_hot_index(country_block)
+    values['host_country'] = _one_hot_index(host_block)
+    values.update(zip([name for name, _ in BP_FEATURES], x[n_base + 2 * n_countries:]))
+    return values, n_countries
+
+
+def _countries(n_countries):
+    try:
+        with open(COUNTRIES_FILE, 'r', encoding='utf-8') as fin:
+            codes = list(json.load(fin).keys())
+        if len(codes) == n_countries:
+            return codes
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def write_feature_store(path, X, urls, clusters=None):
+    '''
+    save legacy rows as one .npy file per column plus schema.json and
+    urls.txt in directory path, returns the opened FeatureStore.
+    clusters are the template cluster ids of the rows (-1 when unknown)
+    '''
+    os.makedirs(path, exist_ok=True)
+    n_countries = 255
+    columns = {name: np.zeros(len(X), dtype=dtype) for name, dtype in COLUMNS}
+    for i, x in enumerate(X):
+        values, n_countries = split_row(x)
+        for name, value in values.items():
+            columns[name][i] = value
+    columns['template_cluster'] = np.array(clusters if clusters is not None else [-1] * len(X), dtype='int64')
+
+    for name, data in columns.items():
+        np.save(os.path.join(path, name + '.npy'), data)
+    with open(os.path.join(path, 'urls.txt'), 'w', encoding='utf-8') as fout:
+        for url in urls:
+            fout.write(url + '\n')
+
+    schema = {
+        'version': FORMAT_VERSION,
+        'rows': len(X),
+        'n_countries': n_countries,
+        'columns': [{'name': name, 'dtype': dtype} for name, dtype in COLUMNS],
+        'base': [name for name, _ in BASE_FEATURES],
+        'country': [name for name, _ in COUNTRY_FEATURES],
+        'bp': [name for name, _ in BP_FEATURES],
+        'meta_columns': [{'name': name, 'dtype': dtype} for name, dtype in META_COLUMNS],
+        'countries': _countries(n_countries),
+    }
+    # schema last, a directory without it is an unfinished write
+    with open(os.path.join(path, 'schema.json'), 'w', encoding='utf-8') as fout:
+        json.dump(schema, fout, indent=2)
+    return FeatureStore(path)
+
+
+def is_feature_store(path):
+    return os.path.isfile(os.path.join(path, 'schema.json'))
+
+
+class FeatureStore:
+    '''
+    Read side of the columnar feature format. Columns are memory-mapped on
+    first use, so selecting a few of them only touches those files.
+
+    to_dense() expands the country columns back to the one-hot blocks and
+    returns the (N, F) matrix in the legacy convert_to_feature layout.
+    Meta columns (template_cluster) are read with column() but are not
+    part of names, select() or to_dense().
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'schema.json'), 'r', encoding='utf-8') as fin:
+            self.schema = json.load(fin)
+        if self.schema['version'] != FORMAT_VERSION:
+            raise ValueError(f"unsupported feature store version {self.schema['version']}")
+        self.names = [c['name'] for c in self.schema['columns']]
+        self.meta_names = [c['name'] for c in self.schema.get('meta_columns', [])]
+        self.n_countries = self.schema['n_countries']
+        self._columns = {}
+        self._urls = None
+
+    def __len__(self):
+        return self.schema['rows']
+
+    @property
+    def urls(self):
+        if self._urls is None:
+            with open(os.path.join(self.path, 'urls.txt'), 'r', encoding='utf-8') as fin:
+                self._urls = fin.read().splitlines()
+        return self._urls
+
+    def column(self, name):
+        if name not in self._columns:
+            if name not in self.names and name not in self.meta_names:
+                raise KeyError(f"no feature column {name}")
+            self._columns[name] = np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+        return self._columns[name]
+
+    def select(self, names=None):
+        '''{name: column} for the given columns (all of them by default)'''
+        return {name: self.column(name) for name in (names or self.names)}
+
+    def to_frame(self, names=None):
+        import pandas as pd
+        df = pd.DataFrame(self.select(names))
+        df['URL'] = self.urls
+        return df
+
+    def one_hot(self, name):
+        '''(N, n_countries) one-hot block of a country column'''
+        index = np.asarray(self.column(name))
+        block = np.zeros((len(index), self.n_countries))
+        known = index >= 0
+        block[np.nonzero(known)[0], index[known]] = 1
+        return block
+
+    def to_dense(self):
+        parts = [np.column_stack([self.column(n) for n in self.schema['base']]).astype(np.float64)]
+        parts.extend(self.one_hot(name) for name in self.schema['country'])
+        parts.append(np.column_stack([self.column(n) for n in self.schema['bp']]).astype(np.float64))
+        return np.hstack(parts)
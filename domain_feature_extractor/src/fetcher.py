@@ -0,0 +1,156 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from config import static_timeout, static_concurrency
+
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36')
+
+# lowercased markers of pages that only render after javascript runs,
+# or of bot challenges that a real browser gets through
+JS_SHELL_MARKERS = [
+    'you need to enable javascript',
+    'please enable javascript',
+    'enable javascript to run this app',
+    'javascript is required',
+    'id="root"></div>',
+    'id="app"></div>',
+    'id="__next"></div>',
+    'id="__nuxt"></div>',
+    'checking your browser',
+    'just a moment...',
+    '/cdn-cgi/challenge-platform',
+]
+
+
+# marks a url whose static fetch has not run yet (None means it ran and failed)
+NOT_FETCHED = object()
+
+
+def fix_url(url):
+    if not url.startswith('http'):
+        url = 'https://' + url
+    return url
+
+
+def looks_like_js_shell(html):
+    lower_html = html.lower()
+    return any(marker in lower_html for marker in JS_SHELL_MARKERS)
+
+
+class StaticFetcher:
+    '''
+    Tier 1: plain HTTP GET through a pooled requests session, no javascript.
+    fetch returns the decoded HTML or None for errors and non-HTML answers.
+    '''
+
+    def __init__(self, timeout=None, concurrency=None, session=None):
+        self.timeout = timeout or static_timeout
+        self.concurrency = concurrency or static_concurrency
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.concurrency, pool_maxsize=self.concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'User-Agent': USER_AGENT})
+
+    def fetch(self, url):
+        try:
+            response = self.session.get(fix_url(url), timeout=self.timeout, verify=False)
+        except Exception as e:
+            print(f"[static] {url} : {e}")
+            return None
+
+        content_type = response.headers.get('Content-Type', '')
+        if response.status_code >= 400 or (content_type and 'html' not in content_type):
+            return None
+
+        # requests falls back to latin-1 when no charset is sent, pages are utf-8 far more often
+        encoding = response.encoding if 'charset' in content_type.lower() else 'utf-8'
+        try:
+            return response.content.decode(encoding, errors='replace')
+        except LookupError:
+            return response.content.decode('utf-8', errors='replace')
+
+    def fetch_many(self, urls):
+        '''fetch several pages concurrently, returns {url: html or None}'''
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            return dict(zip(urls, executor.map(self.fetch, urls)))
+
+    def close(self):
+        self.session.close()
+
+
+class TieredFetcher:
+    '''
+    Try the static fetch first and escalate to the browser only when its
+    result would not pass the content checks: at least 3000 characters,
+    not parked (is_parked), and not a javascript shell. With static=None
+every page goes straight to the browser.
+
+    stats counts where each page came from ('static', 'browser', 'failed')
+    and why pages were escalated ('escalated:<reason>').
+    '''
+
+    def __init__(self, static, browser_fetch, is_parked, min_length=3000):
+        self.static = static
+        self.browser_fetch = browser_fetch
+        self.is_parked = is_parked
+        self.min_length = min_length
+        self.stats = Counter()
+
+    def escalation_reason(self, html):
+        if html is None:
+            return 'static_failed'
+        if len(html) <= self.min_length:
+            return 'too_short'
+        if self.is_parked(html):
+            return 'parked'
+        if looks_like_js_shell(html):
+            return 'js_shell'
+        return None
+
+    def prefetch(self, urls):
+        if self.static is None or not urls:
+            return {}
+        return self.static.fetch_many(urls)
+
+    def fetch(self, url, static_html=NOT_FETCHED):
+        '''
+        static_html is an already prefetched tier 1 result, when missing
+        the static fetch runs here
+        '''
+        if self.static is not None:
+            if static_html is NOT_FETCHED:
+                with metrics.stage('static_fetch'):
+                    static_html = self.static.fetch(url)
+
+            reason = self.escalation_reason(static_html)
+            if reason is None:
+                self.stats['static'] += 1
+                metrics.current().note('tier', 'static')
+                return static_html
+            self.stats['escalated:' + reason] += 1
+
+        metrics.current().note('tier', 'browser')
+        with metrics.stage('browser_fetch'):
+            content = self.browser_fetch(url)
+        self.stats['browser' if content else 'failed'] += 1
+        return content
+
+    def close(self):
+        if self.static is not None:
+            self.static.close()
+
+
+def tier_report(stats):
+    '''one line summary of per tier hit rates'''
+    total = stats['static'] + stats['browser'] + stats['failed']
+    if total == 0:
+        return 'no pages fetched'
+    rates = ' , '.join(f"{tier} {stats[tier] / total:.1%}" for tier in ['static', 'browser', 'failed'])
+    reasons = ' , '.join(f"{k.split(':', 1)[1]} {v}" for k, v in sorted(stats.items()) if k.startswith('escalated:'))
+    return f"fetched {total} pages : {rates} | escalations : {reasons or 'none'}"
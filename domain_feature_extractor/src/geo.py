@@ -0,0 +1,89 @@
+import json
+import os
+
+import IP2Location
+
+from config import ip2location_mode
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'assets')
+
+
+class GeoService:
+    '''
+    IP geolocation and country index lookups, loaded once per process.
+
+    The IP2Location database is memory-mapped (SHARED_MEMORY mode) so that
+    pool workers forked after the parent loaded it share the same pages.
+    Country codes map to their position in assets/country.json through a
+    dict, which is the index used by the one-hot country features.
+    '''
+
+    def __init__(self, data_file=None, countries_file=None, mode=None):
+        self.data_file = data_file or os.path.join(ASSETS_DIR, 'IP2LOCATION-LITE-DB1.BIN')
+        countries_file = countries_file or os.path.join(ASSETS_DIR, 'country.json')
+
+        with open(countries_file, 'r', encoding='utf-8') as fin:
+            self.countries = list(json.load(fin).keys())
+        self.country_index = {code: ind for ind, code in enumerate(self.countries)}
+
+        self._db = self._open(mode or ip2location_mode)
+
+    def _open(self, mode):
+        try:
+            return IP2Location.IP2Location(self.data_file, mode)
+        except (OSError, ValueError) as e:
+            # mmap needs a writable file, fall back to plain reads
+            if mode == 'FILE_IO':
+                raise
+            print(f"[WARN] ip2location {mode} unavailable ({e}), using FILE_IO")
+            return IP2Location.IP2Location(self.data_file, 'FILE_IO')
+
+    def index_of(self, country_code):
+        '''position of a country code in the country vector, -1 if unknown'''
+        if not isinstance(country_code, str):
+            return -1
+        return self.country_index.get(country_code, -1)
+
+    def lookup(self, ip):
+        '''short country code of an IP address, None if it cannot be resolved'''
+        if not ip:
+            return None
+        try:
+            code = self._db.get_country_short(ip)
+        except Exception:
+            return None
+        if isinstance(code, bytes):
+            code = code.decode()
+        # the database answers '-' or an error message instead of raising
+        if not code or len(code) != 2:
+            return None
+        return code
+
+    def lookup_many(self, ips):
+        '''batch version of lookup, duplicate IPs are looked up once'''
+        seen = {}
+        for ip in ips:
+            if ip not in seen:
+                seen[ip] = self.lookup(ip)
+        return [seen[ip] for ip in ips]
+
+    def close(self):
+        self._db.close()
+
+
+_service = None
+
+
+def get_geo_service():
+    global _service
+    if _service is None:
+        _service = GeoService()
+    return _service
+
+
+def init_worker():
+    '''
+    Pool initializer. With the fork start method the service loaded by the
+    parent is inherited as is, otherwise each worker loads it once here.
+    '''
+    get_geo_service()
@@ -0,0 +1,109 @@
+import re
+
+# the only non-ascii characters re.IGNORECASE lets match ascii letters
+_IGNORECASE_FOLD = str.maketrans({'İ': 'i', 'ı': 'i', 'ſ': 's', 'K': 'k'})
+
+_SPECIAL = set('.^$*+?{}[]|()')
+
+
+def fold_case(s, lowered=None):
+    '''
+    lowercase s so that lowercase ascii patterns match it exactly where
+    re.IGNORECASE would match s, lowered is an already computed s.lower()
+    '''
+    if s.isascii() or not any(c in s for c in 'İıſK'):
+        return lowered if lowered is not None else s.lower()
+    return s.translate(_IGNORECASE_FOLD).lower()
+
+
+def _literal_prefix(pattern):
+    '''leading literal text every match of pattern starts with, and whether that is all of it'''
+    if '|' in re.sub(r'\\.', '', pattern):
+        return '', False
+    prefix = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            if i + 1 >= len(pattern) or pattern[i + 1].isalnum():
+                break
+            c, step = pattern[i + 1], 2
+        elif c in _SPECIAL:
+            break
+        else:
+            step = 1
+        if pattern[i + step:i + step + 1] in ('*', '?', '{'):
+            # optional last character, not part of the prefix
+            return ''.join(prefix), False
+        prefix.append(c)
+        i += step
+    return ''.join(prefix), i == len(pattern)
+
+
+class KeywordScanner:
+    '''
+    Counts or finds a fixed list of regex patterns in a string, compiled
+    once per process (the scanners are module constants).
+
+    Results are the same as running re.findall / str.count per pattern,
+    but no pattern is run through the regex engine position by position:
+    plain literals use str.count / str.find, and every other pattern is
+    only tried with re.match where str.find locates its leading literal.
+    A single alternation over all patterns is slower than this on CPython,
+    and on the full html of a page the parked check alone went from
+    ~330 ms to ~15 ms this way (see benchmarks/keyword_scan.py).
+    '''
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._plans = []
+        for pattern in self.patterns:
+            anchor, literal = _literal_prefix(pattern)
+            regex = None if literal else re.compile(pattern)
+            self._plans.append((anchor, regex))
+
+    @staticmethod
+    def _matches(s, anchor, regex):
+        '''non-overlapping matches of one pattern, left to right, like finditer'''
+        if not anchor:
+            yield from (m.group() for m in regex.finditer(s))
+            return
+        start = s.find(anchor)
+        while start != -1:
+            if regex is None:
+                yield anchor
+                start = s.find(anchor, start + len(anchor))
+                continue
+            m = regex.match(s, start)
+            if m is None:
+                start = s.find(anchor, start + 1)
+            else:
+                yield m.group()
+                start = s.find(anchor, max(m.end(), start + 1))
+
+    def counts(self, s):
+        '''number of matches per pattern, in pattern order'''
+        out = []
+        for anchor, regex in self._plans:
+            if regex is None:
+                out.append(s.count(anchor))
+            else:
+                out.append(sum(1 for _ in self._matches(s, anchor, regex)))
+        return out
+
+    def total(self, s):
+        return sum(self.counts(s))
+
+    def any(self, s):
+        '''True as soon as one pattern matches'''
+        for anchor, regex in self._plans:
+            if regex is None:
+                if anchor in s:
+                    return True
+            elif next(self._matches(s, anchor, regex), None) is not None:
+                return True
+        return False
+
+    def first(self, s):
+        '''first match of each pattern (None when absent), in pattern order'''
+        return [next(self._matches(s, anchor, regex), None) for anchor, regex in self._plans]
@@ -0,0 +1,107 @@
+import html as html_lib
+import re
+from collections import Counter
+
+from config import lang_sample_chars, lang_min_confidence, lang_head_chars
+from parsed_page import ParsedPage
+
+TITLE_RE = re.compile(r'<title[^>]*>(.*?)</title', re.IGNORECASE | re.DOTALL)
+META_RE = re.compile(r'<meta\s[^>]*>', re.IGNORECASE)
+ATTR_RE = re.compile(r'''([a-zA-Z:_-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))''')
+# meta tags whose content is text written for people
+META_NAMES = {'description', 'keywords', 'og:title', 'og:description', 'twitter:title', 'twitter:description'}
+
+_identifier = None
+
+
+def get_identifier():
+    '''langid model with normalized probabilities, loaded once per process'''
+    global _identifier
+    if _identifier is None:
+        from langid.langid import LanguageIdentifier, model
+        _identifier = LanguageIdentifier.from_modelstring(model, norm_probs=True)
+    return _identifier
+
+
+def head_text(html, limit=None):
+    '''title and descriptive meta contents, looked for in the first limit characters'''
+    head = html[:limit or lang_head_chars]
+    end = head.lower().find('</head')
+    if end != -1:
+        head = head[:end]
+
+    parts = []
+    title = TITLE_RE.search(head)
+    if title:
+        parts.append(title.group(1))
+    for tag in META_RE.findall(head):
+        attrs = {m.group(1).lower(): m.group(2) or m.group(3) or m.group(4) or '' for m in ATTR_RE.finditer(tag)}
+        name = (attrs.get('name') or attrs.get('property') or '').lower()
+        if name in META_NAMES and attrs.get('content'):
+            parts.append(attrs['content'])
+    return html_lib.unescape(' '.join(p.strip() for p in parts))
+
+
+class LanguageGate:
+    '''
+    Decides whether a page is in one of the selected languages without
+    running langid over the whole page: it classifies the title, the
+    descriptive meta tags and the first sample_chars of visible body text,
+    and only falls back to the full body text when that sample is
+    classified with less than min_confidence probability.
+
+    With a FeatureCache the classification of a page is memoized by its
+    content hash, so only new pages are sampled.
+
+    stats counts lang_sampled / lang_escalated / lang_rejected.
+    '''
+
+    def __init__(self, langs, sample_chars=None, min_confidence=None, cache=None):
+        self.langs = set(langs)
+        self.sample_chars = sample_chars or lang_sample_chars
+        self.min_confidence = min_confidence if min_confidence is not None else lang_min_confidence
+        self.identifier = get_identifier()
+        self.cache = cache
+        self.stats = Counter()
+
+    def sample(self, page):
+        page = ParsedPage.wrap(page)
+        return (head_text(page.html) + ' ' + page.body_text[:self.sample_chars]).strip()
+
+    def classify(self, page):
+        '''(language, probability) of a page source or ParsedPage'''
+        page = ParsedPage.wrap(page)
+        if self.cache is None:
+            return self._classify(page)
+        parts = [page.content_hash, self.sample_chars, self.min_confidence, lang_head_chars]
+        return tuple(self.cache.memoize('lang', parts, lambda: self._classify(page)))
+
+    def _classify(self, page):
+        self.stats['lang_sampled'] += 1
+        language, prob = self.identifier.classify(self.sample(page))
+        if prob < self.min_confidence and len(page.body_text) > self.sample_chars:
+            self.stats['lang_escalated'] += 1
+            language, prob = self.identifier.classify(page.body_text)
+        return language, prob
+
+    def accept(self, page):
+        language, _ = self.classify(page)
+        if language in self.langs:
+            return True
+        self.stats['lang_rejected'] += 1
+        return False
+
+    def classify_many(self, pages):
+        '''[(language, probability)] for a batch of page sources or ParsedPages'''
+        return [self.classify(page) for page in pages]
+
+    def accept_many(self, pages):
+        return [self.accept(page) for page in pages]
+
+
+def language_report(stats):
+    '''one line summary of (merged) LanguageGate.stats'''
+    sampled = stats['lang_sampled']
+    rate = stats['lang_escalated'] / sampled if sampled else 0
+    return f"language : {sampled} pages , escalated to full text {rate:.1%} , " \
+           f"rejected {stats['lang_rejected']}"
@@ -0,0 +1,281 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+from scheduler import percentile
+
+_local = threading.local()
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, record, name):
+        self.record = record
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.record.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class DomainRecord:
+    '''
+    Stage durations, counters and outcome of one domain. A stage that runs
+    more than once adds up; stages on different threads (whois, dns, page)
+    overlap in time, so they do not sum to the total.
+    '''
+
+    def __init__(self, url, worker):
+        self.url = url
+        self.worker = worker
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.stages = {}
+        self.counts = Counter()
+        self.notes = {}
+        self.outcome = None
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0) + seconds
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+    def note(self, name, value):
+        self.notes[name] = value
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def run(self, name, fn, *args):
+        '''fn(*args) timed as stage name, with this record current on the calling thread'''
+        previous = getattr(_local, 'record', None)
+        _local.record = self
+        try:
+            with self.stage(name):
+                return fn(*args)
+        finally:
+            _local.record = previous
+
+    def __enter__(self):
+        self._previous = getattr(_local, 'record', None)
+        _local.record = self
+        return self
+
+    def __exit__(self, *exc):
+        _local.record = self._previous
+        return False
+
+    def to_dict(self):
+        return {
+            'url': self.url,
+            'worker': self.worker,
+            'started': round(self.started, 3),
+            'seconds': round(time.perf_counter() - self._start, 4),
+            'outcome': self.outcome,
+            'stages': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            'counts': dict(self.counts),
+            **self.notes,
+        }
+
+
+class _NullRecord:
+    outcome = None
+
+    def add(self, name, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def note(self, name, value):
+        pass
+
+    def stage(self, name):
+        return NULL_STAGE
+
+    def run(self, name, fn, *args):
+        return fn(*args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_RECORD = _NullRecord()
+
+
+def current():
+    '''record of the domain being crawled on this thread, a no-op record outside of one'''
+    return getattr(_local, 'record', None) or NULL_RECORD
+
+
+def stage(name):
+    '''time a block as a stage of the current domain (no-op when metrics are off)'''
+    record = getattr(_local, 'record', None)
+    if record is None:
+        return NULL_STAGE
+    return record.stage(name)
+
+
+def count(name, n=1):
+    record = getattr(_local, 'record', None)
+    if record is not None:
+        record.count(name, n)
+
+
+class Metrics:
+    '''
+    Per domain instrumentation of a crawler worker. start(url) returns the
+    domain's record; code deeper down (fetcher, get_source,
+    convert_to_feature) reaches it through metrics.stage / metrics.count on
+    the thread the record was made current on. Finished records pile up in
+    records until the worker drains them.
+
+    With enabled=False start returns a shared no-op record and nothing is
+    timed or kept.
+    '''
+
+    def __init__(self, worker, enabled=True):
+        self.worker = worker
+        self.enabled = enabled
+        self.records = []
+
+    def start(self, url):
+        if not self.enabled:
+            return NULL_RECORD
+        return DomainRecord(url, self.worker)
+
+    def finish(self, record, outcome):
+        if record is NULL_RECORD:
+            return
+        record.outcome = outcome
+        self.records.append(record.to_dict())
+
+
+class MetricsWriter:
+    '''appends the drained records of every worker to a JSONL file and summarizes them as they pass'''
+
+    def __init__(self, path):
+        self.path = path
+        self.totals = MetricsSummary()
+        self._fout = open(path, 'a', encoding='utf-8')
+
+    def add(self, records):
+        for record in records:
+            self._fout.write(json.dumps(record) + '\n')
+            self.totals.add(record)
+        self._fout.flush()
+
+    def close(self):
+        self._fout.close()
+
+    def summary(self):
+        return self.totals.summary()
+
+
+class MetricsSummary:
+    '''
+    Running aggregates of domain records, so a long run does not keep every
+    record in memory. Counts, totals and per worker spans are exact; the
+    stage percentiles come from a reservoir of at most sample_size seconds
+    per stage, exact below that.
+    '''
+
+    def __init__(self, sample_size=10000, seed=0):
+        self.sample_size = sample_size
+        self.random = random.Random(seed)
+        self.domains = 0
+        self.outcomes = Counter()
+        self.counts = Counter()
+        # stage : [count, total seconds, sample]
+        self.stages = {}
+        # worker : [domains, first start, last end]
+        self.spans = {}
+
+    def add(self, record):
+        self.domains += 1
+        self.outcomes[record['outcome']] += 1
+        self.counts.update(record['counts'])
+        for name, seconds in record['stages'].items():
+            stage = self.stages.setdefault(name, [0, 0.0, []])
+            stage[0] += 1
+            stage[1] += seconds
+            if len(stage[2]) < self.sample_size:
+                stage[2].append(seconds)
+            else:
+                # reservoir sampling, every value seen so far is kept with the same probability
+                slot = self.random.randrange(stage[0])
+                if slot < self.sample_size:
+                    stage[2][slot] = seconds
+        start, end = record['started'], record['started'] + record['seconds']
+        span = self.spans.get(record['worker'])
+        if span is None:
+            self.spans[record['worker']] = [1, start, end]
+        else:
+            span[0] += 1
+            span[1] = min(span[1], start)
+            span[2] = max(span[2], end)
+
+    def summary(self):
+        '''outcome counts, p50/p95/p99 seconds per stage and domains per second per worker'''
+        workers = {}
+        for worker, (domains, start, end) in self.spans.items():
+            elapsed = end - start
+            workers[str(worker)] = {'domains': domains,
+                                    'domains_per_s': round(domains / elapsed, 3) if elapsed > 0 else None}
+        return {
+            'domains': self.domains,
+            'outcomes': dict(self.outcomes),
+            'stages': {name: {'count': count,
+                              'total': round(total, 3),
+                              'p50': round(percentile(sample, 0.5), 4),
+                              'p95': round(percentile(sample, 0.95), 4),
+                              'p99': round(percentile(sample, 0.99), 4)}
+                       for name, (count, total, sample) in sorted(self.stages.items())},
+            'counts': dict(self.counts),
+            'workers': workers,
+        }
+
+
+def summarize(records):
+    '''outcome counts, p50/p95/p99 seconds per stage and domains per second per worker'''
+    totals = MetricsSummary()
+    for record in records:
+        totals.add(record)
+    return totals.summary()
+
+
+def metrics_report(summary):
+    '''a few lines of text from summarize()'''
+    lines = [f"metrics : {summary['domains']} domains , outcomes "
+             + ' , '.join(f"{k} {v}" for k, v in sorted(summary['outcomes'].items(), key=lambda kv: -kv[1]))]
+    for name, s in sorted(summary['stages'].items(), key=lambda kv: -kv[1]['total']):
+        lines.append(f"  {name:<14} n {s['count']:<6} p50 {s['p50']:.3f}s , p95 {s['p95']:.3f}s , "
+                     f"p99 {s['p99']:.3f}s , total {s['total']:.1f}s")
+    rates = [w['domains_per_s'] for w in summary['workers'].values() if w['domains_per_s']]
+    if rates:
+        lines.append(f"  {len(summary['workers'])} workers , {sum(rates):.2f} domains/s together , "
+                     f"{min(rates):.2f} - {max(rates):.2f} domains/s each")
+    return '\n'.join(lines)
@@ -0,0 +1,189 @@
+import argparse
+import hashlib
+import mmap
+import os
+import threading
+import time
+import zlib
+
+from sqlite_store import SqliteStore
+
+
+def page_key(url):
+    '''the name a page is stored under, same as the old <key>.html file names'''
+    return url.replace('/', '').replace('?', '').replace('!', '').replace('@', '').replace(':', '')
+
+
+class PageStore(SqliteStore):
+    '''
+    Page sources under one directory, shared by the crawler workers and
+    every reader of crawled pages (extractor, shop classifier, dataset).
+
+    Pages are zlib compressed and stored once per distinct content
+    (sha256), appended to segment files that each process writes on its
+    own, and read back through mmap. index.sqlite maps (key, fetched_at)
+    to the blob, so refetches keep their history and get() returns the
+    newest one.
+
+    Pages cached the old way, as <key>.html files in the same directory,
+    are still found by get/has/keys, so existing directories keep working.
+    '''
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS blobs ('
+        'hash TEXT PRIMARY KEY, segment TEXT, offset INTEGER, length INTEGER, raw_length INTEGER)',
+        'CREATE TABLE IF NOT EXISTS pages ('
+        'key TEXT, fetched_at REAL, hash TEXT, PRIMARY KEY (key, fetched_at))',
+    ]
+
+    def __init__(self, root, level=6, segment_bytes=256 * 1024 * 1024):
+        self.root = root
+        self.segment_dir = os.path.join(root, 'segments')
+        super().__init__(os.path.join(root, 'index.sqlite'))
+        self.level = level
+        self.segment_bytes = segment_bytes
+        self._segment = None
+        self._segment_pid = None
+        self._maps = {}
+        self._write_lock = threading.Lock()
+        self._map_lock = threading.Lock()
+
+    # --- writing ---
+
+    def _open_segment(self):
+        os.makedirs(self.segment_dir, exist_ok=True)
+        name = f"{os.getpid()}-{time.time_ns()}.seg"
+        self._segment = (name, open(os.path.join(self.segment_dir, name), 'ab'))
+        self._segment_pid = os.getpid()
+
+    def _append(self, data):
+        # one open segment per process, a new one once it is full
+        if self._segment is None or self._segment_pid != os.getpid():
+            self._open_segment()
+        elif self._segment[1].tell() >= self.segment_bytes:
+            self._segment[1].close()
+            self._open_segment()
+        name, fout = self._segment
+        offset = fout.tell()
+        fout.write(data)
+        fout.flush()
+        return name, offset
+
+    def put(self, url, html, fetched_at=None):
+        '''store a page source, returns its content hash'''
+        raw = html.encode('utf-8', errors='ignore')
+        digest = hashlib.sha256(raw).hexdigest()
+        with self._write_lock:
+            if not self.execute('SELECT 1 FROM blobs WHERE hash = ?', (digest,)):
+                data = zlib.compress(raw, self.level)
+                name, offset = self._append(data)
+                self.write('INSERT OR IGNORE INTO blobs (hash, segment, offset, length, raw_length) '
+                           'VALUES (?, ?, ?, ?, ?)', (digest, name, offset, len(data), len(raw)))
+            self.write('INSERT OR REPLACE INTO pages (key, fetched_at, hash) VALUES (?, ?, ?)',
+                       (page_key(url), fetched_at or time.time(), digest))
+        return digest
+
+    # --- reading ---
+
+    def _query(self, sql, params=()):
+        # readers never create an index in a directory that only has .html files
+        if not os.path.exists(self.path):
+            return []
+        return self.execute(sql, params)
+
+    def _read(self, segment, offset, length):
+        with self._map_lock:
+            mm = self._maps.get(segment)
+            if mm is None or offset + length > len(mm):
+                # segments grow while they are written, map again past the end
+                if mm is not None:
+                    mm.close()
+                with open(os.path.join(self.segment_dir, segment), 'rb') as fin:
+                    mm = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[segment] = mm
+            return mm[offset:offset + length]
+
+    def blob(self, digest):
+        rows = self._query('SELECT segment, offset, length FROM blobs WHERE hash = ?', (digest,))
+        if not rows:
+            return None
+        return zlib.decompress(self._read(*rows[0])).decode('utf-8')
+
+    def _legacy_file(self, url):
+        return os.path.join(self.root, page_key(url) + '.html')
+
+    def content_hash(self, url, before=None):
+        '''hash of the newest stored fetch of url (at or before a time), None if never stored'''
+        rows = self._query('SELECT hash FROM pages WHERE key = ? AND fetched_at <= ? '
+                            'ORDER BY fetched_at DESC LIMIT 1', (page_key(url), before or float('inf')))
+        return rows[0][0] if rows else None
+
+    def get(self, url, before=None):
+        '''newest page source of url (at or before a time), None when it was never stored'''
+        digest = self.content_hash(url, before)
+        if digest is not None:
+            return self.blob(digest)
+        fpath = self._legacy_file(url)
+        if before is None and os.path.exists(fpath):
+            with open(fpath, 'r', encoding='utf-8', errors='ignore') as fin:
+                return fin.read()
+        return None
+
+    def has(self, url):
+        return bool(self._query('SELECT 1 FROM pages WHERE key = ? LIMIT 1', (page_key(url),))) \
+            or os.path.exists(self._legacy_file(url))
+
+    def history(self, url):
+        '''[(fetched_at, hash)] of every stored fetch of url, oldest first'''
+        return self._query('SELECT fetched_at, hash FROM pages WHERE key = ? ORDER BY fetched_at',
+                            (page_key(url),))
+
+    def keys(self):
+        '''every stored page key, packed or legacy'''
+        keys = {row[0] for row in self._query('SELECT DISTINCT key FROM pages')}
+        if os.path.isdir(self.root):
+            keys.update(f[:-len('.html')] for f in os.listdir(self.root) if f.endswith('.html'))
+        return sorted(keys)
+
+    def stats(self):
+        rows = self._query(
+            'SELECT (SELECT COUNT(*) FROM pages), COUNT(*), COALESCE(SUM(raw_length), 0), '
+            'COALESCE(SUM(length), 0) FROM blobs')
+        pages, blobs, raw, stored = rows[0] if rows else (0, 0, 0, 0)
+        return {'pages': pages, 'blobs': blobs, 'raw_bytes': raw, 'stored_bytes': stored}
+
+    def close(self):
+        for mm in self._maps.values():
+            mm.close()
+        self._maps = {}
+        if self._segment is not None and self._segment_pid == os.getpid():
+            self._segment[1].close()
+        self._segment = None
+        super().close()
+
+
+def import_html_dir(store, directory):
+    '''pack every <key>.html file of a directory into store, returns the number of pages'''
+    count = 0
+    for fname in sorted(os.listdir(directory)):
+        if not fname.endswith('.html'):
+            continue
+        fpath = os.path.join(directory, fname)
+        with open(fpath, 'r', encoding='utf-8', errors='ignore') as fin:
+            store.put(fname[:-len('.html')], fin.read(), os.path.getmtime(fpath))
+        count += 1
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='pack a directory of cached .html pages into a page store')
+    parser.add_argument('--import_dir', type=str, required=True, help='directory of <url>.html files')
+    parser.add_argument('--store', type=str, required=True, help='page store directory')
+    args = parser.parse_args()
+
+    store = PageStore(args.store)
+    print(f"imported {import_html_dir(store, args.import_dir)} pages")
+    stats = store.stats()
+    print(f"{stats['pages']} pages , {stats['blobs']} distinct , {stats['raw_bytes'] / 1e6:.1f} MB raw , "
+          f"{stats['stored_bytes'] / 1e6:.1f} MB stored")
+    store.close()
@@ -0,0 +1,64 @@
+import time
+
+from config import page_settle_budget, page_quiet_ms
+
+# Installs a MutationObserver on first call and reports when the DOM and
+# the network (finished resource timings) last changed, in page time.
+_SETTLE_JS = '''
+if (!window.__smSettle) {
+    window.__smSettle = {last: performance.now()};
+    try {
+        performance.setResourceTimingBufferSize(2000);
+        new MutationObserver(function () { window.__smSettle.last = performance.now(); })
+            .observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+    } catch (e) {}
+}
+var res = performance.getEntriesByType('resource');
+var lastNet = 0;
+for (var i = 0; i < res.length; i++) {
+    if (res[i].responseEnd > lastNet) { lastNet = res[i].responseEnd; }
+}
+return {ready: document.readyState, now: performance.now(),
+        mutation: window.__smSettle.last, network: lastNet};
+'''
+
+
+class PageWaiter:
+    '''
+    Waits until a loaded page has settled instead of sleeping a fixed time.
+
+    A page is settled once document.readyState is complete and neither the
+    DOM nor the network changed for quiet_ms. The wait never exceeds
+    budget seconds. Every wait is kept in self.records as
+    (url, seconds, reason) so budgets can be tuned from real runs.
+    '''
+
+    def __init__(self, budget=None, quiet_ms=None, poll=0.1):
+        self.budget = budget if budget is not None else page_settle_budget
+        self.quiet_ms = quiet_ms if quiet_ms is not None else page_quiet_ms
+        self.poll = poll
+        self.records = []
+
+    def wait(self, driver, url=None):
+        start = time.time()
+        reason = 'budget'
+        while True:
+            try:
+                state = driver.execute_script(_SETTLE_JS)
+            except Exception as e:
+                print(f"[WARN] settle check failed for {url}: {e}")
+                reason = 'error'
+                break
+
+            quiet_dom = state['now'] - state['mutation'] >= self.quiet_ms
+            quiet_net = state['now'] - state['network'] >= self.quiet_ms
+            if state['ready'] == 'complete' and quiet_dom and quiet_net:
+                reason = 'settled'
+                break
+            if time.time() - start >= self.budget:
+                break
+            time.sleep(self.poll)
+
+        elapsed = time.time() - start
+        self.records.append((url, round(elapsed, 3), reason))
+        return elapsed, reason
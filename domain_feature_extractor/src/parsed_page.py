@@ -0,0 +1,129 @@
+import hashlib
+
+from bs4 import BeautifulSoup
+
+from config import html_parser, bp_engine
+from dom_stream import DomSummary, STREAM_SUPPORTED
+
+
+class ParsedPage:
+    '''
+    Parse a page source once and share it across every feature extractor.
+    All views (tag lists, links, text, lowercased html) are computed lazily
+    from the same tree and cached on first access.
+
+    html.parser is the default backend because the feature vectors were
+    built against it; 'lxml' is faster but repairs broken markup differently
+    and can shift the DOM counts on some pages.
+
+    With engine='stream' (BP_ENGINE) the views the feature extractors use
+    (links, scripts, body and page text, BeyondPhish DOM counts) come from
+    one DomSummary pass over the html.parser events and the tree is never
+    built; soup/all_tags/tags still parse on demand if something asks.
+    Pages use the tree when the installed bs4 cannot drive DomSummary.
+    '''
+
+    def __init__(self, html, parser=None, engine=None):
+        self.html = html
+        self.parser = parser or html_parser
+        self.engine = engine or bp_engine
+        if self.engine == 'stream' and not STREAM_SUPPORTED:
+            self.engine = 'tree'
+        self._dom = None
+        self._soup = None
+        self._lower_html = None
+        self._all_tags = None
+        self._tags_by_name = None
+        self._body_text = None
+        self._text = None
+        self._content_hash = None
+
+    @classmethod
+    def wrap(cls, page):
+        # accept either a raw page source or an already parsed page
+        if isinstance(page, cls):
+            return page
+        return cls(page)
+
+    @property
+    def soup(self):
+        if self._soup is None:
+            self._soup = BeautifulSoup(self.html, self.parser)
+        return self._soup
+
+    @property
+    def dom(self):
+        if self._dom is None:
+            self._dom = DomSummary(self.html)
+        return self._dom
+
+    @property
+    def content_hash(self):
+        # sha256 of the page source, the same digest the page store keys content by
+        if self._content_hash is None:
+            self._content_hash = hashlib.sha256(self.html.encode('utf-8', errors='ignore')).hexdigest()
+        return self._content_hash
+
+    @property
+    def lower_html(self):
+        if self._lower_html is None:
+            self._lower_html = self.html.lower()
+        return self._lower_html
+
+    @property
+    def body(self):
+        return self.soup.body
+
+    @property
+    def all_tags(self):
+        if self._all_tags is None:
+            self._all_tags = self.soup.find_all(True)
+        return self._all_tags
+
+    def tags(self, name):
+        if self._tags_by_name is None:
+            self._tags_by_name = {}
+            for tag in self.all_tags:
+                self._tags_by_name.setdefault(tag.name, []).append(tag)
+        return self._tags_by_name.get(name, [])
+
+    @property
+    def links(self):
+        if self.engine == 'stream':
+            return self.dom.links
+        return [tag['href'] for tag in self.tags('a') if tag.get('href') is not None]
+
+    @property
+    def scripts(self):
+        # src of every external script
+        if self.engine == 'stream':
+            return self.dom.script_srcs
+        return [tag['src'] for tag in self.tags('script') if tag.get('src') is not None]
+
+    @property
+    def body_string(self):
+        # body.text, None when the page has no body
+        if self.engine == 'stream':
+            return self.dom.body_string
+        return self.body.text if self.body is not None else None
+
+    @property
+    def body_text(self):
+        # visible body text, whitespace-normalised (used for language detection)
+        if self._body_text is None:
+            if self.engine == 'stream':
+                self._body_text = self.dom.body_text
+            else:
+                body = self.body
+                self._body_text = body.get_text(separator=' ', strip=True) if body else ''
+        return self._body_text
+
+    @property
+    def text(self):
+        # every string in the document, as used by the BeyondPhish text features
+        if self._text is None:
+            if self.engine == 'stream':
+                self._text = self.dom.text
+            else:
+                self._text = self.soup.get_text(separator=' ')
+        return self._text
@@ -0,0 +1,104 @@
+import ipaddress
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import dns.exception
+import dns.resolver
+
+from config import dns_cache_path, dns_ttl_seconds, dns_negative_ttl_seconds, dns_timeout, dns_concurrency
+from sqlite_store import SqliteStore
+
+
+class Resolver(SqliteStore):
+    '''
+    A-record resolution with a per-query timeout and a TTL cache on disk
+    shared by all workers. Unresolvable hosts are cached for the shorter
+    negative_ttl. resolve_many resolves a batch on a thread pool, which is
+    also how the whole input list can be resolved before crawling.
+
+    nameservers/port point the resolver at a specific (e.g. local stub)
+    server instead of the system configuration.
+
+    stats counts dns_hit / dns_miss / dns_timeout / dns_fail.
+    '''
+
+    SCHEMA = ['CREATE TABLE IF NOT EXISTS dns ('
+              'host TEXT PRIMARY KEY, ip TEXT, expires_at REAL)']
+
+    def __init__(self, path=None, ttl=None, negative_ttl=None, timeout=None, concurrency=None,
+                 nameservers=None, port=53):
+        super().__init__(path or dns_cache_path)
+        self.ttl = ttl if ttl is not None else dns_ttl_seconds
+        self.negative_ttl = negative_ttl if negative_ttl is not None else dns_negative_ttl_seconds
+        self.timeout = timeout or dns_timeout
+        self.concurrency = concurrency or dns_concurrency
+        self.stats = Counter()
+
+        self._dns = dns.resolver.Resolver(configure=nameservers is None)
+        if nameservers is not None:
+            self._dns.nameservers = list(nameservers)
+            self._dns.port = port
+        self._dns.lifetime = self.timeout
+
+    def cached(self, host):
+        '''cached address ('' for a cached failure), None when missing or expired'''
+        rows = self.execute('SELECT ip, expires_at FROM dns WHERE host = ?', (host,))
+        if not rows or rows[0][1] < time.time():
+            return None
+        return rows[0][0]
+
+    def query(self, host):
+        '''ask the nameserver, returns the first A record or ''.'''
+        try:
+            answer = self._dns.resolve(host, 'A', lifetime=self.timeout)
+            return answer[0].to_text()
+        except dns.exception.Timeout:
+            self.stats['dns_timeout'] += 1
+        except Exception:
+            self.stats['dns_fail'] += 1
+        return ''
+
+    def resolve(self, host):
+        '''IPv4 address of host, '' when it does not resolve'''
+        try:
+            # literal addresses resolve to themselves, like gethostbyname
+            return str(ipaddress.IPv4Address(host))
+        except ValueError:
+            pass
+
+        ip = self.cached(host)
+        if ip is not None:
+            self.stats['dns_hit'] += 1
+            return ip
+
+        self.stats['dns_miss'] += 1
+        ip = self.query(host)
+        ttl = self.ttl if ip else self.negative_ttl
+        self.write('INSERT OR REPLACE INTO dns (host, ip, expires_at) VALUES (?, ?, ?)',
+                   (host, ip, time.time() + ttl))
+        return ip
+
+    def resolve_many(self, hosts):
+        '''resolve a batch of hosts concurrently, returns {host: ip or ''}'''
+        hosts = list(dict.fromkeys(hosts))
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            return dict(zip(hosts, executor.map(self.resolve, hosts)))
+
+
+_resolver = None
+
+
+def get_resolver():
+    global _resolver
+    if _resolver is None:
+        _resolver = Resolver()
+    return _resolver
+
+
+def dns_report(stats):
+    '''one line summary of (merged) Resolver.stats'''
+    total = stats['dns_hit'] + stats['dns_miss']
+    rate = stats['dns_hit'] / total if total else 0
+    return f"dns cache : {total} lookups , hit rate {rate:.1%} , " \
+           f"timeouts {stats['dns_timeout']} , failures {stats['dns_fail']}"
@@ -0,0 +1,127 @@
+import time
+
+
+def percentile(values, q):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+class Scheduler:
+    '''
+    Hands tasks to a multiprocessing pool a few at a time instead of
+    splitting the whole list up front, so a slow domain only delays its
+    own task and idle workers keep pulling new ones.
+
+    At most max_in_flight tasks (one per worker) are submitted at once, less
+    one for every abandoned task still running, so a submitted task starts
+    right away and its deadline clock runs from when a worker takes it. A
+    task that has not finished task_deadline seconds after submission is
+    given up on (its worker may be hung or dead) and reported with reason
+    'deadline'; the rest of the run carries on with the remaining workers.
+    A worker process that died is replaced by the pool while its task
+    never finishes, so every worker seen to disappear gives one abandoned
+    task's slot back.
+
+    tasks can be a lazy iterator (e.g. leases from a work queue), it is only
+    advanced when there is room; a None from it means no task is available
+    yet and it is asked again on the next round.
+    '''
+
+    def __init__(self, pool, func, task_deadline, max_in_flight, poll=0.05):
+        self.pool = pool
+        self.func = func
+        self.task_deadline = task_deadline
+        self.max_in_flight = max_in_flight
+        self.poll = poll
+        self.task_times = []
+        self.abandoned = 0
+        self.errors = 0
+        # results of abandoned tasks, their workers are busy until these are ready
+        self.stuck = []
+        # worker processes seen to exit, each one took an unfinished task with it
+        self.dead_workers = 0
+        self._pids = self._worker_pids()
+
+    def _worker_pids(self):
+        return {process.pid for process in getattr(self.pool, '_pool', []) if process.is_alive()}
+
+    def free_workers(self):
+        pids = self._worker_pids()
+        self.dead_workers += len(self._pids - pids)
+        self._pids = pids
+        self.stuck = [result for result in self.stuck if not result.ready()]
+        return self.max_in_flight - max(0, len(self.stuck) - self.dead_workers)
+
+    def run(self, tasks):
+        '''
+        yields (task, result, None) or (task, None, reason) as tasks finish.
+
+        Once every worker is held by an abandoned task the run stops. The
+        rest of a list of tasks is reported with reason 'no workers'; a lazy
+        source is not advanced any further, so nothing more is taken from
+        e.g. a work queue that other instances can still work through.
+        '''
+        listed = isinstance(tasks, (list, tuple))
+        tasks = iter(tasks)
+        exhausted = False
+        in_flight = []
+        while not exhausted or in_flight:
+            if not exhausted and not in_flight and self.free_workers() <= 0:
+                print("[WARN] every worker is stuck on an abandoned task, giving up the remaining tasks")
+                if listed:
+                    for task in tasks:
+                        yield task, None, 'no workers'
+                return
+            while not exhausted and len(in_flight) < self.free_workers():
+                task = next(tasks, StopIteration)
+                if task is StopIteration:
+                    exhausted = True
+                    break
+                if task is None:
+                    break
+                in_flight.append((task, self.pool.apply_async(self.func, (task,)), time.time()))
+
+            still_running = []
+            for task, result, submitted in in_flight:
+                elapsed = time.time() - submitted
+                if result.ready():
+                    self.task_times.append(elapsed)
+                    try:
+                        yield task, result.get(), None
+                    except Exception as e:
+                        self.errors += 1
+                        yield task, None, f'error: {e}'
+                elif elapsed > self.task_deadline:
+                    self.abandoned += 1
+                    self.stuck.append(result)
+                    yield task, None, 'deadline'
+                else:
+                    still_running.append((task, result, submitted))
+
+            if len(still_running) == len(in_flight):
+                time.sleep(self.poll)
+            in_flight = still_running
+
+    def shutdown(self):
+        if self.abandoned:
+            # workers stuck on abandoned tasks would block join forever. terminate() skips the
+            # Finalize hooks, the workers close their browser sessions on its SIGTERM instead
+            self.pool.terminate()
+        else:
+            self.pool.close()
+        self.pool.join()
+
+
+def straggler_report(timings, top=5):
+    '''summary of per domain crawl times, timings is a list of (url, seconds)'''
+    if not timings:
+        return 'no domains crawled'
+    seconds = [t for _, t in timings]
+    slowest = sorted(timings, key=lambda t: t[1], reverse=True)[:top]
+    p95 = percentile(seconds, 0.95)
+    return (f"domain time : p50 {percentile(seconds, 0.5):.1f}s , p95 {p95:.1f}s , "
+            f"p99 {percentile(seconds, 0.99):.1f}s , max {max(seconds):.1f}s , "
+            f"{sum(1 for s in seconds if s > 2 * p95)} over 2x p95 | slowest : "
+            + ' , '.join(f"{url} {t:.1f}s" for url, t in slowest))
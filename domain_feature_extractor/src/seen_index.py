@@ -0,0 +1,178 @@
+import argparse
+import hashlib
+import math
+import time
+from collections import Counter
+
+import numpy as np
+
+from config import seen_index_path, seen_ttl_hours, seen_bloom
+from sqlite_store import SqliteStore
+from whois_cache import registrable_domain
+
+# outcomes that count as processed, failed domains are always tried again
+DONE = ('collected', 'skipped')
+BATCH = 500
+
+
+class BloomFilter:
+    '''bit array membership front, no false negatives and about error_rate false positives at capacity'''
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1000)
+        self.size = int(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+
+    @staticmethod
+    def _hashes(keys):
+        digests = b''.join(hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest() for key in keys)
+        pairs = np.frombuffer(digests, dtype='<u8').reshape(-1, 2)
+        return pairs[:, 0], pairs[:, 1] | np.uint64(1)
+
+    def _positions(self, keys):
+        # double hashing, h1 + i * h2 wrapping at 64 bits
+        h1, h2 = self._hashes(keys)
+        steps = np.arange(self.hashes, dtype=np.uint64)
+        return (h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(self.size)
+
+    def update(self, keys):
+        keys = list(keys)
+        if keys:
+            positions = self._positions(keys).ravel()
+            np.bitwise_or.at(self.bits, positions >> np.uint64(3),
+                             np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+
+    def add(self, key):
+        self.update([key])
+
+    def contains_many(self, keys):
+        '''one bool per key, False means certainly not added'''
+        if not keys:
+            return []
+        positions = self._positions(keys)
+        set_bits = self.bits[positions >> np.uint64(3)] & np.left_shift(1, positions & np.uint64(7)).astype(np.uint8)
+        return np.all(set_bits != 0, axis=1).tolist()
+
+    def __contains__(self, key):
+        return self.contains_many([key])[0]
+
+
+class SeenIndex(SqliteStore):
+    '''
+    Registrable domains already processed by earlier runs, with when and
+    how (collected / skipped / failed), shared by all runs and workers so a
+    daily batch drops what was analyzed recently before any network work.
+
+    The table is keyed by domain (a WITHOUT ROWID b-tree, one row per
+    domain). With bloom=True a Bloom filter over every stored domain is
+    built on first use, so domains never seen before, the bulk of a new
+    list, are answered without touching SQLite. Writes go through WAL like
+    the other stores, so several extractor processes can record at once.
+
+    stats counts seen_recent / seen_new / seen_recorded.
+    '''
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS seen ('
+        'domain TEXT PRIMARY KEY, processed_at REAL, outcome TEXT) WITHOUT ROWID',
+    ]
+
+    def __init__(self, path=None, ttl_hours=None, bloom=None, enabled=True):
+        super().__init__(path or seen_index_path)
+        self.ttl = 3600 * (ttl_hours if ttl_hours is not None else seen_ttl_hours)
+        self.bloom_enabled = bloom if bloom is not None else seen_bloom
+        self.enabled = enabled
+        self._bloom = None
+        self.stats = Counter()
+
+    @property
+    def bloom(self):
+        if self._bloom is None:
+            count = self.execute('SELECT COUNT(*) FROM seen')[0][0]
+            # room for the index to double before the error rate degrades
+            bloom = BloomFilter(2 * count + 100000)
+            with self._lock:
+                cursor = self.conn.execute('SELECT domain FROM seen')
+                while True:
+                    rows = cursor.fetchmany(100000)
+                    if not rows:
+                        break
+                    bloom.update(domain for (domain,) in rows)
+            self._bloom = bloom
+        return self._bloom
+
+    def recent(self, urls, ttl=None):
+        '''{registrable domain} of the urls processed (collected or skipped) within ttl seconds'''
+        ttl = self.ttl if ttl is None else ttl
+        domains = list({registrable_domain(url) for url in urls})
+        if self.bloom_enabled:
+            domains = [domain for domain, maybe in zip(domains, self.bloom.contains_many(domains)) if maybe]
+        found = set()
+        since = time.time() - ttl
+        for i in range(0, len(domains), BATCH):
+            part = domains[i:i + BATCH]
+            marks = ','.join('?' * len(part))
+            found.update(domain for (domain,) in self.execute(
+                f'SELECT domain FROM seen WHERE domain IN ({marks}) AND processed_at >= ? '
+                f'AND outcome IN ({",".join("?" * len(DONE))})', part + [since] + list(DONE)))
+        return found
+
+    def filter(self, urls, ttl=None):
+        '''(urls still to process, urls processed recently), in input order'''
+        if not self.enabled:
+            return list(urls), []
+        recent = self.recent(urls, ttl)
+        todo, dropped = [], []
+        for url in urls:
+            (dropped if registrable_domain(url) in recent else todo).append(url)
+        self.stats['seen_recent'] += len(dropped)
+        self.stats['seen_new'] += len(todo)
+        return todo, dropped
+
+    def record(self, outcomes):
+        '''store [(url, outcome)] as processed now'''
+        if not self.enabled or not outcomes:
+            return
+        now = time.time()
+        rows = [(registrable_domain(url), now, outcome) for url, outcome in outcomes]
+        self.write('INSERT OR REPLACE INTO seen (domain, processed_at, outcome) VALUES (?, ?, ?)', rows, many=True)
+        if self._bloom is not None:
+            self._bloom.update(domain for domain, _, _ in rows)
+        self.stats['seen_recorded'] += len(rows)
+
+    def summary(self):
+        '''{outcome: domains}'''
+        return dict(self.execute('SELECT outcome, COUNT(*) FROM seen GROUP BY outcome'))
+
+
+def seen_report(stats):
+    '''one line summary of SeenIndex.stats'''
+    total = stats['seen_recent'] + stats['seen_new']
+    rate = stats['seen_recent'] / total if total else 0
+    return f"seen index : {total} domains checked , {stats['seen_recent']} processed recently ({rate:.1%} dropped) , " \
+           f"{stats['seen_recorded']} recorded"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='inspect or prune the seen domain index')
+    parser.add_argument('--path', type=str, help='index file, SEEN_INDEX_PATH by default')
+    parser.add_argument('--forget_days', type=float, help='drop entries processed more than this many days ago')
+    parser.add_argument('--check', type=str, nargs='*', help='show the entries of these domains')
+    args = parser.parse_args()
+
+    index = SeenIndex(args.path)
+    if args.forget_days is not None:
+        before = time.time() - args.forget_days * 86400
+        count = index.execute('SELECT COUNT(*) FROM seen WHERE processed_at < ?', (before,))[0][0]
+        index.write('DELETE FROM seen WHERE processed_at < ?', (before,))
+        print(f"dropped {count} entries")
+    for url in args.check or []:
+        rows = index.execute('SELECT domain, processed_at, outcome FROM seen WHERE domain = ?', (registrable_domain(url),))
+        for domain, processed_at, outcome in rows:
+            print(f"{domain} : {outcome} {time.strftime('%Y-%m-%d %H:%M', time.localtime(processed_at))}")
+        if not rows:
+            print(f"{url} : not seen")
+    for outcome, count in sorted(index.summary().items()):
+        print(f"{outcome} : {count} domains")
+    index.close()
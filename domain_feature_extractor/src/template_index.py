@@ -0,0 +1,216 @@
+import argparse
+import hashlib
+import json
+import re
+import time
+from collections import Counter
+
+import numpy as np
+
+from config import template_index_path, template_max_distance, template_min_tags, template_reuse
+from sqlite_store import SqliteStore
+
+TAG_RE = re.compile(r'<([a-zA-Z][a-zA-Z0-9-]*)')
+SCRIPT_STYLE_RE = re.compile(r'<(script|style)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+MARKUP_RE = re.compile(r'<[^>]*>')
+WORD_RE = re.compile(r'\w+')
+
+TAG_SHINGLE = 4
+TEXT_SHINGLE = 3
+MAX_TEXT_WORDS = 20000
+# 64 bit fingerprints split in 4 bands of 16 bits, two fingerprints within
+# 3 bits of each other share at least one band
+BANDS = 4
+BAND_BITS = 16
+
+
+def tag_names(html):
+    '''start tag names in document order, straight from the markup (no parse)'''
+    return [name.lower() for name in TAG_RE.findall(html)]
+
+
+def visible_words(html, limit=MAX_TEXT_WORDS):
+    text = MARKUP_RE.sub(' ', SCRIPT_STYLE_RE.sub(' ', html))
+    return WORD_RE.findall(text.lower())[:limit]
+
+
+def shingles(tokens, size):
+    return {' '.join(tokens[i:i + size]) for i in range(max(len(tokens) - size + 1, 0))}
+
+
+def simhash(features):
+    '''64 bit SimHash of a set of strings, 0 for an empty set'''
+    if not features:
+        return 0
+    hashes = np.fromiter((int.from_bytes(hashlib.blake2b(f.encode('utf-8'), digest_size=8).digest(), 'little')
+                          for f in features), dtype=np.uint64, count=len(features))
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    score = bits.sum(axis=0, dtype=np.int64) * 2 - len(features)
+    return int(np.packbits(score > 0, bitorder='little').view('<u8')[0])
+
+
+def distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def bands(fingerprint):
+    mask = (1 << BAND_BITS) - 1
+    return [(band, (fingerprint >> (band * BAND_BITS)) & mask) for band in range(BANDS)]
+
+
+def _signed(value):
+    # sqlite integers are signed 64 bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class Fingerprint:
+    '''tag and visible text SimHash of a page source'''
+
+    def __init__(self, html):
+        tags = tag_names(html)
+        self.tag_count = len(tags)
+        self.tags = simhash(shingles(tags, TAG_SHINGLE))
+        self.text = simhash(shingles(visible_words(html), TEXT_SHINGLE))
+
+
+class TemplateIndex(SqliteStore):
+    '''
+    Clusters pages built from the same template, shared by all pool
+    workers and runs.
+
+    A page's fingerprint is the SimHash of its start tag 4-grams (the
+    template) and of its visible word 3-grams (the content). Pages whose tag
+    fingerprints are within max_distance bits join the same cluster; the
+    first page of a cluster is its representative and candidates are found
+    through a banded LSH table, so a lookup touches only a few rows. The text
+    distance to the representative is recorded per member: clones of one
+    shop are close on both, shops sharing a theme only on tags.
+
+    Clusters keep the DOM structure counts of their representative
+    (BeyondPhish total nodes, depth, children, scripts, inputs, hidden), and
+    with reuse=True assign() hands them out for members so the DOM walk is
+    skipped for them. Those counts are then the representative's, not the
+    member's exact ones.
+
+    stats counts template_new / template_match / template_skipped / template_reused.
+    '''
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS clusters ('
+        'id INTEGER PRIMARY KEY AUTOINCREMENT, tag_hash INTEGER, text_hash INTEGER, url TEXT, '
+        'structure TEXT, created_at REAL)',
+        'CREATE TABLE IF NOT EXISTS bands (band INTEGER, value INTEGER, cluster INTEGER)',
+        'CREATE INDEX IF NOT EXISTS bands_value ON bands (band, value)',
+        'CREATE TABLE IF NOT EXISTS members ('
+        'url TEXT PRIMARY KEY, cluster INTEGER, tag_distance INTEGER, text_distance INTEGER, assigned_at REAL)',
+        'CREATE INDEX IF NOT EXISTS members_cluster ON members (cluster)',
+    ]
+
+    def __init__(self, path=None, max_distance=None, min_tags=None, reuse=None, enabled=True):
+        super().__init__(path or template_index_path)
+        self.max_distance = max_distance if max_distance is not None else template_max_distance
+        self.min_tags = min_tags if min_tags is not None else template_min_tags
+        self.reuse = reuse if reuse is not None else template_reuse
+        self.enabled = enabled
+        self.stats = Counter()
+
+    def _nearest(self, fingerprint):
+        '''(cluster, tag distance, text distance, structure) of the closest cluster, None if none is close enough'''
+        best = None
+        seen = set()
+        for band, value in bands(fingerprint.tags):
+            for cluster, tag_hash, text_hash, structure in self.conn.execute(
+                    'SELECT c.id, c.tag_hash, c.text_hash, c.structure FROM bands b '
+                    'JOIN clusters c ON c.id = b.cluster WHERE b.band = ? AND b.value = ?', (band, value)):
+                if cluster in seen:
+                    continue
+                seen.add(cluster)
+                tag_distance = distance(fingerprint.tags, _unsigned(tag_hash))
+                if tag_distance <= self.max_distance and (best is None or tag_distance < best[1]):
+                    best = (cluster, tag_distance, distance(fingerprint.text, _unsigned(text_hash)), structure)
+        return best
+
+    def assign(self, url, html):
+        '''
+        (cluster id, structure counts to reuse or None) of a page source,
+        (-1, None) when disabled or the page has too little markup
+        '''
+        if not self.enabled:
+            return -1, None
+        fingerprint = Fingerprint(html)
+        if fingerprint.tag_count < self.min_tags:
+            self.stats['template_skipped'] += 1
+            return -1, None
+
+        with self._lock:
+            conn = self.conn
+            # match and insert in one write transaction, so two workers cannot both open a cluster for one template
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                nearest = self._nearest(fingerprint)
+                if nearest is None:
+                    cursor = conn.execute('INSERT INTO clusters (tag_hash, text_hash, url, created_at) VALUES (?, ?, ?, ?)',
+                                          (_signed(fingerprint.tags), _signed(fingerprint.text), url, time.time()))
+                    cluster, tag_distance, text_distance, structure = cursor.lastrowid, 0, 0, None
+                    conn.executemany('INSERT INTO bands (band, value, cluster) VALUES (?, ?, ?)',
+                                     [(band, value, cluster) for band, value in bands(fingerprint.tags)])
+                else:
+                    cluster, tag_distance, text_distance, structure = nearest
+                conn.execute('INSERT OR REPLACE INTO members (url, cluster, tag_distance, text_distance, assigned_at) '
+                             'VALUES (?, ?, ?, ?, ?)', (url, cluster, tag_distance, text_distance, time.time()))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        self.stats['template_new' if nearest is None else 'template_match'] += 1
+        if nearest is None or not self.reuse or structure is None:
+            return cluster, None
+        self.stats['template_reused'] += 1
+        return cluster, tuple(json.loads(structure))
+
+    def set_structure(self, cluster, structure):
+        '''keep the structure counts of a cluster's first page that computed them'''
+        if self.enabled and cluster != -1 and structure is not None:
+            self.write('UPDATE clusters SET structure = ? WHERE id = ? AND structure IS NULL',
+                       (json.dumps(list(structure)), cluster))
+
+    def largest(self, top=20):
+        '''[(cluster, members, representative url)] of the biggest clusters'''
+        return self.execute('SELECT c.id, COUNT(*), c.url FROM members m JOIN clusters c ON c.id = m.cluster '
+                            'GROUP BY c.id ORDER BY COUNT(*) DESC LIMIT ?', (top,))
+
+    def members(self, cluster):
+        '''[(url, tag distance, text distance)] of a cluster'''
+        return self.execute('SELECT url, tag_distance, text_distance FROM members WHERE cluster = ? '
+                            'ORDER BY text_distance', (cluster,))
+
+
+def template_report(stats):
+    '''one line summary of (merged) TemplateIndex.stats'''
+    total = stats['template_new'] + stats['template_match']
+    rate = stats['template_match'] / total if total else 0
+    return f"templates : {total} pages , {stats['template_new']} new clusters , " \
+           f"matched a known one {rate:.1%} , structure reused {stats['template_reused']} , " \
+           f"skipped {stats['template_skipped']}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='list the largest template clusters')
+    parser.add_argument('--path', type=str, help='index file, TEMPLATE_INDEX_PATH by default')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--cluster', type=int, help='list the members of one cluster')
+    args = parser.parse_args()
+
+    index = TemplateIndex(args.path)
+    if args.cluster is not None:
+        for url, tag_distance, text_distance in index.members(args.cluster):
+            print(f"{url} , tags {tag_distance} bits , text {text_distance} bits")
+    else:
+        for cluster, count, url in index.largest(args.top):
+            print(f"cluster {cluster} : {count} pages , first {url}")
+    index.close()
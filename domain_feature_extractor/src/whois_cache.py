@@ -0,0 +1,99 @@
+import json
+import time
+from collections import Counter
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import whois
+from tld import get_fld
+
+from config import whois_cache_path, whois_ttl_hours, whois_negative_ttl_hours
+from sqlite_store import SqliteStore
+
+
+def registrable_domain(url):
+    '''shop.example.co.uk -> example.co.uk, falls back to the host name'''
+    try:
+        return get_fld(url, fix_protocol=True)
+    except Exception:
+        if not url.startswith('http'):
+            url = 'http://' + url
+        return urlsplit(url).netloc or url
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    return str(value)
+
+
+def _decode(obj):
+    if '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    return obj
+
+
+class WhoisCache(SqliteStore):
+    '''
+    WHOIS results stored in SQLite (WAL mode) so every pool worker and every
+    pipeline run shares them. Entries are keyed by registrable domain and
+    expire after ttl hours; failed or empty lookups are cached too, with
+    their own shorter negative_ttl.
+
+    stats counts whois_hit / whois_miss / whois_negative_hit / whois_error.
+    '''
+
+    SCHEMA = ['CREATE TABLE IF NOT EXISTS whois ('
+              'domain TEXT PRIMARY KEY, record TEXT, found INTEGER, fetched_at REAL)']
+
+    def __init__(self, path=None, ttl_hours=None, negative_ttl_hours=None, fetch=None):
+        super().__init__(path or whois_cache_path)
+        self.ttl = 3600 * (ttl_hours if ttl_hours is not None else whois_ttl_hours)
+        self.negative_ttl = 3600 * (negative_ttl_hours if negative_ttl_hours is not None else whois_negative_ttl_hours)
+        self.fetch = fetch or whois.whois
+        self.stats = Counter()
+
+    def get(self, domain):
+        '''returns (found, record) for a fresh entry, None when missing or expired'''
+        rows = self.execute('SELECT record, found, fetched_at FROM whois WHERE domain = ?', (domain,))
+        if not rows:
+            return None
+        record, found, fetched_at = rows[0]
+        ttl = self.ttl if found else self.negative_ttl
+        if time.time() - fetched_at > ttl:
+            return None
+        return bool(found), json.loads(record, object_hook=_decode)
+
+    def put(self, domain, record, found=True):
+        self.write('INSERT OR REPLACE INTO whois (domain, record, found, fetched_at) VALUES (?, ?, ?, ?)',
+                   (domain, json.dumps(record, default=_encode), int(found), time.time()))
+
+    def lookup(self, url):
+        '''WHOIS record of url as a dict, {} when the lookup fails'''
+        domain = registrable_domain(url)
+        cached = self.get(domain)
+        if cached is not None:
+            found, record = cached
+            self.stats['whois_hit' if found else 'whois_negative_hit'] += 1
+            return record
+
+        self.stats['whois_miss'] += 1
+        try:
+            record = dict(self.fetch(url) or {})
+        except Exception as e:
+            print(f"get whois error : {e}")
+            self.stats['whois_error'] += 1
+            record = {}
+
+        found = bool(record.get('domain_name'))
+        self.put(domain, record, found)
+        return record
+
+
+def whois_report(stats):
+    '''one line summary of (merged) WhoisCache.stats'''
+    hits = stats['whois_hit'] + stats['whois_negative_hit']
+    total = hits + stats['whois_miss']
+    rate = hits / total if total else 0
+    return f"whois cache : {total} lookups , hit rate {rate:.1%} , " \
+           f"negative hits {stats['whois_negative_hit']} , errors {stats['whois_error']}"
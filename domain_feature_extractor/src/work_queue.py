@@ -0,0 +1,234 @@
+import argparse
+import os
+import socket
+import time
+from collections import Counter
+
+from config import work_queue, work_lease_seconds, work_max_attempts, work_idle_seconds
+from sqlite_store import SqliteStore
+
+
+def worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class SqliteWorkQueue(SqliteStore):
+    '''
+    Domains of named queues (one per run, e.g. its data directory) that
+    extractor instances lease a few at a time instead of each taking a fixed
+    JOB_INDEX slice, so fast instances keep pulling work while slow ones
+    finish theirs.
+
+    lease() hands out pending domains for lease_seconds; ack() marks them
+    done with their outcome and release() gives them back, with
+    charge=False not counting the lease as an attempt when the instance
+    itself failed rather than the domains. A lease that
+    runs out (the instance died or hung) is put back as pending by the next
+    lease() of any instance, until a domain has been leased max_attempts
+    times, then it is left 'dead'. The file sits on the shared data volume,
+    which is enough for the instances of one node; MongoWorkQueue does the
+    same across nodes.
+
+    stats counts queue_leased / queue_acked / queue_released / queue_expired.
+    '''
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS jobs ('
+        'queue TEXT, domain TEXT, state TEXT, owner TEXT, lease_until REAL, attempts INTEGER, '
+        'enqueued_at REAL, done_at REAL, outcome TEXT, PRIMARY KEY (queue, domain))',
+        'CREATE INDEX IF NOT EXISTS jobs_state ON jobs (queue, state, lease_until)',
+    ]
+
+    def __init__(self, path, queue, lease_seconds=None, max_attempts=None):
+        super().__init__(path)
+        self.queue = queue
+        self.lease_seconds = lease_seconds or work_lease_seconds
+        self.max_attempts = max_attempts or work_max_attempts
+        self.stats = Counter()
+
+    def enqueue(self, urls):
+        '''add domains not in the queue yet, returns how many were new'''
+        now = time.time()
+        before = self.execute('SELECT COUNT(*) FROM jobs WHERE queue = ?', (self.queue,))[0][0]
+        self.write('INSERT OR IGNORE INTO jobs (queue, domain, state, attempts, enqueued_at) VALUES (?, ?, ?, 0, ?)',
+                   [(self.queue, url, 'pending', now) for url in urls], many=True)
+        return self.execute('SELECT COUNT(*) FROM jobs WHERE queue = ?', (self.queue,))[0][0] - before
+
+    def lease(self, owner, n):
+        '''up to n pending domains, leased to owner for lease_seconds'''
+        now = time.time()
+        with self._lock:
+            conn = self.conn
+            # requeue and lease in one write transaction, two instances never get the same domain
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                expired = conn.execute(
+                    "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END, owner = NULL "
+                    "WHERE queue = ? AND state = 'leased' AND lease_until < ?",
+                    (self.max_attempts, self.queue, now)).rowcount
+                urls = [url for (url,) in conn.execute(
+                    "SELECT domain FROM jobs WHERE queue = ? AND state = 'pending' ORDER BY rowid LIMIT ?",
+                    (self.queue, n))]
+                conn.executemany(
+                    "UPDATE jobs SET state = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1 "
+                    "WHERE queue = ? AND domain = ?",
+                    [(owner, now + self.lease_seconds, self.queue, url) for url in urls])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        self.stats['queue_expired'] += expired
+        self.stats['queue_leased'] += len(urls)
+        return urls
+
+    def ack(self, owner, outcomes):
+        '''mark [(url, outcome)] done'''
+        now = time.time()
+        self.write("UPDATE jobs SET state = 'done', owner = ?, done_at = ?, outcome = ? WHERE queue = ? AND domain = ?",
+                   [(owner, now, outcome, self.queue, url) for url, outcome in outcomes], many=True)
+        self.stats['queue_acked'] += len(outcomes)
+
+    def release(self, owner, urls, charge=True):
+        '''give leased domains back to the queue before their lease runs out'''
+        refund = 0 if charge else 1
+        self.write("UPDATE jobs SET attempts = attempts - ?, "
+                   "state = CASE WHEN attempts - ? >= ? THEN 'dead' ELSE 'pending' END, owner = NULL "
+                   "WHERE queue = ? AND domain = ? AND state = 'leased' AND owner = ?",
+                   [(refund, refund, self.max_attempts, self.queue, url, owner) for url in urls], many=True)
+        self.stats['queue_released'] += len(urls)
+
+    def counts(self):
+        '''{state: domains} of the queue'''
+        return dict(self.execute('SELECT state, COUNT(*) FROM jobs WHERE queue = ? GROUP BY state', (self.queue,)))
+
+
+class MongoWorkQueue:
+    '''SqliteWorkQueue on a MongoDB collection, for instances on several nodes'''
+
+    def __init__(self, uri, queue, lease_seconds=None, max_attempts=None, collection='work_queue'):
+        from pymongo import ASCENDING, MongoClient
+        self.client = MongoClient(uri)
+        self.jobs = self.client.get_default_database()[collection]
+        self.jobs.create_index([('queue', ASCENDING), ('domain', ASCENDING)], unique=True)
+        self.jobs.create_index([('queue', ASCENDING), ('state', ASCENDING), ('lease_until', ASCENDING)])
+        self.queue = queue
+        self.lease_seconds = lease_seconds or work_lease_seconds
+        self.max_attempts = max_attempts or work_max_attempts
+        self.stats = Counter()
+
+    def enqueue(self, urls, batch_size=1000):
+        from pymongo import UpdateOne
+        from pymongo.errors import BulkWriteError
+        now = time.time()
+        added = 0
+        urls = list(urls)
+        for i in range(0, len(urls), batch_size):
+            operations = [UpdateOne({'queue': self.queue, 'domain': url},
+                                    {'$setOnInsert': {'state': 'pending', 'attempts': 0, 'enqueued_at': now, 'seq': i + j}},
+                                    upsert=True)
+                          for j, url in enumerate(urls[i:i + batch_size])]
+            try:
+                added += self.jobs.bulk_write(operations, ordered=False).upserted_count
+            except BulkWriteError as e:
+                # another instance enqueued the same domain at the same time
+                added += e.details.get('nUpserted', 0)
+        return added
+
+    def lease(self, owner, n):
+        now = time.time()
+        expired = self.jobs.update_many(
+            {'queue': self.queue, 'state': 'leased', 'lease_until': {'$lt': now}, 'attempts': {'$lt': self.max_attempts}},
+            {'$set': {'state': 'pending', 'owner': None}}).modified_count
+        expired += self.jobs.update_many(
+            {'queue': self.queue, 'state': 'leased', 'lease_until': {'$lt': now}},
+            {'$set': {'state': 'dead', 'owner': None}}).modified_count
+        candidates = [job['_id'] for job in self.jobs.find({'queue': self.queue, 'state': 'pending'}, {'_id': 1})
+                      .sort([('enqueued_at', 1), ('seq', 1)]).limit(n)]
+        if not candidates:
+            self.stats['queue_expired'] += expired
+            return []
+        # a candidate another instance claimed in between is no longer pending and stays theirs
+        lease_until = now + self.lease_seconds
+        self.jobs.update_many({'_id': {'$in': candidates}, 'state': 'pending'},
+                              {'$set': {'state': 'leased', 'owner': owner, 'lease_until': lease_until},
+                               '$inc': {'attempts': 1}})
+        urls = [job['domain'] for job in self.jobs.find(
+            {'_id': {'$in': candidates}, 'owner': owner, 'lease_until': lease_until}, {'domain': 1})]
+        self.stats['queue_expired'] += expired
+        self.stats['queue_leased'] += len(urls)
+        return urls
+
+    def ack(self, owner, outcomes):
+        from pymongo import UpdateOne
+        if outcomes:
+            self.jobs.bulk_write([UpdateOne({'queue': self.queue, 'domain': url},
+                                            {'$set': {'state': 'done', 'owner': owner, 'done_at': time.time(),
+                                                      'outcome': outcome}})
+                                  for url, outcome in outcomes], ordered=False)
+        self.stats['queue_acked'] += len(outcomes)
+
+    def release(self, owner, urls, charge=True):
+        query = {'queue': self.queue, 'domain': {'$in': list(urls)}, 'state': 'leased', 'owner': owner}
+        if not charge:
+            self.jobs.update_many(query, {'$inc': {'attempts': -1}})
+        self.jobs.update_many(dict(query, attempts={'$gte': self.max_attempts}), {'$set': {'state': 'dead', 'owner': None}})
+        self.jobs.update_many(query, {'$set': {'state': 'pending', 'owner': None}})
+        self.stats['queue_released'] += len(urls)
+
+    def counts(self):
+        return {row['_id']: row['count'] for row in self.jobs.aggregate(
+            [{'$match': {'queue': self.queue}}, {'$group': {'_id': '$state', 'count': {'$sum': 1}}}])}
+
+    def close(self):
+        self.client.close()
+
+
+def open_work_queue(queue, backend=None, lease_seconds=None, max_attempts=None):
+    '''WORK_QUEUE is a mongodb:// uri or the path of the SQLite file'''
+    backend = backend or work_queue
+    if backend.startswith('mongodb://') or backend.startswith('mongodb+srv://'):
+        return MongoWorkQueue(backend, queue, lease_seconds, max_attempts)
+    return SqliteWorkQueue(backend, queue, lease_seconds, max_attempts)
+
+
+def lease_batches(queue, owner, size, idle_seconds=None):
+    '''
+    batches of leased domains for Scheduler.run. None means nothing to lease
+    right now while other instances still hold leases (they may expire and
+    come back); the generator ends once nothing is pending or leased.
+    '''
+    idle_seconds = idle_seconds if idle_seconds is not None else work_idle_seconds
+    idle_until = 0
+    while True:
+        if time.time() < idle_until:
+            yield None
+            continue
+        urls = queue.lease(owner, size)
+        if urls:
+            yield urls
+            continue
+        counts = queue.counts()
+        if not counts.get('pending') and not counts.get('leased'):
+            return
+        idle_until = time.time() + idle_seconds
+        yield None
+
+
+def queue_report(stats, counts=None):
+    '''one line summary of a work queue's stats and, when given, its counts()'''
+    line = f"work queue : leased {stats['queue_leased']} , acked {stats['queue_acked']} , " \
+           f"released {stats['queue_released']} , leases expired {stats['queue_expired']}"
+    if counts:
+        line += ' | ' + ' , '.join(f"{state} {count}" for state, count in sorted(counts.items()))
+    return line
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='show the state of a work queue')
+    parser.add_argument('--queue', type=str, required=True, help='queue name, e.g. the run directory')
+    parser.add_argument('--backend', type=str, help='mongodb:// uri or sqlite file, WORK_QUEUE by default')
+    args = parser.parse_args()
+
+    work = open_work_queue(args.queue, args.backend)
+    print(' , '.join(f"{state} {count}" for state, count in sorted(work.counts().items())) or 'empty queue')
+    work.close()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the extractor modules import each other by their bare names, as they do when run from src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
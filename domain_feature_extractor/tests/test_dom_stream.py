@@ -0,0 +1,30 @@
+from bs4 import BeautifulSoup
+
+from dom_stream import PROBE, STREAM_SUPPORTED, DomSummary
+
+PAGE = ('<html><head><title>Shop</title><style>p {}</style></head><body>\n  <h1>Café  Shop</h1>'
+        '<p>cheap <b>shoes</b></p><pre>  keep  </pre><script>var a;</script>  <p> </p></body></html>')
+
+
+def test_stream_is_supported():
+    assert STREAM_SUPPORTED
+
+
+def test_text_views_match_the_tree():
+    for html in [PAGE, PROBE, '<p>no body</p>']:
+        dom = DomSummary(html, max_bytes=0)
+        soup = BeautifulSoup(html, 'html.parser')
+        assert dom.text == soup.get_text(separator=' ')
+        assert dom.body_string == (soup.body.text if soup.body else None)
+        assert dom.body_text == (soup.body.get_text(separator=' ', strip=True) if soup.body else '')
+        assert dom.total_nodes == len(soup.find_all(True))
+
+
+def test_max_bytes_counts_utf8_bytes():
+    html = '<p>' + 'é' * 10 + '</p>'
+    # 3 bytes of tag and 6 of text, the cut never splits a character
+    dom = DomSummary(html, max_bytes=10)
+    assert dom.truncated
+    assert dom.text == 'ééé'
+    assert not DomSummary(html, max_bytes=len(html.encode('utf-8'))).truncated
+    assert not DomSummary(html, max_bytes=0).truncated
@@ -0,0 +1,151 @@
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from fetcher import NOT_FETCHED, StaticFetcher, TieredFetcher, tier_report
+
+FILLER = '<p>' + 'plain server rendered text ' * 200 + '</p>'
+PAGES = {
+    '/static': ('text/html; charset=utf-8', f'<html><body><h1>Shop</h1>{FILLER}</body></html>'),
+    '/shell': ('text/html; charset=utf-8',
+               f'<html><head><!-- {FILLER} --></head><body><div id="root"></div></body></html>'),
+    '/short': ('text/html; charset=utf-8', '<html><body>hi</body></html>'),
+    '/parked': ('text/html; charset=utf-8', f'<html><body>this domain is parked {FILLER}</body></html>'),
+    '/nocharset': ('text/html', f'<html><body>café {FILLER}</body></html>'),
+    '/pdf': ('application/pdf', '%PDF-1.4'),
+}
+BROWSER_HTML = '<html><body>rendered by the browser</body></html>'
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.hits[self.path] += 1
+        if self.path not in PAGES:
+            self.send_error(404)
+            return
+        content_type, body = PAGES[self.path]
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.hits = Counter()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def url(server):
+    return lambda path: f'http://127.0.0.1:{server.server_address[1]}{path}'
+
+
+@pytest.fixture
+def static():
+    session = requests.Session()
+    # never send localhost through a proxy from the environment
+    session.trust_env = False
+    fetcher = StaticFetcher(timeout=5, concurrency=4, session=session)
+    yield fetcher
+    fetcher.close()
+
+
+class FakeBrowser:
+    def __init__(self, html=BROWSER_HTML):
+        self.html = html
+        self.urls = []
+
+    def __call__(self, url):
+        self.urls.append(url)
+        return self.html
+
+
+def is_parked(html):
+    return 'this domain is parked' in html
+
+
+def test_static_fetch(static, url):
+    assert static.fetch(url('/static')) == PAGES['/static'][1]
+    # no charset in the header decodes as utf-8, not latin-1
+    assert 'café' in static.fetch(url('/nocharset'))
+    assert static.fetch(url('/missing')) is None
+    assert static.fetch(url('/pdf')) is None
+    assert static.fetch('http://127.0.0.1:1/unreachable') is None
+
+
+def test_fetch_many(static, url):
+    urls = [url('/static'), url('/short'), url('/missing')]
+    pages = static.fetch_many(urls)
+    assert list(pages) == urls
+    assert pages[urls[0]] == PAGES['/static'][1]
+    assert pages[urls[1]] == PAGES['/short'][1]
+    assert pages[urls[2]] is None
+
+
+@pytest.mark.parametrize('path, tier, reason', [
+    ('/static', 'static', None),
+    ('/nocharset', 'static', None),
+    ('/shell', 'browser', 'js_shell'),
+    ('/short', 'browser', 'too_short'),
+    ('/parked', 'browser', 'parked'),
+    ('/missing', 'browser', 'static_failed'),
+    ('/pdf', 'browser', 'static_failed'),
+])
+def test_tier_choice(static, url, path, tier, reason):
+    browser = FakeBrowser()
+    tiered = TieredFetcher(static, browser, is_parked)
+    html = tiered.fetch(url(path))
+    if tier == 'static':
+        assert html == PAGES[path][1]
+        assert browser.urls == []
+        assert tiered.stats == Counter(static=1)
+    else:
+        assert html == BROWSER_HTML
+        assert browser.urls == [url(path)]
+        assert tiered.stats == Counter({'browser': 1, 'escalated:' + reason: 1})
+
+
+def test_prefetched_pages_are_not_fetched_again(server, static, url):
+    tiered = TieredFetcher(static, FakeBrowser(), is_parked)
+    target = url('/static')
+    prefetched = tiered.prefetch([target])
+    before = server.hits['/static']
+    assert tiered.fetch(target, prefetched.pop(target, NOT_FETCHED)) == PAGES['/static'][1]
+    assert server.hits['/static'] == before
+    # a failed prefetch (None) goes to the browser without another static try
+    before = server.hits['/missing']
+    assert tiered.fetch(url('/missing'), None) == BROWSER_HTML
+    assert server.hits['/missing'] == before
+
+
+def test_browser_only_and_failures(url):
+    browser = FakeBrowser(html=None)
+    tiered = TieredFetcher(None, browser, is_parked)
+    assert tiered.prefetch([url('/static')]) == {}
+    assert tiered.fetch(url('/static')) is None
+    assert browser.urls == [url('/static')]
+    assert tiered.stats == Counter(failed=1)
+
+
+def test_tier_report(static, url):
+    tiered = TieredFetcher(static, FakeBrowser(), is_parked)
+    for path in ['/static', '/static', '/nocharset', '/shell', '/short']:
+        tiered.fetch(url(path))
+    assert tiered.stats['static'] == 3
+    assert tier_report(tiered.stats) == ('fetched 5 pages : static 60.0% , browser 40.0% , failed 0.0% | '
+                                         'escalations : js_shell 1 , too_short 1')
+    assert tier_report(Counter()) == 'no pages fetched'
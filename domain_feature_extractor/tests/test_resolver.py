@@ -0,0 +1,158 @@
+import socket
+import threading
+import time
+from collections import Counter
+
+import dns.message
+import dns.rcode
+import dns.rrset
+import pytest
+
+from resolver import Resolver, dns_report
+
+RECORDS = {'shop.test.': '10.0.0.1', 'blog.test.': '10.0.0.2', 'store.test.': '10.0.0.3'}
+# queries for this name are received and never answered
+SILENT = 'slow.test.'
+
+
+class StubNameserver:
+    '''UDP responder on 127.0.0.1 answering A queries from RECORDS, NXDOMAIN for anything else'''
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(0.1)
+        self.port = self.sock.getsockname()[1]
+        self.queries = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        while not self._stop.is_set():
+            try:
+                wire, peer = self.sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+            query = dns.message.from_wire(wire)
+            name = query.question[0].name.to_text()
+            self.queries[name] += 1
+            if name == SILENT:
+                continue
+            response = dns.message.make_response(query)
+            if name in RECORDS:
+                response.answer.append(dns.rrset.from_text(name, 300, 'IN', 'A', RECORDS[name]))
+            else:
+                response.set_rcode(dns.rcode.NXDOMAIN)
+            self.sock.sendto(response.to_wire(), peer)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.sock.close()
+
+
+@pytest.fixture
+def nameserver():
+    server = StubNameserver()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def make_resolver(nameserver, tmp_path):
+    resolvers = []
+
+    def make(**kwargs):
+        kwargs.setdefault('timeout', 0.5)
+        resolver = Resolver(str(tmp_path / 'dns_cache.sqlite'), nameservers=['127.0.0.1'], port=nameserver.port,
+                            **kwargs)
+        resolvers.append(resolver)
+        return resolver
+    yield make
+    for resolver in resolvers:
+        resolver.close()
+
+
+def test_resolve_and_cache_hit(nameserver, make_resolver):
+    resolver = make_resolver()
+    assert resolver.resolve('shop.test') == '10.0.0.1'
+    assert resolver.resolve('shop.test') == '10.0.0.1'
+    assert nameserver.queries['shop.test.'] == 1
+    assert resolver.stats == Counter(dns_miss=1, dns_hit=1)
+
+
+def test_cache_is_shared_through_the_file(nameserver, make_resolver):
+    make_resolver().resolve('blog.test')
+    other = make_resolver()
+    assert other.resolve('blog.test') == '10.0.0.2'
+    assert nameserver.queries['blog.test.'] == 1
+    assert other.stats['dns_hit'] == 1
+
+
+def test_literal_address_skips_dns(nameserver, make_resolver):
+    resolver = make_resolver()
+    assert resolver.resolve('192.0.2.7') == '192.0.2.7'
+    assert sum(nameserver.queries.values()) == 0
+    assert resolver.stats == Counter()
+
+
+def test_negative_caching(nameserver, make_resolver):
+    resolver = make_resolver(negative_ttl=0.3)
+    assert resolver.resolve('gone.test') == ''
+    assert resolver.stats['dns_fail'] == 1
+    # the failure is cached, no second query within negative_ttl
+    assert resolver.resolve('gone.test') == ''
+    assert nameserver.queries['gone.test.'] == 1
+    assert resolver.cached('gone.test') == ''
+
+    time.sleep(0.4)
+    assert resolver.cached('gone.test') is None
+    assert resolver.resolve('gone.test') == ''
+    assert nameserver.queries['gone.test.'] == 2
+
+
+def test_positive_ttl_outlives_negative(nameserver, make_resolver):
+    resolver = make_resolver(ttl=60, negative_ttl=0.1)
+    resolver.resolve('shop.test')
+    resolver.resolve('gone.test')
+    time.sleep(0.2)
+    assert resolver.cached('shop.test') == '10.0.0.1'
+    assert resolver.cached('gone.test') is None
+
+
+def test_timeout(nameserver, make_resolver):
+    resolver = make_resolver(timeout=0.5)
+    start = time.time()
+    assert resolver.resolve('slow.test') == ''
+    assert time.time() - start < 3
+    assert nameserver.queries[SILENT] >= 1
+    assert resolver.stats['dns_timeout'] == 1
+    assert resolver.stats['dns_fail'] == 0
+    # timeouts are cached like other failures
+    queries = nameserver.queries[SILENT]
+    assert resolver.resolve('slow.test') == ''
+    assert nameserver.queries[SILENT] == queries
+
+
+def test_resolve_many(nameserver, make_resolver):
+    resolver = make_resolver(concurrency=4)
+    hosts = ['shop.test', 'blog.test', 'gone.test', 'shop.test', 'slow.test', 'store.test']
+    start = time.time()
+    result = resolver.resolve_many(hosts)
+    # the timeout runs alongside the other lookups
+    assert time.time() - start < 3
+    assert result == {'shop.test': '10.0.0.1', 'blog.test': '10.0.0.2', 'gone.test': '',
+                      'slow.test': '', 'store.test': '10.0.0.3'}
+    assert nameserver.queries['shop.test.'] == 1
+    assert resolver.stats['dns_miss'] == 5
+
+    assert resolver.resolve_many(['shop.test', 'gone.test']) == {'shop.test': '10.0.0.1', 'gone.test': ''}
+    assert resolver.stats['dns_hit'] == 2
+
+
+def test_dns_report(nameserver, make_resolver):
+    resolver = make_resolver()
+    for host in ['shop.test', 'shop.test', 'shop.test', 'gone.test']:
+        resolver.resolve(host)
+    assert dns_report(resolver.stats) == 'dns cache : 4 lookups , hit rate 50.0% , timeouts 0 , failures 1'
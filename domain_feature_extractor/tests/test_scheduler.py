@@ -0,0 +1,56 @@
+import os
+import time
+from multiprocessing import Pool
+
+from scheduler import Scheduler
+
+
+def work(task):
+    # 'crash' takes its worker process down, 'hang' never returns in time, numbers sleep that long
+    if task == 'crash':
+        os._exit(1)
+    if task == 'hang':
+        time.sleep(60)
+    time.sleep(task)
+    return task
+
+
+def run(tasks, workers, deadline):
+    pool = Pool(workers)
+    scheduler = Scheduler(pool, work, deadline, workers, poll=0.02)
+    try:
+        return [(task, result, reason) for task, result, reason in scheduler.run(tasks)], scheduler
+    finally:
+        scheduler.shutdown()
+
+
+def test_results_and_deadline():
+    results, scheduler = run([0.01, 'hang', 0.01, 0.01], 2, 0.5)
+    assert sorted(results, key=str) == sorted([(0.01, 0.01, None)] * 3 + [('hang', None, 'deadline')], key=str)
+    assert scheduler.abandoned == 1
+
+
+def test_dead_worker_does_not_hold_a_slot():
+    # NUMBER_PROC=1: the pool replaces the crashed worker, the run must go on with it
+    results, scheduler = run(['crash', 0.01, 0.01, 0.01, 0.01, 0.01], 1, 0.5)
+    assert results[0] == ('crash', None, 'deadline')
+    assert results[1:] == [(0.01, 0.01, None)] * 5
+    assert scheduler.dead_workers == 1
+
+
+def test_hung_workers_give_up_the_rest_of_a_list():
+    results, scheduler = run(['hang', 0.01, 0.01], 1, 0.3)
+    assert results == [('hang', None, 'deadline'), (0.01, None, 'no workers'), (0.01, None, 'no workers')]
+
+
+def test_hung_workers_stop_pulling_a_lazy_source():
+    pulled = []
+
+    def tasks():
+        for task in ['hang', 0.01, 0.01, 0.01]:
+            pulled.append(task)
+            yield task
+
+    results, scheduler = run(tasks(), 1, 0.3)
+    assert results == [('hang', None, 'deadline')]
+    assert pulled == ['hang']
@@ -0,0 +1,140 @@
+import time
+from multiprocessing import Pool
+
+import pytest
+
+from scheduler import Scheduler
+from work_queue import SqliteWorkQueue, lease_batches, queue_report
+
+DOMAINS = [f'd{i:02d}.test' for i in range(40)]
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+
+    def make(**kwargs):
+        work = SqliteWorkQueue(str(tmp_path / 'work_queue.sqlite'), 'run-1', **kwargs)
+        queues.append(work)
+        return work
+    yield make
+    for work in queues:
+        work.close()
+
+
+def attempts(work):
+    return dict(work.execute('SELECT domain, attempts FROM jobs WHERE queue = ?', (work.queue,)))
+
+
+def test_enqueue_ignores_queued_domains(make_queue):
+    work = make_queue()
+    assert work.enqueue(DOMAINS[:10]) == 10
+    assert work.enqueue(DOMAINS[5:15]) == 5
+    assert work.counts() == {'pending': 15}
+    # other queues in the same file are separate
+    other = SqliteWorkQueue(work.path, 'run-2')
+    assert other.enqueue(DOMAINS[:3]) == 3
+    assert work.counts() == {'pending': 15}
+    other.close()
+
+
+def test_lease_and_ack(make_queue):
+    work = make_queue()
+    work.enqueue(DOMAINS[:10])
+    first = work.lease('a', 4)
+    second = work.lease('b', 4)
+    assert first == DOMAINS[:4]
+    assert second == DOMAINS[4:8]
+    assert work.counts() == {'leased': 8, 'pending': 2}
+
+    work.ack('a', [(url, 'collected') for url in first])
+    assert work.counts() == {'done': 4, 'leased': 4, 'pending': 2}
+    assert work.execute("SELECT DISTINCT outcome FROM jobs WHERE state = 'done'") == [('collected',)]
+    assert work.stats['queue_leased'] == 8
+    assert work.stats['queue_acked'] == 4
+
+
+def test_expired_lease_is_requeued_until_max_attempts(make_queue):
+    work = make_queue(lease_seconds=0.1, max_attempts=2)
+    work.enqueue(DOMAINS[:2])
+    assert work.lease('a', 2) == DOMAINS[:2]
+    time.sleep(0.15)
+    # instance a died, b picks its domains up once the lease runs out
+    assert work.lease('b', 2) == DOMAINS[:2]
+    assert work.stats['queue_expired'] == 2
+    assert attempts(work) == {url: 2 for url in DOMAINS[:2]}
+    time.sleep(0.15)
+    assert work.lease('c', 2) == []
+    assert work.counts() == {'dead': 2}
+
+
+def test_release(make_queue):
+    work = make_queue(max_attempts=2)
+    work.enqueue(DOMAINS[:4])
+    urls = work.lease('a', 4)
+    # only the owner can give its leases back
+    work.release('b', urls)
+    assert work.counts() == {'leased': 4}
+
+    work.release('a', urls[:2])
+    work.release('a', urls[2:], charge=False)
+    assert work.counts() == {'pending': 4}
+    assert attempts(work) == {urls[0]: 1, urls[1]: 1, urls[2]: 0, urls[3]: 0}
+
+    urls = work.lease('a', 4)
+    work.release('a', urls)
+    # the first two used both of their attempts
+    assert work.counts() == {'dead': 2, 'pending': 2}
+
+
+def test_lease_batches(make_queue):
+    work = make_queue()
+    work.enqueue(DOMAINS[:5])
+    held = work.lease('other', 1)
+    batches = lease_batches(work, 'a', 2, idle_seconds=0)
+    leased = next(batches) + next(batches)
+    assert leased == DOMAINS[1:5]
+    work.ack('a', [(url, 'collected') for url in leased])
+    # nothing pending, but another instance still holds a lease that may come back
+    assert next(batches) is None
+    work.ack('other', [(url, 'collected') for url in held])
+    assert list(batches) == []
+    assert queue_report(work.stats, work.counts()) == \
+        'work queue : leased 5 , acked 5 , released 0 , leases expired 0 | done 5'
+
+
+def crawl(batch):
+    if 'd00.test' in batch:
+        time.sleep(60)
+    return [(url, 'collected') for url in batch]
+
+
+def process(work, owner, workers, deadline):
+    '''the extractor's --queue loop: ack what finished, release what failed'''
+    pool = Pool(workers)
+    scheduler = Scheduler(pool, crawl, deadline, workers, poll=0.02)
+    try:
+        for batch, result, error in scheduler.run(lease_batches(work, owner, 4, idle_seconds=0)):
+            if result is None:
+                work.release(owner, batch, charge=error == 'deadline')
+            else:
+                work.ack(owner, result)
+    finally:
+        scheduler.shutdown()
+
+
+def test_stuck_instance_leaves_the_queue_to_the_others(make_queue):
+    work = make_queue(max_attempts=3)
+    work.enqueue(DOMAINS)
+    # one worker, hung on the first batch: the instance stops leasing instead of burning every attempt
+    process(work, 'stuck', 1, 0.3)
+    assert work.counts() == {'pending': 40}
+    assert max(attempts(work).values()) == 1
+    assert work.stats['queue_leased'] == 4
+
+    healthy = make_queue(max_attempts=3)
+    process(healthy, 'healthy', 2, 0.3)
+    counts = healthy.counts()
+    # the hanging batch runs out of attempts, everything else is processed
+    assert counts['done'] >= 36
+    assert counts.get('dead', 0) + counts['done'] == 40
@@ -6,29 +6,67 @@ for ScamMagnifier to analyze.
 
 ✅ Filters out unwanted domains (adult, gambling, crypto).
 ✅ Saves clean URLs to `domain_list.csv` (used by feature extractor).
+
+Large lists (CSV, TXT or JSONL, e.g. the full Tranco list) are streamed in
+chunks, filtered and deduplicated on the fly and written to the domain list
+or bulk loaded into MongoDB:
+
+    python src/app.py --input_file top-1m.csv [--output_file domain_list.csv | --mongo]
 """
 
-import pandas as pd
-import re
+import argparse
 import os
 import whois
 import undetected_chromedriver as uc
 
+from config import *
+from domain_stream import DomainStream, FILTER_RE, stream_report, write_domain_list
+from seen_domains import SeenDomains
+
 def website_filtering(url_list):
     """Filter out unwanted domains (adult, gambling, crypto, etc.)"""
-    gambling = re.compile(r"casino|bet|poker|gambling", re.I)
-    adult = re.compile(r"adult|sex|porn|xxx|erotic|nude|dating|romance", re.I)
-    crypto = re.compile(r"crypto|bitcoin|blockchain|coin|wallet", re.I)
-
-    filtered = []
-    for url in url_list:
-        if not (gambling.search(url) or adult.search(url) or crypto.search(url)):
-            filtered.append(url)
+    filtered = [url for url in url_list if not FILTER_RE.search(url)]
     print(f"🔹 Filtered down to {len(filtered)} safe domains out of {len(url_list)}.")
     return filtered
 
+def stream_feed(args):
+    """stream --input_file through the filter into the domain list file or MongoDB"""
+    # SEEN_INDEX_PATH: drop domains the feature extractor processed within SEEN_TTL_HOURS
+    seen = SeenDomains(args.seen_index, seen_ttl_hours) if args.seen_index else None
+    stream = DomainStream(chunk_size=args.chunk_size, filtering=not args.no_filter, seen=seen)
+    domains = stream(*args.input_file)
+    output_file = None
+    if args.mongo:
+        from storage.database import Database
+        from storage.mongodb.mongo_utility import bulk_upsert_domains
+        Database.instance().create_connection(
+            f"mongodb://{mongo_username}:{mongo_password}@{mongo_host}:{mongo_port}/{mongo_db}")
+        counts = bulk_upsert_domains(domains, batch_size=args.batch_size, limit=save_limit)
+        print(f"✅ MongoDB : inserted {counts['inserted']} , already known {counts['skipped']} , failed {counts['failed']}")
+    else:
+        output_file = os.path.abspath(args.output_file)
+        count = write_domain_list(domains, output_file)
+        print(f"✅ {count} domains saved to: {output_file}")
+    print(stream_report(stream.stats, stream.elapsed()))
+    return output_file
+
 def main():
+    parser = argparse.ArgumentParser(description='prepare the candidate domain list')
+    parser.add_argument('--input_file', type=str, nargs='+', help='csv / txt / jsonl domain lists, the demo seeds when left out')
+    parser.add_argument('--output_file', type=str, default='domain_list.csv')
+    parser.add_argument('--mongo', action='store_true', help='bulk load into MongoDB instead of writing the output file')
+    parser.add_argument('--chunk_size', type=int, default=10000, help='rows read per chunk')
+    parser.add_argument('--batch_size', type=int, default=1000, help='domains per MongoDB bulk write')
+    parser.add_argument('--no_filter', action='store_true', help='keep gambling / adult / crypto domains')
+    parser.add_argument('--seen_index', type=str, default=seen_index_path, help="the extractor's seen index, SEEN_INDEX_PATH by default")
+    args = parser.parse_args()
+
     print("🚀 Starting Domain Feed module...")
+    if args.input_file:
+        output_file = stream_feed(args)
+        if output_file:
+            print_next_step(output_file)
+        return
 
     # Step 1: Sample domains (you can add or load from file later)
     seed_domains = [
@@ -48,11 +86,12 @@ def main():
     clean_domains = website_filtering(seed_domains)
 
     # Step 3: Save clean domains for the feature extractor
-    df = pd.DataFrame(clean_domains, columns=["URL"])
-    output_file = os.path.abspath("domain_list.csv")
-    df.to_csv(output_file, index=False)
+    output_file = os.path.abspath(args.output_file)
+    write_domain_list(clean_domains, output_file)
     print(f"✅ Domain list saved successfully to: {output_file}")
+    print_next_step(output_file)
 
+def print_next_step(output_file):
     # Optional next step: print user guidance
     print("\nNext Step:")
     print("Run this command to extract features for these domains:\n")
@@ -6,4 +6,12 @@ mongo_host = os.getenv('MONGO_HOSTNAME','localhost')
 mongo_port = os.getenv('MONGO_PORT','27017')
 mongo_db = os.getenv('MONGO_DB','mydatabase')
 save_limit = int(os.getenv('LIMIT',100000))
-scheduler_time_interval = int(os.getenv('SCHEDULER_JOB_INTERVAL',0))
\ No newline at end of file
+scheduler_time_interval = int(os.getenv('SCHEDULER_JOB_INTERVAL',0))
+recrawl_limit = int(os.getenv('RECRAWL_LIMIT',10000))
+recrawl_min_hours = int(os.getenv('RECRAWL_MIN_HOURS',6))
+recrawl_max_hours = int(os.getenv('RECRAWL_MAX_HOURS',24*30))
+recrawl_backoff = float(os.getenv('RECRAWL_BACKOFF',1.5))
+recrawl_timeout = int(os.getenv('RECRAWL_TIMEOUT',10))
+recrawl_concurrency = int(os.getenv('RECRAWL_CONCURRENCY',16))
+seen_index_path = os.getenv('SEEN_INDEX_PATH','')
+seen_ttl_hours = float(os.getenv('SEEN_TTL_HOURS',24*7))
\ No newline at end of file
@@ -0,0 +1,162 @@
+"""
+Streaming domain lists
+----------------------
+Reads CSV, TXT or JSONL domain lists of any size in chunks, canonicalizes
+every entry to a bare host name, drops unwanted categories with one
+combined pattern and duplicates as it goes. Only the current chunk and the
+set of domains kept so far are held in memory.
+"""
+
+import csv
+import json
+import re
+import time
+from collections import Counter
+from itertools import islice
+
+FILTER_WORDS = {
+    'gambling': ['casino', 'bet', 'poker', 'gambling'],
+    'adult': ['adult', 'sex', 'porn', 'xxx', 'erotic', 'nude', 'dating', 'romance'],
+    'crypto': ['crypto', 'bitcoin', 'blockchain', 'coin', 'wallet'],
+}
+
+# one alternation of every category, a single search per domain
+FILTER_RE = re.compile('|'.join(word for words in FILTER_WORDS.values() for word in words), re.I)
+
+HOST_RE = re.compile(r'^(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z0-9-]{2,63}$')
+SCHEME_RE = re.compile(r'^[a-z][a-z0-9+.-]*://')
+JSON_KEYS = ['domain', 'url', 'URL', 'host']
+HEADERS = {'url', 'domain', 'domains', 'host', 'website'}
+
+
+def canonical_domain(value):
+    """bare lower case host of a url or domain ("https://www.Shop.com:443/a" -> "shop.com"), None if it is not one"""
+    value = value.strip().strip('"\'').lower()
+    value = SCHEME_RE.sub('', value)
+    value = value.split('/', 1)[0].split('?', 1)[0].split('#', 1)[0]
+    value = value.rsplit('@', 1)[-1].split(':', 1)[0].rstrip('.')
+    if value.startswith('www.'):
+        value = value[len('www.'):]
+    if not HOST_RE.match(value):
+        return None
+    return value
+
+
+def is_filtered(domain):
+    return FILTER_RE.search(domain) is not None
+
+
+def _values(path):
+    """raw entries of a list file, one per row, read lazily"""
+    if path.endswith('.jsonl') or path.endswith('.ndjson'):
+        with open(path, 'r', encoding='utf-8', errors='ignore') as fin:
+            for line in fin:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    yield line
+                    continue
+                if isinstance(item, dict):
+                    item = next((item[k] for k in JSON_KEYS if item.get(k)), '')
+                yield str(item)
+    else:
+        # txt lists are one column csv files
+        with open(path, 'r', encoding='utf-8', errors='ignore', newline='') as fin:
+            for row in csv.reader(fin):
+                if not row:
+                    continue
+                # tranco style "rank,domain" rows keep the domain in the last column
+                yield row[-1] if len(row) > 1 and row[0].strip().isdigit() else row[0]
+
+
+def read_chunks(path, chunk_size=10000):
+    """lists of at most chunk_size raw entries of a list file"""
+    values = _values(path)
+    while True:
+        chunk = list(islice(values, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class DomainStream:
+    """
+    Iterates over the clean, unique domains of one or more list files.
+    stats counts rows / invalid / filtered / duplicate / seen / kept, and
+    progress is printed every report_every rows. With a SeenDomains index,
+    domains the extractor processed recently are dropped too (seen).
+    """
+
+    def __init__(self, chunk_size=10000, filtering=True, report_every=100000, seen=None):
+        self.chunk_size = chunk_size
+        self.filtering = filtering
+        self.seen_index = seen
+        self.report_every = report_every
+        self.unique = set()
+        self.stats = Counter()
+        self.start = None
+
+    def clean(self, chunk):
+        """canonical, allowed and not yet seen domains of a chunk of raw entries"""
+        kept = []
+        for value in chunk:
+            self.stats['rows'] += 1
+            domain = canonical_domain(value)
+            if domain is None:
+                if value.strip().lower() not in HEADERS:
+                    self.stats['invalid'] += 1
+                continue
+            if self.filtering and is_filtered(domain):
+                self.stats['filtered'] += 1
+                continue
+            if domain in self.unique:
+                self.stats['duplicate'] += 1
+                continue
+            self.unique.add(domain)
+            kept.append(domain)
+        if self.seen_index is not None and kept:
+            recent = self.seen_index.recent(kept)
+            if recent:
+                kept = [domain for domain in kept if domain not in recent]
+                self.stats['seen'] += len(recent)
+        self.stats['kept'] += len(kept)
+        return kept
+
+    def chunks(self, *paths):
+        self.start = self.start or time.time()
+        reported = self.stats['rows']
+        for path in paths:
+            for chunk in read_chunks(path, self.chunk_size):
+                kept = self.clean(chunk)
+                if self.stats['rows'] - reported >= self.report_every:
+                    reported = self.stats['rows']
+                    print(stream_report(self.stats, self.elapsed()))
+                if kept:
+                    yield kept
+
+    def __call__(self, *paths):
+        for chunk in self.chunks(*paths):
+            yield from chunk
+
+    def elapsed(self):
+        return time.time() - self.start if self.start else 0
+
+
+def write_domain_list(domains, output_file):
+    """stream domains to a domain list csv (URL header, one domain per row), returns how many were written"""
+    count = 0
+    with open(output_file, 'w', encoding='utf-8', newline='') as fout:
+        fout.write('URL\n')
+        for domain in domains:
+            fout.write(domain + '\n')
+            count += 1
+    return count
+
+
+def stream_report(stats, seconds):
+    rate = stats['rows'] / seconds if seconds > 0 else 0
+    return f"{stats['rows']} rows , kept {stats['kept']} , filtered {stats['filtered']} , " \
+           f"duplicate {stats['duplicate']} , seen {stats['seen']} , invalid {stats['invalid']} | {seconds:.1f}s , {rate:.0f} rows/s"
@@ -0,0 +1,42 @@
+"""
+Bulk domain ingestion
+---------------------
+Streams a domain list (txt, jsonl or a csv whose first column holds the
+domains, e.g. domain_list.csv / a Tranco export) unfiltered into the domains
+collection with unordered bulk upserts.
+
+    python src/ingest.py --input_file domain_list.csv [--batch_size 1000] [--update_existing]
+
+LIMIT (save_limit) caps how many domains are sent, 0 means no limit.
+"""
+
+import argparse
+
+from config import *
+from domain_stream import DomainStream, stream_report
+from storage.database import Database
+from storage.mongodb.mongo_utility import bulk_upsert_domains
+
+
+def main():
+    parser = argparse.ArgumentParser(description='bulk load a domain list into MongoDB')
+    parser.add_argument('--input_file', type=str, required=True, help='txt / csv list of domains')
+    parser.add_argument('--batch_size', type=int, default=1000)
+    parser.add_argument('--monitor', type=int, default=1)
+    parser.add_argument('--crawl_freq', type=int, default=48, help='hours between crawls of new domains')
+    parser.add_argument('--update_existing', action='store_true', help='also set monitor / crawl_freq on domains already stored')
+    args = parser.parse_args()
+
+    Database.instance().create_connection(
+        f"mongodb://{mongo_username}:{mongo_password}@{mongo_host}:{mongo_port}/{mongo_db}")
+    stream = DomainStream(filtering=False)
+    counts = bulk_upsert_domains(stream(args.input_file), args.monitor, args.crawl_freq,
+                                 args.batch_size, save_limit, args.update_existing)
+    print(f"inserted {counts['inserted']} , updated {counts['updated']} , skipped {counts['skipped']} , "
+          f"duplicates {counts['duplicate']} , failed {counts['failed']} | "
+          f"{counts['seconds']}s , {counts['rows_per_s']} rows/s")
+    print(stream_report(stream.stats, stream.elapsed()))
+
+
+if __name__ == "__main__":
+    main()
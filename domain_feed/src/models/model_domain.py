@@ -6,10 +6,20 @@ class Domain(Document):
     register_date = DateTimeField(default=datetime.now)
     last_crawl = DateTimeField()
     next_crawl = DateTimeField(default=datetime(1970, 1, 1))
+    # hours between two crawls, adapted by the recrawl scheduler
     crawl_freq = IntField(required=True,default=48)
     status = IntField(default=0)
     monitor = IntField(default=1)
 
+    # validators and content hash of the last crawl, for conditional recrawls
+    etag = StringField()
+    last_modified = StringField()
+    content_hash = StringField()
+    last_change = DateTimeField()
+    unchanged_crawls = IntField(default=0)
+
     meta = {
-        'collection': 'domains'
+        'collection': 'domains',
+        # the recrawl scheduler asks for monitored domains by next_crawl
+        'indexes': [('monitor', 'next_crawl'), 'next_crawl']
     }
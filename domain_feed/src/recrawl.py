@@ -0,0 +1,164 @@
+"""
+Recrawl scheduler
+-----------------
+Picks the monitored domains whose next_crawl is due, checks them with a
+conditional GET (If-None-Match / If-Modified-Since) and a content hash, and
+writes only the domains that changed (or were never crawled) to the
+feature extractor's input file. Run the extractor on that file with
+--refresh so it fetches the new version instead of its cached page.
+
+The crawl interval adapts: every unchanged check multiplies crawl_freq by
+RECRAWL_BACKOFF (up to RECRAWL_MAX_HOURS), a change halves it (down to
+RECRAWL_MIN_HOURS), and next_crawl = now + crawl_freq hours.
+"""
+
+import argparse
+import hashlib
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+from config import *
+from models.model_domain import Domain
+from storage.database import Database
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36')
+
+# scripts, styles and whitespace change on every load of many pages (nonces, timestamps)
+VOLATILE_RE = re.compile(r'<(script|style)\b.*?</\1\s*>|\s+', re.IGNORECASE | re.DOTALL)
+
+
+def content_hash(html):
+    '''hash of a page source without its scripts, styles and whitespace'''
+    return hashlib.sha256(VOLATILE_RE.sub('', html).encode('utf-8', errors='ignore')).hexdigest()
+
+
+class RecrawlScheduler:
+
+    def __init__(self, session=None, min_hours=None, max_hours=None, backoff=None, timeout=None, concurrency=None):
+        self.min_hours = min_hours or recrawl_min_hours
+        self.max_hours = max_hours or recrawl_max_hours
+        self.backoff = backoff or recrawl_backoff
+        self.timeout = timeout or recrawl_timeout
+        self.concurrency = concurrency or recrawl_concurrency
+        if session is None:
+            session = requests.Session()
+            session.headers['User-Agent'] = USER_AGENT
+            adapter = HTTPAdapter(pool_connections=self.concurrency, pool_maxsize=self.concurrency)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+        self.stats = Counter()
+
+    def due(self, limit=None, now=None):
+        '''monitored domains whose next_crawl has passed, most overdue first (uses the monitor/next_crawl index)'''
+        now = now or datetime.now()
+        return list(Domain.objects(monitor=1, next_crawl__lte=now)
+                    .order_by('next_crawl').limit(limit or recrawl_limit))
+
+    def check(self, domain):
+        '''
+        conditional fetch of a domain, returns (outcome, etag, last_modified, hash)
+        with outcome 'new', 'changed', 'unchanged' or 'failed'
+        '''
+        headers = {}
+        if domain.content_hash:
+            # validators only help when there is a hash to fall back on
+            if domain.etag:
+                headers['If-None-Match'] = domain.etag
+            if domain.last_modified:
+                headers['If-Modified-Since'] = domain.last_modified
+        url = domain.domain if domain.domain.startswith('http') else 'https://' + domain.domain
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout, verify=False)
+        except Exception as e:
+            print(f"[recrawl] {domain.domain} : {e}")
+            return 'failed', domain.etag, domain.last_modified, domain.content_hash
+
+        if response.status_code == 304:
+            return 'unchanged', domain.etag, domain.last_modified, domain.content_hash
+        if response.status_code >= 400:
+            return 'failed', domain.etag, domain.last_modified, domain.content_hash
+
+        digest = content_hash(response.text)
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not domain.content_hash:
+            return 'new', etag, last_modified, digest
+        return ('unchanged' if digest == domain.content_hash else 'changed'), etag, last_modified, digest
+
+    def reschedule(self, domain, outcome, etag, last_modified, digest, now=None):
+        '''write the result of a check back to the domain and set its next crawl'''
+        now = now or datetime.now()
+        freq = domain.crawl_freq or 48
+        update = {'set__last_crawl': now}
+        if outcome == 'failed':
+            # try again soon, without touching the interval
+            update['set__next_crawl'] = now + timedelta(hours=self.min_hours)
+        else:
+            if outcome == 'unchanged':
+                freq = min(self.max_hours, max(freq + 1, int(freq * self.backoff)))
+                update['inc__unchanged_crawls'] = 1
+            else:
+                if outcome == 'changed':
+                    freq = max(self.min_hours, freq // 2)
+                update['set__unchanged_crawls'] = 0
+                update['set__last_change'] = now
+            update.update({
+                'set__crawl_freq': freq,
+                'set__next_crawl': now + timedelta(hours=freq),
+                'set__etag': etag,
+                'set__last_modified': last_modified,
+                'set__content_hash': digest,
+            })
+        Domain.objects(id=domain.id).update_one(**update)
+
+    def run(self, limit=None):
+        '''check every due domain, returns the names of the ones to extract again'''
+        domains = self.due(limit)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = list(executor.map(self.check, domains))
+
+        todo = []
+        for domain, result in zip(domains, results):
+            self.reschedule(domain, *result)
+            self.stats[result[0]] += 1
+            if result[0] in ('new', 'changed'):
+                todo.append(domain.domain)
+        return todo
+
+
+def recrawl_report(stats):
+    checked = sum(stats.values())
+    skipped = stats['unchanged'] / checked if checked else 0
+    return f"recrawl : {checked} due , new {stats['new']} , changed {stats['changed']} , " \
+           f"unchanged {stats['unchanged']} ({skipped:.1%} skipped) , failed {stats['failed']}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='recrawl the due monitored domains, list the ones that changed')
+    parser.add_argument('--output_file', type=str, required=True, help='domains to extract again, one per line')
+    parser.add_argument('--limit', type=int, help='at most this many due domains (RECRAWL_LIMIT)')
+    args = parser.parse_args()
+
+    Database.instance().create_connection(
+        f"mongodb://{mongo_username}:{mongo_password}@{mongo_host}:{mongo_port}/{mongo_db}")
+    scheduler = RecrawlScheduler()
+    todo = scheduler.run(args.limit)
+    with open(args.output_file, 'w', encoding='utf-8') as fout:
+        for domain in todo:
+            fout.write(domain + '\n')
+    print(recrawl_report(scheduler.stats))
+    print(f"{len(todo)} domains written to {args.output_file}")
+
+
+if __name__ == "__main__":
+    main()
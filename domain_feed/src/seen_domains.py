@@ -0,0 +1,62 @@
+"""
+Seen domains
+------------
+Read side of the feature extractor's seen index (its seen_index.py writes
+SEEN_INDEX_PATH on the shared data volume). Domains the extractor collected
+or skipped within SEEN_TTL_HOURS are dropped from the feed, so a daily list
+does not send them through the pipeline again.
+"""
+
+import os
+import sqlite3
+import time
+
+from tld import get_fld
+
+# outcomes that count as processed, failed domains are fed again
+DONE = ('collected', 'skipped')
+BATCH = 500
+
+
+def registrable_domain(domain):
+    """shop.example.co.uk -> example.co.uk, the key the extractor records under"""
+    return get_fld(domain, fix_protocol=True, fail_silently=True) or domain
+
+
+class SeenDomains:
+
+    def __init__(self, path, ttl_hours):
+        self.path = path
+        self.ttl = 3600 * ttl_hours
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            # read only, the extractor is the writer
+            self._conn = sqlite3.connect(f"file:{os.path.abspath(self.path)}?mode=ro", uri=True, timeout=30)
+        return self._conn
+
+    def recent(self, domains):
+        """the domains (as given) whose registrable domain was processed within the ttl"""
+        if not os.path.exists(self.path):
+            return set()
+        keys = {}
+        for domain in domains:
+            keys.setdefault(registrable_domain(domain), []).append(domain)
+        names = list(keys)
+        since = time.time() - self.ttl
+        found = set()
+        for i in range(0, len(names), BATCH):
+            part = names[i:i + BATCH]
+            rows = self.conn.execute(
+                f"SELECT domain FROM seen WHERE domain IN ({','.join('?' * len(part))}) AND processed_at >= ? "
+                f"AND outcome IN ({','.join('?' * len(DONE))})", part + [since] + list(DONE)).fetchall()
+            for (name,) in rows:
+                found.update(keys[name])
+        return found
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
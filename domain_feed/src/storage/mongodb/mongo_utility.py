@@ -1,4 +1,6 @@
-from pymongo import MongoClient
+import time
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
 from models.model_domain import *
 from datetime import datetime
 
@@ -26,4 +28,85 @@ def find_domain(domain_name):
         else:
             print("Domain not found.")
     except Exception as e:
-        print(f"Error finding domain: {e}")
\ No newline at end of file
+        print(f"Error finding domain: {e}")
+
+
+def find_domains(domain_names, batch_size=1000):
+    """{domain: Domain} of the given names that exist, one query per batch"""
+    names = list(domain_names)
+    found = {}
+    for i in range(0, len(names), batch_size):
+        for domain in Domain.objects(domain__in=names[i:i + batch_size]):
+            found[domain.domain] = domain
+    return found
+
+
+def ensure_indexes():
+    """create the domain / monitor+next_crawl / next_crawl indexes if they are missing"""
+    Domain.ensure_indexes()
+
+
+def _flush(collection, operations, counts):
+    try:
+        result = collection.bulk_write(operations, ordered=False)
+        details = result.bulk_api_result
+    except BulkWriteError as e:
+        # unordered, so the rest of the batch is written; count what failed
+        details = e.details
+        counts['failed'] += len(details.get('writeErrors', []))
+    counts['inserted'] += details.get('nUpserted', 0)
+    counts['updated'] += details.get('nModified', 0)
+    counts['skipped'] += details.get('nMatched', 0) - details.get('nModified', 0)
+
+
+def bulk_upsert_domains(domain_names, monitor=1, crawl_freq=48, batch_size=1000, limit=None, update_existing=False):
+    """
+    Insert domains in unordered bulk upserts of batch_size, reading
+    domain_names lazily (any iterable, e.g. a file being streamed).
+
+    New domains get the Domain defaults. Existing ones are left as they are
+    (skipped), or with update_existing get the given monitor / crawl_freq
+    (updated when that changes them). Duplicates within the input are only
+    sent once. At most limit domains are sent (save_limit, 0 / None is no limit).
+
+    Returns the counts of inserted / updated / skipped / failed / duplicate
+    domains, plus seconds and rows_per_s.
+    """
+    ensure_indexes()
+    collection = Domain._get_collection()
+    counts = {'inserted': 0, 'updated': 0, 'skipped': 0, 'failed': 0, 'duplicate': 0}
+    seen = set()
+    operations = []
+    sent = 0
+    start = time.time()
+
+    # every new document is the same apart from its name, build it through the model once
+    template = Domain(domain='-', register_date=datetime.now(), monitor=monitor, crawl_freq=crawl_freq).to_mongo().to_dict()
+    if update_existing:
+        template = {k: v for k, v in template.items() if k not in ('monitor', 'crawl_freq')}
+
+    for name in domain_names:
+        if limit and sent >= limit:
+            break
+        if name in seen:
+            counts['duplicate'] += 1
+            continue
+        seen.add(name)
+
+        change = {'$setOnInsert': dict(template, domain=name)}
+        if update_existing:
+            change['$set'] = {'monitor': monitor, 'crawl_freq': crawl_freq}
+        operations.append(UpdateOne({'domain': name}, change, upsert=True))
+        sent += 1
+
+        if len(operations) >= batch_size:
+            _flush(collection, operations, counts)
+            operations = []
+            print(f"{sent} domains sent , {sent / max(time.time() - start, 1e-9):.0f} rows/s")
+
+    if operations:
+        _flush(collection, operations, counts)
+
+    counts['seconds'] = round(time.time() - start, 2)
+    counts['rows_per_s'] = round(sent / max(time.time() - start, 1e-9), 1)
+    return counts
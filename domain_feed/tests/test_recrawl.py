@@ -0,0 +1,186 @@
+from datetime import datetime, timedelta
+
+import mongoengine
+import mongomock
+import pytest
+import requests
+
+from models.model_domain import Domain
+from recrawl import RecrawlScheduler, content_hash, recrawl_report
+
+NOW = datetime(2024, 5, 1, 12, 0)
+PAGE = '<html><head><script>var nonce = 1;</script></head><body><h1>Shop</h1><p>cheap shoes</p></body></html>'
+
+
+@pytest.fixture(autouse=True)
+def database():
+    mongoengine.connect('recrawl_test', host='mongodb://localhost', mongo_client_class=mongomock.MongoClient,
+                        uuidRepresentation='standard')
+    yield
+    Domain.drop_collection()
+    mongoengine.disconnect()
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, text='', headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+
+class FakeSession:
+    '''answers every url with the response (or raises the exception) registered for it'''
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None, verify=True):
+        self.requests.append((url, dict(headers or {})))
+        response = self.responses[url]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def make_domain(name, **fields):
+    fields.setdefault('next_crawl', NOW - timedelta(hours=1))
+    domain = Domain(domain=name, **fields)
+    domain.save()
+    return domain
+
+
+def scheduler(responses):
+    return RecrawlScheduler(session=FakeSession(responses), min_hours=6, max_hours=720, backoff=1.5)
+
+
+def test_content_hash_ignores_scripts_styles_and_whitespace():
+    noisy = PAGE.replace('var nonce = 1;', 'var nonce = 2;').replace('<h1>', '\n  <h1>')
+    assert content_hash(noisy) == content_hash(PAGE)
+    assert content_hash(PAGE.replace('cheap', 'free')) != content_hash(PAGE)
+
+
+def test_new_domain_has_no_validators_sent():
+    domain = make_domain('new.test')
+    recrawl = scheduler({'https://new.test': FakeResponse(200, PAGE, {'ETag': '"v1"'})})
+    outcome, etag, last_modified, digest = recrawl.check(domain)
+    assert (outcome, etag, last_modified, digest) == ('new', '"v1"', None, content_hash(PAGE))
+    assert recrawl.session.requests == [('https://new.test', {})]
+
+
+def test_not_modified():
+    domain = make_domain('same.test', etag='"v1"', last_modified='Tue, 30 Apr 2024 10:00:00 GMT',
+                         content_hash=content_hash(PAGE))
+    recrawl = scheduler({'https://same.test': FakeResponse(304)})
+    assert recrawl.check(domain) == ('unchanged', '"v1"', 'Tue, 30 Apr 2024 10:00:00 GMT', content_hash(PAGE))
+    assert recrawl.session.requests[0][1] == {'If-None-Match': '"v1"',
+                                              'If-Modified-Since': 'Tue, 30 Apr 2024 10:00:00 GMT'}
+
+
+def test_hash_match_is_unchanged():
+    domain = make_domain('nohdr.test', content_hash=content_hash(PAGE))
+    noisy = PAGE.replace('var nonce = 1;', 'var nonce = 7;')
+    recrawl = scheduler({'https://nohdr.test': FakeResponse(200, noisy)})
+    assert recrawl.check(domain) == ('unchanged', None, None, content_hash(PAGE))
+
+
+def test_changed_content():
+    domain = make_domain('moved.test', etag='"v1"', content_hash=content_hash(PAGE))
+    changed = PAGE.replace('cheap shoes', 'sold out')
+    recrawl = scheduler({'https://moved.test': FakeResponse(200, changed, {'ETag': '"v2"'})})
+    assert recrawl.check(domain) == ('changed', '"v2"', None, content_hash(changed))
+
+
+@pytest.mark.parametrize('response', [FakeResponse(503), requests.ConnectionError('refused')])
+def test_failure_keeps_the_old_validators(response):
+    domain = make_domain('down.test', etag='"v1"', content_hash='abc')
+    recrawl = scheduler({'https://down.test': response})
+    assert recrawl.check(domain) == ('failed', '"v1"', None, 'abc')
+
+
+def test_unchanged_backs_off():
+    domain = make_domain('slow.test', crawl_freq=48, unchanged_crawls=2, content_hash='abc')
+    recrawl = scheduler({})
+    recrawl.reschedule(domain, 'unchanged', '"v1"', None, 'abc', now=NOW)
+    domain.reload()
+    assert domain.crawl_freq == 72
+    assert domain.next_crawl == NOW + timedelta(hours=72)
+    assert domain.last_crawl == NOW
+    assert domain.unchanged_crawls == 3
+    assert domain.last_change is None
+
+
+def test_backoff_grows_small_intervals_and_stops_at_max():
+    recrawl = scheduler({})
+    small = make_domain('small.test', crawl_freq=1)
+    recrawl.reschedule(small, 'unchanged', None, None, 'abc', now=NOW)
+    small.reload()
+    # 1 * 1.5 rounds down to 1, the interval still grows by an hour
+    assert small.crawl_freq == 2
+
+    large = make_domain('large.test', crawl_freq=600)
+    recrawl.reschedule(large, 'unchanged', None, None, 'abc', now=NOW)
+    large.reload()
+    assert large.crawl_freq == 720
+    assert large.next_crawl == NOW + timedelta(hours=720)
+
+
+def test_change_halves_the_interval():
+    recrawl = scheduler({})
+    domain = make_domain('fast.test', crawl_freq=48, unchanged_crawls=5, content_hash='abc')
+    recrawl.reschedule(domain, 'changed', '"v2"', 'Wed, 01 May 2024 10:00:00 GMT', 'def', now=NOW)
+    domain.reload()
+    assert domain.crawl_freq == 24
+    assert domain.next_crawl == NOW + timedelta(hours=24)
+    assert domain.unchanged_crawls == 0
+    assert domain.last_change == NOW
+    assert (domain.etag, domain.last_modified, domain.content_hash) == \
+        ('"v2"', 'Wed, 01 May 2024 10:00:00 GMT', 'def')
+
+    low = make_domain('low.test', crawl_freq=8)
+    recrawl.reschedule(low, 'changed', None, None, 'def', now=NOW)
+    low.reload()
+    assert low.crawl_freq == 6
+
+
+def test_new_keeps_the_interval():
+    recrawl = scheduler({})
+    domain = make_domain('first.test', crawl_freq=48)
+    recrawl.reschedule(domain, 'new', '"v1"', None, 'abc', now=NOW)
+    domain.reload()
+    assert domain.crawl_freq == 48
+    assert domain.last_change == NOW
+    assert domain.content_hash == 'abc'
+
+
+def test_failure_retries_soon_without_touching_the_interval():
+    recrawl = scheduler({})
+    domain = make_domain('down.test', crawl_freq=96, etag='"v1"', content_hash='abc', unchanged_crawls=4)
+    recrawl.reschedule(domain, 'failed', '"v1"', None, 'abc', now=NOW)
+    domain.reload()
+    assert domain.crawl_freq == 96
+    assert domain.next_crawl == NOW + timedelta(hours=6)
+    assert domain.unchanged_crawls == 4
+    assert domain.content_hash == 'abc'
+
+
+def test_run_lists_new_and_changed_domains():
+    make_domain('new.test')
+    make_domain('same.test', etag='"v1"', content_hash=content_hash(PAGE))
+    make_domain('moved.test', content_hash=content_hash(PAGE))
+    make_domain('down.test', content_hash='abc')
+    make_domain('later.test', next_crawl=datetime.now() + timedelta(hours=5))
+    make_domain('off.test', monitor=0)
+    recrawl = scheduler({
+        'https://new.test': FakeResponse(200, PAGE),
+        'https://same.test': FakeResponse(304),
+        'https://moved.test': FakeResponse(200, PAGE.replace('cheap', 'free')),
+        'https://down.test': FakeResponse(500),
+    })
+    assert sorted(recrawl.run()) == ['moved.test', 'new.test']
+    assert sorted(url for url, _ in recrawl.session.requests) == \
+        ['https://down.test', 'https://moved.test', 'https://new.test', 'https://same.test']
+    assert recrawl_report(recrawl.stats) == \
+        'recrawl : 4 due , new 1 , changed 1 , unchanged 1 (25.0% skipped) , failed 1'
+    # none of them is due any more
+    assert recrawl.due() == []
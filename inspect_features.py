@@ -2,8 +2,11 @@ import pickle as pkl
 import numpy as np
 import argparse
 import os
+import sys
 import pandas as pd
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "domain_feature_extractor", "src"))
+
 def main(args):
     path = args.input_file
 
@@ -11,6 +14,10 @@ def main(args):
         print(f"[ERROR] File not found: {path}")
         return
 
+    if os.path.isdir(path):
+        inspect_store(path)
+        return
+
     with open(path, "rb") as f:
         data = pkl.load(f)
 
@@ -60,9 +67,40 @@ def main(args):
         print("\n[WARNING] Could not create DataFrame summary:")
         print(e)
 
+def inspect_store(path):
+    from feature_store import FeatureStore
+
+    store = FeatureStore(path)
+    print("=== SCHEMA ===")
+    for c in store.schema["columns"]:
+        print(f" - {c['name']} ({c['dtype']})")
+    print(f"country columns expand to {store.n_countries} one-hot columns each")
+
+    print("\n=== BASIC STATS ===")
+    print(f"Num domains: {len(store)}")
+    print(f"Num feature columns: {len(store.names)} ({store.to_dense().shape[1]} dense)")
+    if "template_cluster" in store.meta_names:
+        clusters = store.column("template_cluster")
+        print(f"Template clusters: {len(set(clusters[clusters >= 0].tolist()))} "
+              f"({int((clusters >= 0).sum())} domains clustered)")
+
+    df = store.to_frame()
+    print("\n=== FIRST 5 ROWS ===")
+    print(df.head())
+
+    print("\n=== PER-FEATURE SUMMARY ===")
+    print(df.drop(columns=["URL", "country", "host_country"]).describe().T)
+
+    countries = store.schema["countries"]
+    for name in ["country", "host_country"]:
+        counts = df[name].value_counts().head(5)
+        labels = [countries[i] if countries and i >= 0 else i for i in counts.index]
+        print(f"\n=== TOP {name.upper()} ===")
+        print(dict(zip(labels, counts.values.tolist())))
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Inspect domain features pickle file.")
     parser.add_argument("--input_file", type=str, required=True,
-                        help="Path to features_output.pkl")
+                        help="Path to features_output.pkl or a columnar .features directory")
     args = parser.parse_args()
     main(args)
@@ -5,6 +5,11 @@ from bs4 import BeautifulSoup
 from sentence_transformers import SentenceTransformer, util
 import numpy as np
 import re
+import os
+import sys
+# the page store is the feature extractor's, the Docker image copies it next to this file
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'domain_feature_extractor', 'src'))
+from page_store import PageStore
 
 
 # ===============================
@@ -81,6 +86,15 @@ def fetch_text(domain):
         return ""
 
 
+def load_text(pages, domain):
+    # page cached by the feature extractor, fetched only when it is not there
+    if pages is not None:
+        html = pages.get(domain)
+        if html is not None:
+            return extract_visible_text(html)
+    return fetch_text(domain)
+
+
 # ===============================
 # 5. MAIN PIPELINE
 # ===============================
@@ -89,6 +103,8 @@ def main(args):
     print("[INFO] Loading SBERT model…")
     model = SentenceTransformer("all-MiniLM-L6-v2")
 
+    pages = PageStore(args.input_dir) if args.input_dir else None
+
     df = pd.read_csv(args.input_file)
     domains = df["URL"].tolist()
 
@@ -99,7 +115,7 @@ def main(args):
     for domain in domains:
         print(f"\n[PROCESS] {domain}")
 
-        page_text = fetch_text(domain)
+        page_text = load_text(pages, domain)
         category, confidence = classify_with_sbert(model, page_text)
 
         print(f" → {category} ({confidence})")
@@ -119,6 +135,8 @@ def main(args):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="SBERT-only Shop Classifier")
+    parser.add_argument("--input_dir", type=str, required=False,
+                        help="page store / source_home of the feature extractor")
     parser.add_argument("--input_file", type=str, required=True)
     parser.add_argument("--output_file", type=str, required=True)
     args = parser.parse_args()
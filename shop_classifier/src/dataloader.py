@@ -8,7 +8,11 @@ from urllib.parse import urlparse
 from transformers import LongformerTokenizerFast
 from tld import get_fld
 from collections import defaultdict
+import sys
 import traceback
+# the page store is the feature extractor's, the Docker image copies it next to this file
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'domain_feature_extractor', 'src'))
+from page_store import PageStore, page_key
 
 class ContentDataset(Dataset):
     def __init__(self, filepaths, url_list=None, cache_path='../cache/combine_dataloader_no_brand.pkl', force_build=False, inference_mode=False):
@@ -38,53 +42,51 @@ class ContentDataset(Dataset):
             self.data_html, self.data_body, self.url, self.labels = pickle.load( open(cache_path, 'rb'))
         else:
             for directory, label in filepaths.items():
-                all_fnames = set(os.listdir(directory))
+                # page store of the crawler, packed pages and/or <url>.html files
+                pages = PageStore(directory)
+                all_keys = set(pages.keys())
                 for url in tqdm(list(url_list)):
-                    if url + '.html' in all_fnames:
-                        filename = url + '.html'
-                    else:
+                    if page_key(url) not in all_keys:
                         continue
-                    filepath = os.path.join(directory, filename)
                     # check if fname is in urls_list
-                    if filename.replace('.html', '') in url_list or filename.replace('.html', '') in url_list_no_slash:
-                        with open(filepath, 'r', encoding='utf-8') as fin:
-                            try:  
-                                # read content of file from .html
-                                data = str(fin.read())
-                                URL = filename.replace('.html', '').replace('https','')
-                                domain = self.extract_domain(URL)
+                    if url in url_list or url in url_list_no_slash:
+                        try:
+                            # read content of the page from the store
+                            data = pages.get(url)
+                            URL = url.replace('https','')
+                            domain = self.extract_domain(URL)
 
-                                if domain in visited:
-                                    visited_counter += 1
+                            if domain in visited:
+                                visited_counter += 1
 
-                                content = self.extract_txt(data)
+                            content = self.extract_txt(data)
 
-                                if domain not in visited:
-                                    if len(content) < 200:
-                                        continue
+                            if domain not in visited:
+                                if len(content) < 200:
+                                    continue
 
-                        
-                                    html_traverse = self.walker(BeautifulSoup(data))
 
-                                    tag_ids = [self.tag_to_ind(tag) for tag in html_traverse.split(' ')]
-                                    tag_len.append(len(tag_ids))
-                                    tag_ids= tag_ids + [len(self.tags) + 1]*(1024-len(tag_ids)) if len(tag_ids) < 1024 else tag_ids[:1024]
+                                html_traverse = self.walker(BeautifulSoup(data))
 
-                                    # inputs = self.tokenizer.encode_plus(content.lower(), padding="max_length", truncation= True, max_length=1024)
+                                tag_ids = [self.tag_to_ind(tag) for tag in html_traverse.split(' ')]
+                                tag_len.append(len(tag_ids))
+                                tag_ids= tag_ids + [len(self.tags) + 1]*(1024-len(tag_ids)) if len(tag_ids) < 1024 else tag_ids[:1024]
 
-                                    html, body = tag_ids, content.lower()
+                                # inputs = self.tokenizer.encode_plus(content.lower(), padding="max_length", truncation= True, max_length=1024)
 
-                                    self.data_html.append(html)
-                                    self.data_body.append(body)
-                                    self.url.append(URL)
-                                    self.labels.append(label)
+                                html, body = tag_ids, content.lower()
+
+                                self.data_html.append(html)
+                                self.data_body.append(body)
+                                self.url.append(URL)
+                                self.labels.append(label)
+
+                                visited.add(domain)
+                        except Exception as e:
+                            print(URL, e)
+                            traceback.print_exception(type(e), e, e.__traceback__)
+                            continue
 
-                                    visited.add(domain)
-                            except Exception as e:
-                                print(URL, e)
-                                traceback.print_exception(type(e), e, e.__traceback__)
-                                continue
-            
             self.visited = visited
             print('Domain Visited = %d | %d' %(len(self.visited), visited_counter))
             print('Data Len = %d' %len(self.url))
@@ -0,0 +1,291 @@
+"""
+Streaming pipeline runner: feed -> feature extraction -> domain classification
+-> shop categorization in one process, the stages linked by bounded queues
+so a domain reaches the classifiers as soon as its features are ready
+instead of after the last domain was crawled.
+
+    python ./src/pipeline.py --input_file domains.txt --output_dir <dir> --selected_languages en
+                             [--classifier my_model.py:classify] [--shop_workers 2] [--queue_size 32]
+
+Stages and their concurrency:
+  feed      one thread streaming the input lists (domain_feed/src/domain_stream.py),
+            filtered, deduplicated and cut to TASK_BATCH domain batches
+  extract   NUMBER_PROC crawler processes, the same workers as the feature extractor
+  classify  --classify_workers threads calling --classifier (module:function or
+            path.py:function taking (urls, feature rows) and returning [(label, score)]);
+            without one every domain is passed on as 'unclassified'
+  shop      --shop_workers threads running the shop classifier on the stored pages,
+            for domains labeled one of --shop_labels (every domain without a classifier)
+
+A full queue blocks the stage in front of it, so a slow classifier holds the
+crawl back instead of piling up results in memory. The usual files are
+written to --output_dir: features.pkl (plus the feature store / csv copies),
+classify.csv and shop.csv, the csv rows as they are produced.
+
+It needs the feature extractor and shop classifier requirements installed in
+one environment; --no_shop leaves out the shop stage (and sentence_transformers).
+"""
+import argparse
+import csv
+import importlib
+import importlib.util
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from queue import Empty, Queue
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+EXTRACTOR_SRC = os.path.join(ROOT, 'domain_feature_extractor', 'src')
+FEED_SRC = os.path.join(ROOT, 'domain_feed', 'src')
+SHOP_SRC = os.path.join(ROOT, 'shop_classifier', 'src')
+# the extractor's config must win over this directory's config.py
+sys.path.insert(0, EXTRACTOR_SRC)
+
+from multiprocessing import Pool  # noqa: E402
+
+from app import init_crawler, crawl_batch, seen_outcome  # noqa: E402
+from checkpoint import ResultWriter  # noqa: E402
+from config import number_proc, cache_mode, domain_deadline, task_batch, task_deadline, feature_format, \
+    lang_filter, seen_index  # noqa: E402
+from geo import get_geo_service  # noqa: E402
+from language import get_identifier  # noqa: E402
+from page_store import PageStore  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+from seen_index import SeenIndex  # noqa: E402
+
+DONE = object()
+
+
+def load_file(name, path):
+    # shop_classifier/src/app.py would shadow the extractor's app module, load files under their own name
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_classifier(spec):
+    '''function of "module:function" or "path/to/file.py:function"'''
+    location, _, name = spec.rpartition(':')
+    if location.endswith('.py'):
+        module = load_file('domain_classifier_plugin', location)
+    else:
+        module = importlib.import_module(location)
+    return getattr(module, name)
+
+
+class CsvSink:
+    '''csv file written row by row from several threads'''
+
+    def __init__(self, path, header):
+        self._fout = open(path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._fout)
+        self._writer.writerow(header)
+        self._lock = threading.Lock()
+        self.rows = 0
+        self.first = None
+
+    def write(self, row):
+        with self._lock:
+            self._writer.writerow(row)
+            self._fout.flush()
+            self.rows += 1
+            if self.first is None:
+                self.first = time.time()
+
+    def close(self):
+        self._fout.close()
+
+
+def queued(queue, poll=0.05):
+    '''lazy Scheduler tasks from a queue, None while it is empty, ends at DONE'''
+    while True:
+        try:
+            item = queue.get(timeout=poll)
+        except Empty:
+            yield None
+            continue
+        if item is DONE:
+            return
+        yield item
+
+
+class Pipeline:
+
+    def __init__(self, args):
+        self.args = args
+        self.stats = Counter()
+        self.errors = []
+        self._lock = threading.Lock()
+        self.feed_q = Queue(maxsize=args.queue_size)
+        self.classify_q = Queue(maxsize=args.queue_size)
+        self.shop_q = Queue(maxsize=args.queue_size * 4)
+        self.classifier = load_classifier(args.classifier) if args.classifier else None
+        self.shop_labels = set(args.shop_labels.split(','))
+        self.shop = None
+        self.model = None
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def feed(self, seen):
+        '''stream the input lists in TASK_BATCH batches onto feed_q'''
+        stream = load_file('feed_stream', os.path.join(FEED_SRC, 'domain_stream.py'))
+        domains = stream.DomainStream(filtering=not self.args.no_filter)
+        try:
+            for chunk in domains.chunks(*self.args.input_file):
+                chunk, recent = seen.filter(chunk)
+                self.count('feed_seen', len(recent))
+                for i in range(0, len(chunk), task_batch):
+                    self.feed_q.put(chunk[i:i + task_batch])
+                    self.count('feed_domains', len(chunk[i:i + task_batch]))
+        except Exception as e:
+            self.errors.append(f'feed : {e}')
+        finally:
+            print(stream.stream_report(domains.stats, domains.elapsed()))
+            self.feed_q.put(DONE)
+
+    def classify(self, sink):
+        # a failing batch must not end the thread, run() blocks on classify_q until every item is taken
+        while True:
+            item = self.classify_q.get()
+            if item is DONE:
+                return
+            try:
+                self.label(sink, *item)
+            except Exception as e:
+                self.errors.append(f'classify : {e}')
+
+    def label(self, sink, urls, X):
+        try:
+            labels = self.classifier(urls, X) if self.classifier else [('unclassified', '')] * len(urls)
+        except Exception as e:
+            self.errors.append(f'classify : {e}')
+            labels = [('error', '')] * len(urls)
+        for url, (label, score) in zip(urls, labels):
+            sink.write([url, label, score])
+            self.count(f'label_{label}')
+            if self.shop is not None and (self.classifier is None or label in self.shop_labels):
+                self.shop_q.put(url)
+
+    def categorize(self, sink, pages):
+        while True:
+            url = self.shop_q.get()
+            if url is DONE:
+                return
+            try:
+                category, confidence = self.shop.classify_with_sbert(self.model, self.shop.load_text(pages, url))
+                sink.write([url, category, confidence])
+                self.count('shop_done')
+            except Exception as e:
+                self.errors.append(f'shop {url} : {e}')
+
+    def run(self):
+        args = self.args
+        start = time.time()
+        os.makedirs(args.output_dir, exist_ok=True)
+        source_path = args.source_path or os.path.join(args.output_dir, 'source_home')
+        features_file = os.path.join(args.output_dir, 'features.pkl')
+
+        # fork the crawler processes before any thread or torch model exists in this process
+        get_geo_service()
+        if lang_filter:
+            get_identifier()
+        procs = args.extract_procs or number_proc
+        pool = Pool(procs, initializer=init_crawler,
+                    initargs=(cache_mode, source_path, args.selected_languages.split(','), False))
+        scheduler = Scheduler(pool, crawl_batch, task_deadline or domain_deadline * task_batch + 60, procs)
+
+        if not args.no_shop:
+            self.shop = load_file('shop_app', os.path.join(SHOP_SRC, 'app.py'))
+            print("[INFO] Loading SBERT model…")
+            self.model = self.shop.SentenceTransformer("all-MiniLM-L6-v2")
+
+        writer = ResultWriter(features_file)
+        seen = SeenIndex(enabled=seen_index)
+        classify_sink = CsvSink(os.path.join(args.output_dir, 'classify.csv'), ['URL', 'Label', 'Score'])
+        shop_sink = CsvSink(os.path.join(args.output_dir, 'shop.csv'), ['URL', 'Category', 'Confidence'])
+        pages = PageStore(source_path)
+
+        threads = [threading.Thread(target=self.feed, args=(seen,), name='feed')]
+        classifiers = [threading.Thread(target=self.classify, args=(classify_sink,), name=f'classify-{i}')
+                       for i in range(args.classify_workers)]
+        shops = [threading.Thread(target=self.categorize, args=(shop_sink, pages), name=f'shop-{i}')
+                 for i in range(args.shop_workers if self.shop is not None else 0)]
+        for thread in threads + classifiers + shops:
+            thread.daemon = True
+            thread.start()
+
+        # extraction runs on this thread, its results go to the classifiers batch by batch
+        for batch, result, error in scheduler.run(queued(self.feed_q)):
+            if result is None:
+                for url in batch:
+                    writer.add_failed(url, error)
+                seen.record([(url, 'failed') for url in batch])
+                continue
+            collected, reasons = set(result[0]), dict(result[2])
+            for url, reason in result[2]:
+                writer.add_failed(url, reason)
+            for url, x, cluster in zip(result[0], result[1], result[6]):
+                writer.add(url, x, cluster)
+            seen.record([(url, seen_outcome(url, collected, reasons)) for url in batch])
+            self.count('extract_collected', len(result[0]))
+            self.count('extract_failed', len(result[2]))
+            if result[0]:
+                self.classify_q.put((result[0], result[1]))
+        scheduler.shutdown()
+        extract_done = time.time()
+
+        for _ in classifiers:
+            self.classify_q.put(DONE)
+        for thread in classifiers:
+            thread.join()
+        for _ in shops:
+            self.shop_q.put(DONE)
+        for thread in shops:
+            thread.join()
+        classify_sink.close()
+        shop_sink.close()
+        pages.close()
+        seen.close()
+
+        total = writer.merge(os.path.join(args.output_dir, 'features_failed.csv'), feature_format)
+        end = time.time()
+        first = shop_sink.first if self.shop is not None else classify_sink.first
+        print(pipeline_report(self.stats, start, first, extract_done, end, total))
+        for error in self.errors[:20]:
+            print(f"[WARN] {error}")
+
+
+def pipeline_report(stats, start, first, extract_done, end, features):
+    first = f"{first - start:.1f}s" if first else 'none'
+    labels = ' , '.join(f"{k[len('label_'):]} {v}" for k, v in sorted(stats.items()) if k.startswith('label_'))
+    return f"pipeline : fed {stats['feed_domains']} (seen {stats['feed_seen']}) , features {features} , " \
+           f"failed {stats['extract_failed']} , labels {labels or 'none'} , shops {stats['shop_done']}\n" \
+           f"  first result {first} , extraction done {extract_done - start:.1f}s , " \
+           f"wall clock {end - start:.1f}s , {stats['feed_domains'] / max(end - start, 1e-9):.2f} domains/s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='run feed, extraction and classification as one streaming pipeline')
+    parser.add_argument('--input_file', type=str, nargs='+', required=True, help='csv / txt / jsonl domain lists')
+    parser.add_argument('--output_dir', type=str, required=True, help='features.pkl, classify.csv and shop.csv go here')
+    parser.add_argument('--source_path', type=str, help='page store, <output_dir>/source_home by default')
+    parser.add_argument('--selected_languages', type=str, default='en')
+    parser.add_argument('--classifier', type=str, help='module:function or file.py:function, (urls, rows) -> [(label, score)]')
+    parser.add_argument('--shop_labels', type=str, default='scam', help='labels sent on to the shop stage, comma separated')
+    parser.add_argument('--no_shop', action='store_true', help='leave out the shop stage')
+    parser.add_argument('--no_filter', action='store_true', help='keep gambling / adult / crypto domains')
+    parser.add_argument('--extract_procs', type=int, help='crawler processes, NUMBER_PROC by default')
+    parser.add_argument('--classify_workers', type=int, default=1)
+    parser.add_argument('--shop_workers', type=int, default=2)
+    parser.add_argument('--queue_size', type=int, default=32, help='batches waiting between two stages before the earlier one blocks')
+    args = parser.parse_args()
+    Pipeline(args).run()
+
+
+if __name__ == '__main__':
+    main()
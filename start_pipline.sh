@@ -11,6 +11,7 @@ cache="yes"
 directory=""
 sel="yes"
 mongo="yes"
+queue="sqlite"
 
 handle_error() {
     echo "Error: $1"
@@ -57,6 +58,7 @@ usage() {
     echo "  --verbos <yes/no>   Verbose mode (default: no)"
     echo "  --directory <dir>   Output directory path"
     echo "  --steps <fe/dc/sc/ac/all>   Steps to run (default: all)"
+    echo "  --queue <sqlite/mongo/no>   Work queue shared by the feature extractor instances (default: sqlite)"
     exit 1
 }
 
@@ -72,6 +74,7 @@ while [[ "$#" -gt 0 ]]; do
         --steps) steps="$2"; shift ;;
         --sel) sel="$2"; shift ;;
         --mongo) mongo="$2"; shift ;;
+        --queue) queue="$2"; shift ;;
         --directory) directory="$2"; shift ;;
         *) usage ;;
     esac
@@ -129,7 +132,7 @@ build_shop_classifier(){
     params="--no-cache"
   fi
 
-  docker build $platform_option -t scamagnifier-shop-classifier:latest ./shop_classifier $params
+  docker build $platform_option -t scamagnifier-shop-classifier:latest --build-context extractor=./domain_feature_extractor/src ./shop_classifier $params
 
 }
 
@@ -188,6 +191,19 @@ stop_service(){
 start_domain_fetcher(){
   local _dir="$1"
 
+  if [ "$queue" != "no" ]; then
+    # one list for everyone, the extractor instances lease batches of it from the work queue
+    for i in $(seq 0 $((num_instances - 1)))
+    do
+        container_path[i]="$_dir"/"$i"
+    done
+    export SCAMAGNIFIER_DIR="$_dir"/0
+    export JOB_NUMBER=1
+    export JOB_INDEX=0
+    run_service scamagnifier-domain-fetcher
+    return
+  fi
+
   for i in $(seq 0 $((num_instances - 1)))
   do
       export SCAMAGNIFIER_DIR="$_dir"/"$i"
@@ -199,6 +215,15 @@ start_domain_fetcher(){
 
 }
 
+# WORK_QUEUE backend of the feature extractor instances
+work_queue_backend(){
+  if [ "$queue" == "mongo" ]; then
+    echo "mongodb://${SCAMAGNIFIER_MONGO_NORMAL_USERNAME}:${SCAMAGNIFIER_MONGO_NORMAL_PASSWORD}@${SCAMAGNIFIER_MONGO_HOST}:${SCAMAGNIFIER_MONGO_PORT}/${SCAMAGNIFIER_MONGO_DB}"
+  else
+    echo "/app/data/work_queue.sqlite"
+  fi
+}
+
 start_domain_feed_db(){
   run_service scamagnifier-domain-feeder
 }
@@ -222,6 +247,14 @@ start_feature_extractor(){
     params="-d"
   fi
 
+  # with a work queue every instance reads the same list and leases batches of it, otherwise each has its own slice
+  queue_params=""
+  input_dir=""
+  if [ "$queue" != "no" ]; then
+    queue_params="--queue ${container_path[0]}"
+    input_dir="${container_path[0]}"
+  fi
+
   for i in $(seq 0 $((num_instances - 1)))
   do
       let "cpu_start=i*4"
@@ -230,11 +263,19 @@ start_feature_extractor(){
         --network app-network-scamagnifier \
         -v "$VOLUME_DIR":/app/data \
         -e SELENIUM_ADDRESS="$SCAMAGNIFIER_SELENIUM_ADDRESS:$SCAMAGNIFIER_SELENIUM_PORT" \
+        -e BROWSER_MODE=remote \
+        -e WHOIS_CACHE_PATH=/app/data/whois_cache.sqlite \
+        -e DNS_CACHE_PATH=/app/data/dns_cache.sqlite \
+        -e FEATURE_CACHE_PATH=/app/data/feature_cache.sqlite \
+        -e TEMPLATE_INDEX_PATH=/app/data/template_index.sqlite \
+        -e SEEN_INDEX=yes \
+        -e SEEN_INDEX_PATH=/app/data/seen_index.sqlite \
         -e NUMBER_PROC="$num_proc" \
+        -e WORK_QUEUE="$(work_queue_backend)" \
         --name domain-feature-extractor-${i}-$RANDOM \
         --cpuset-cpus="${cpu_start}-${cpu_end}" \
         domain-feature-extractor \
-        python ./src/app.py --selected_languages en --input_file /app/data/${container_path[i]}/domains.txt --source_path /app/data/${container_path[i]}/source_home --output_file /app/data/${container_path[i]}/features.pkl
+        python ./src/app.py --selected_languages en --input_file /app/data/${input_dir:-${container_path[i]}}/domains.txt --source_path /app/data/${container_path[i]}/source_home --output_file /app/data/${container_path[i]}/features.pkl $queue_params
       container_ids+=("$(docker ps -q -l)") 
       echo "feature_extractor: " ${container_path[i]}
   done